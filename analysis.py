@@ -3,10 +3,20 @@ from output_schemas import RedeContingencialOutput
 from typing import List, Optional, Dict, Any, Type, Union, cast, Callable
 from dotenv import load_dotenv
 from google.genai import Client # NÃO MODIFICAR / DO NOT MODIFY
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 import logging
 import json
 import os
+import asyncio
 import datetime
+import uuid
+import sqlite3
+import threading
+import time
+import config
+import metricas
+import tracing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
@@ -48,46 +58,69 @@ from output_schemas import (
     ArestaEvidenciaParaHipotese
 )
 
-from utils import _get_id, _merge_element_list
-from llm_inference import _make_api_call
+from grafo import GrafoRede
+from fragmentos import dividir_texto, ReconciliadorFragmentos
+from llm_inference import _make_api_call, _make_api_call_async
+from scheduler import declarar_campos, executar_etapas, executar_etapas_async, registrar_resposta_bruta, registrar_resumo_etapa, receptor_de_elementos, etapa_em_execucao
+from utils import diferenca_vis
+from db import init_db, create_run, get_run, get_run_stages, save_run_stage, save_run_progress, save_run_metrics, update_run_status, prune_completed_runs, RUN_COMPLETE, RUN_INCOMPLETE
+from context_encoder import codificar_contexto, estimar_tokens, FORMATO_TABULAR, INSTRUCAO_TABULAR
 
-def _processar_etapa(
+_TiposOutputEtapa = Type[Union[
+    OutputEtapaSujeitos,
+    OutputEtapaAcoes,
+    OutputEtapaEventosTemporais,
+    OutputEtapaFuncionaisAntecedentes,
+    OutputEtapaFuncionaisConsequentes,
+    OutputEtapaCondicoesEstado,
+    OutputEtapaRelacoesModuladoras,
+    OutputEtapaHipoteses,
+    OutputEtapaTimeline
+]]
+
+def _montar_prompt_etapa(
     texto_narrativo: str,
-    rede_atual: RedeContingencialOutput,
-    client_model: Client, # Type hint kept as genai.Client for now
+    rede_atual: GrafoRede,
     foco_etapa: str,
-    output_schema: Type[Union[
-        OutputEtapaSujeitos,
-        OutputEtapaAcoes,
-        OutputEtapaEventosTemporais,
-        OutputEtapaFuncionaisAntecedentes,
-        OutputEtapaFuncionaisConsequentes,
-        OutputEtapaCondicoesEstado,
-        OutputEtapaRelacoesModuladoras,
-        OutputEtapaHipoteses,
-        OutputEtapaTimeline
-    ]],
     context_builder_func: callable,
-    update_rede_func: callable, # Will now return a string
-    etapa_name: str
-) -> RedeContingencialOutput:
-    logger.info(f"Iniciando Etapa: {etapa_name}")
-
-    contexto_json = context_builder_func(rede_atual)
+    etapa_name: str,
+    orcamento_tokens: Optional[int],
+    campos_omitidos: tuple
+) -> str:
+    # `campos_omitidos` (e.g. 'raciocinio') só saem dos campos que a etapa apenas lê: os que ela escreve ou
+    # atualiza voltam inteiros na resposta e substituem o elemento, então o modelo precisa vê-los completos
+    etapa_func = etapa_em_execucao()
+    somente_leitura = (
+        etapa_func.campos_lidos - etapa_func.campos_escritos - etapa_func.campos_atualizados
+        if etapa_func is not None else ()
+    )
+    with rede_atual.omitindo(campos_omitidos, somente_leitura):
+        contexto_json = context_builder_func(rede_atual)
+    contexto_codificado = codificar_contexto(contexto_json, orcamento_tokens=orcamento_tokens)
+    instrucao_formato = f"{INSTRUCAO_TABULAR}\n" if config.CONTEXT_FORMAT == FORMATO_TABULAR else ""
+    logger.debug(f"Contexto da etapa {etapa_name}: ~{estimar_tokens(contexto_codificado)} tokens")
 
     # Corrected prompt to use
-    prompt = (
+    return (
         f"{SYSTEM_PROMPT}\n\n{PROCEDIMENTO_COMPLETO_AFC}\n\n{foco_etapa}\n\n"
         f"Texto narrativo para análise:\n```\n{texto_narrativo}\n```\n\n"
         "Contexto da rede atual (elementos relevantes para esta etapa):\n"
-        f"```json\n{json.dumps(contexto_json, indent=2)}\n```"
+        f"{instrucao_formato}"
+        f"```json\n{contexto_codificado}\n```"
     )
-    
-    json_data = _make_api_call(client_model, prompt, output_schema) # type: ignore
+
+def _aplicar_resposta_etapa(
+    rede_atual: GrafoRede,
+    json_data: Optional[Dict[str, Any]],
+    update_rede_func: callable,
+    etapa_name: str
+) -> GrafoRede:
+    registrar_resposta_bruta(json_data) # Gravada no checkpoint da etapa pelo agendador
 
     if json_data:
         try:
             log_details = update_rede_func(rede_atual, json_data) # update_rede_func returns string
+            registrar_resumo_etapa(log_details) # Exibido no progresso da análise (ver /analise/eventos em app.py)
             logger.info(f"Etapa {etapa_name} concluída. {log_details}") # Use returned string
         except Exception as e:
             logger.error(f"Erro ao processar dados da Etapa {etapa_name}: {e}", exc_info=True)
@@ -95,24 +128,69 @@ def _processar_etapa(
                  logger.error(f"Detalhes do erro da API: {json_data['error_details']}")
     return rede_atual
 
+@tracing.rastrear(argumentos=('etapa_name',))
+def _processar_etapa(
+    texto_narrativo: str,
+    rede_atual: GrafoRede,
+    client_model: Client, # Type hint kept as genai.Client for now
+    foco_etapa: str,
+    output_schema: _TiposOutputEtapa,
+    context_builder_func: callable,
+    update_rede_func: callable, # Will now return a string
+    etapa_name: str,
+    orcamento_tokens: Optional[int] = config.CONTEXT_TOKEN_BUDGET,
+    campos_omitidos: tuple = config.CONTEXT_CAMPOS_OMITIDOS
+) -> GrafoRede:
+    logger.info(f"Iniciando Etapa: {etapa_name}")
+    prompt = _montar_prompt_etapa(
+        texto_narrativo, rede_atual, foco_etapa, context_builder_func, etapa_name, orcamento_tokens, campos_omitidos
+    )
+    json_data = _make_api_call(client_model, prompt, output_schema, ao_elemento=receptor_de_elementos()) # type: ignore
+    return _aplicar_resposta_etapa(rede_atual, json_data, update_rede_func, etapa_name)
+
+@tracing.rastrear(argumentos=('etapa_name',))
+async def _processar_etapa_async(
+    texto_narrativo: str,
+    rede_atual: GrafoRede,
+    client_model: Client,
+    foco_etapa: str,
+    output_schema: _TiposOutputEtapa,
+    context_builder_func: callable,
+    update_rede_func: callable,
+    etapa_name: str,
+    orcamento_tokens: Optional[int] = config.CONTEXT_TOKEN_BUDGET,
+    campos_omitidos: tuple = config.CONTEXT_CAMPOS_OMITIDOS
+) -> GrafoRede:
+    """Mesma etapa de _processar_etapa, com a chamada ao modelo feita pelo cliente assíncrono."""
+    logger.info(f"Iniciando Etapa: {etapa_name}")
+    prompt = _montar_prompt_etapa(
+        texto_narrativo, rede_atual, foco_etapa, context_builder_func, etapa_name, orcamento_tokens, campos_omitidos
+    )
+    json_data = await _make_api_call_async(client_model, prompt, output_schema, ao_elemento=receptor_de_elementos()) # type: ignore
+    return _aplicar_resposta_etapa(rede_atual, json_data, update_rede_func, etapa_name)
+
 # --- Funções de Extração por Etapa ---
 
+@declarar_campos(
+    le=('sujeitos',), escreve=('sujeitos',)
+)
 def extrair_sujeitos(
     texto_narrativo: str,
-    rede_atual: RedeContingencialOutput,
+    rede_atual: GrafoRede,
     client_model: Client,
-) -> RedeContingencialOutput:
-    def context_builder_func(rede: RedeContingencialOutput) -> dict:
-        return {'sujeitos': [s.model_dump(exclude_none=True) for s in rede.sujeitos]}
+    processar_etapa: Callable = _processar_etapa, # _processar_etapa_async para o pipeline asyncio
+) -> GrafoRede:
+    def context_builder_func(rede: GrafoRede) -> dict:
+        return {'sujeitos': rede.dumps('sujeitos')}
 
-    def update_rede_func(rede: RedeContingencialOutput, json_data: dict) -> str: # Returns string for log
+    def update_rede_func(rede: GrafoRede, json_data: dict) -> str: # Returns string for log
         novos_sujeitos_data = json_data.get("sujeitos")
         if novos_sujeitos_data is None:
             novos_sujeitos_data = []
-        rede.sujeitos = _merge_element_list(rede.sujeitos, novos_sujeitos_data, NoSujeito)
-        return f"Sujeitos atuais: {len(rede.sujeitos)}"
+        rede.mesclar('sujeitos', novos_sujeitos_data)
+        return f"Sujeitos atuais: {rede.total('sujeitos')}"
 
-    return _processar_etapa(
+    return processar_etapa(
         texto_narrativo=texto_narrativo,
         rede_atual=rede_atual,
         client_model=client_model,
@@ -123,19 +201,24 @@ def extrair_sujeitos(
         etapa_name="Extração de Sujeitos"
     )
 
+@declarar_campos(
+    le=('sujeitos', 'acoes_comportamentos', 'emissoes_comportamentais'),
+    escreve=('acoes_comportamentos', 'emissoes_comportamentais')
+)
 def extrair_acoes_comportamentos(
     texto_narrativo: str,
-    rede_atual: RedeContingencialOutput,
+    rede_atual: GrafoRede,
     client_model: Client, # Type hint kept as genai.Client for now
-) -> RedeContingencialOutput:
-    def context_builder_func(rede: RedeContingencialOutput) -> dict:
+    processar_etapa: Callable = _processar_etapa,
+) -> GrafoRede:
+    def context_builder_func(rede: GrafoRede) -> dict:
         return {
-            "sujeitos": [s.model_dump(exclude_none=True) for s in rede.sujeitos],
-            "acoes_comportamentos_existentes": [ac.model_dump(exclude_none=True) for ac in rede.acoes_comportamentos],
-            "emissoes_comportamentais_existentes": [em.model_dump(exclude_none=True) for em in rede.emissoes_comportamentais]
+            "sujeitos": rede.dumps('sujeitos'),
+            "acoes_comportamentos_existentes": rede.dumps('acoes_comportamentos'),
+            "emissoes_comportamentais_existentes": rede.dumps('emissoes_comportamentais')
         }
 
-    def update_rede_func(rede: RedeContingencialOutput, json_data: dict) -> str: # Returns string for log
+    def update_rede_func(rede: GrafoRede, json_data: dict) -> str: # Returns string for log
         novas_acoes_data = json_data.get("acoes_comportamentos")
         novas_emissoes_data = json_data.get("emissoes_comportamentais")
 
@@ -144,12 +227,12 @@ def extrair_acoes_comportamentos(
         if novas_emissoes_data is None:
             novas_emissoes_data = []
             
-        rede.acoes_comportamentos = _merge_element_list(rede.acoes_comportamentos, novas_acoes_data, NoAcaoComportamento)
-        rede.emissoes_comportamentais = _merge_element_list(rede.emissoes_comportamentais, novas_emissoes_data, ArestaEmissaoComportamental)
+        rede.mesclar('acoes_comportamentos', novas_acoes_data)
+        rede.mesclar('emissoes_comportamentais', novas_emissoes_data)
 
-        return f"Ações: {len(rede.acoes_comportamentos)}, Emissões: {len(rede.emissoes_comportamentais)}"
+        return f"Ações: {rede.total('acoes_comportamentos')}, Emissões: {rede.total('emissoes_comportamentais')}"
 
-    return _processar_etapa(
+    return processar_etapa(
         texto_narrativo=texto_narrativo,
         rede_atual=rede_atual,
         client_model=client_model,
@@ -160,19 +243,24 @@ def extrair_acoes_comportamentos(
         etapa_name="Extração de Ações e Emissões Comportamentais"
     )
 
+@declarar_campos(
+    le=('acoes_comportamentos', 'estimulos_eventos', 'relacoes_temporais'),
+    escreve=('estimulos_eventos', 'relacoes_temporais')
+)
 def extrair_eventos_ambientais_e_relacoes_temporais(
     texto_narrativo: str,
-    rede_atual: RedeContingencialOutput,
+    rede_atual: GrafoRede,
     client_model: Client,
-) -> RedeContingencialOutput:
-    def context_builder_func(rede: RedeContingencialOutput) -> dict:
+    processar_etapa: Callable = _processar_etapa,
+) -> GrafoRede:
+    def context_builder_func(rede: GrafoRede) -> dict:
         return {
-            "acoes_comportamentos": [ac.model_dump(exclude_none=True) for ac in rede.acoes_comportamentos],
-            "estimulos_eventos_existentes": [e.model_dump(exclude_none=True) for e in rede.estimulos_eventos],
-            "relacoes_temporais_existentes": [rt.model_dump(exclude_none=True) for rt in rede.relacoes_temporais]
+            "acoes_comportamentos": rede.dumps('acoes_comportamentos'),
+            "estimulos_eventos_existentes": rede.dumps('estimulos_eventos'),
+            "relacoes_temporais_existentes": rede.dumps('relacoes_temporais')
         }
 
-    def update_rede_func(rede: RedeContingencialOutput, json_data: dict) -> str: # Returns string for log
+    def update_rede_func(rede: GrafoRede, json_data: dict) -> str: # Returns string for log
         novos_estimulos_data = json_data.get("estimulos_eventos")
         novas_rel_temporais_data = json_data.get("relacoes_temporais")
 
@@ -181,12 +269,12 @@ def extrair_eventos_ambientais_e_relacoes_temporais(
         if novas_rel_temporais_data is None:
             novas_rel_temporais_data = []
 
-        rede.estimulos_eventos = _merge_element_list(rede.estimulos_eventos, novos_estimulos_data, NoEstimuloEvento)
-        rede.relacoes_temporais = _merge_element_list(rede.relacoes_temporais, novas_rel_temporais_data, ArestaRelacaoTemporal)
+        rede.mesclar('estimulos_eventos', novos_estimulos_data)
+        rede.mesclar('relacoes_temporais', novas_rel_temporais_data)
 
-        return f"Estímulos: {len(rede.estimulos_eventos)}, Relações Temporais: {len(rede.relacoes_temporais)}"
+        return f"Estímulos: {rede.total('estimulos_eventos')}, Relações Temporais: {rede.total('relacoes_temporais')}"
 
-    return _processar_etapa(
+    return processar_etapa(
         texto_narrativo=texto_narrativo,
         rede_atual=rede_atual,
         client_model=client_model,
@@ -197,44 +285,44 @@ def extrair_eventos_ambientais_e_relacoes_temporais(
         etapa_name="Extração de Eventos Ambientais e Relações Temporais" # Original log started with "Iniciando:", name matches previous "Etapa concluída."
     )
 
+@declarar_campos(
+    le=('relacoes_temporais', 'estimulos_eventos', 'acoes_comportamentos', 'relacoes_funcionais_antecedentes'),
+    escreve=('relacoes_funcionais_antecedentes',),
+    atualiza=('estimulos_eventos', 'acoes_comportamentos')
+)
 def inferir_relacoes_funcionais_antecedentes(
     texto_narrativo: str,
-    rede_atual: RedeContingencialOutput,
+    rede_atual: GrafoRede,
     client_model: Client,
-) -> RedeContingencialOutput:
-    def context_builder_func(rede: RedeContingencialOutput) -> dict:
-        antecedentes_ids = set()
-        acoes_pos_antecedente_ids = set()
-        for rt in rede.relacoes_temporais:
-            if rt.tipo_temporalidade.value == "PRECEDE_IMEDIATAMENTE": # type: ignore
-                antecedentes_ids.add(rt.id_origem_no)
-                acoes_pos_antecedente_ids.add(rt.id_destino_no)
-
+    processar_etapa: Callable = _processar_etapa,
+) -> GrafoRede:
+    def context_builder_func(rede: GrafoRede) -> dict:
+        relacoes = rede.relacoes_temporais("PRECEDE_IMEDIATAMENTE")
         return {
-            "estimulos_eventos_relevantes": [e.model_dump(exclude_none=True) for e in rede.estimulos_eventos if _get_id(e) in antecedentes_ids],
-            "acoes_comportamentos_relevantes": [ac.model_dump(exclude_none=True) for ac in rede.acoes_comportamentos if _get_id(ac) in acoes_pos_antecedente_ids],
-            "relacoes_temporais_relevantes": [rt.model_dump(exclude_none=True) for rt in rede.relacoes_temporais if rt.tipo_temporalidade.value == "PRECEDE_IMEDIATAMENTE"], # type: ignore
-            "relacoes_funcionais_antecedentes_existentes": [rfa.model_dump(exclude_none=True) for rfa in rede.relacoes_funcionais_antecedentes]
+            "estimulos_eventos_relevantes": rede.dumps('estimulos_eventos', rede.selecionar('estimulos_eventos', (rt.id_origem_no for rt in relacoes))),
+            "acoes_comportamentos_relevantes": rede.dumps('acoes_comportamentos', rede.selecionar('acoes_comportamentos', (rt.id_destino_no for rt in relacoes))),
+            "relacoes_temporais_relevantes": rede.dumps('relacoes_temporais', relacoes),
+            "relacoes_funcionais_antecedentes_existentes": rede.dumps('relacoes_funcionais_antecedentes')
         }
 
-    def update_rede_func(rede: RedeContingencialOutput, json_data: dict) -> str: # Returns string for log
+    def update_rede_func(rede: GrafoRede, json_data: dict) -> str: # Returns string for log
         novas_rfa_data = json_data.get("relacoes_funcionais_antecedentes")
         if novas_rfa_data is None:
             novas_rfa_data = []
-        rede.relacoes_funcionais_antecedentes = _merge_element_list(rede.relacoes_funcionais_antecedentes, novas_rfa_data, ArestaRelacaoFuncionalAntecedente)
+        rede.mesclar('relacoes_funcionais_antecedentes', novas_rfa_data)
 
         # Opcional: atualizar nós se a API os retornou com modificações
         estimulos_atualizados_data = json_data.get("estimulos_eventos_atualizados")
         if estimulos_atualizados_data:
-            rede.estimulos_eventos = _merge_element_list(rede.estimulos_eventos, estimulos_atualizados_data, NoEstimuloEvento)
+            rede.mesclar('estimulos_eventos', estimulos_atualizados_data)
 
         acoes_atualizadas_data = json_data.get("acoes_comportamentos_atualizados")
         if acoes_atualizadas_data:
-            rede.acoes_comportamentos = _merge_element_list(rede.acoes_comportamentos, acoes_atualizadas_data, NoAcaoComportamento)
+            rede.mesclar('acoes_comportamentos', acoes_atualizadas_data)
             
-        return f"Relações Funcionais Antecedentes: {len(rede.relacoes_funcionais_antecedentes)}"
+        return f"Relações Funcionais Antecedentes: {rede.total('relacoes_funcionais_antecedentes')}"
 
-    return _processar_etapa(
+    return processar_etapa(
         texto_narrativo=texto_narrativo,
         rede_atual=rede_atual,
         client_model=client_model,
@@ -245,43 +333,43 @@ def inferir_relacoes_funcionais_antecedentes(
         etapa_name="Inferência de Relações Funcionais Antecedentes"
     )
 
+@declarar_campos(
+    le=('relacoes_temporais', 'estimulos_eventos', 'acoes_comportamentos', 'relacoes_funcionais_consequentes'),
+    escreve=('relacoes_funcionais_consequentes',),
+    atualiza=('estimulos_eventos', 'acoes_comportamentos')
+)
 def inferir_relacoes_funcionais_consequentes(
     texto_narrativo: str,
-    rede_atual: RedeContingencialOutput,
+    rede_atual: GrafoRede,
     client_model: Client,
-) -> RedeContingencialOutput:
-    def context_builder_func(rede: RedeContingencialOutput) -> dict:
-        consequentes_ids = set()
-        acoes_pre_consequente_ids = set()
-        for rt in rede.relacoes_temporais:
-            if rt.tipo_temporalidade.value == "SUCEDE_IMEDIATAMENTE": # type: ignore
-                acoes_pre_consequente_ids.add(rt.id_origem_no)
-                consequentes_ids.add(rt.id_destino_no)
-
+    processar_etapa: Callable = _processar_etapa,
+) -> GrafoRede:
+    def context_builder_func(rede: GrafoRede) -> dict:
+        relacoes = rede.relacoes_temporais("SUCEDE_IMEDIATAMENTE")
         return {
-            "acoes_comportamentos_relevantes": [ac.model_dump(exclude_none=True) for ac in rede.acoes_comportamentos if _get_id(ac) in acoes_pre_consequente_ids],
-            "estimulos_eventos_relevantes": [e.model_dump(exclude_none=True) for e in rede.estimulos_eventos if _get_id(e) in consequentes_ids],
-            "relacoes_temporais_relevantes": [rt.model_dump(exclude_none=True) for rt in rede.relacoes_temporais if rt.tipo_temporalidade.value == "SUCEDE_IMEDIATAMENTE"], # type: ignore
-            "relacoes_funcionais_consequentes_existentes": [rfc.model_dump(exclude_none=True) for rfc in rede.relacoes_funcionais_consequentes]
+            "acoes_comportamentos_relevantes": rede.dumps('acoes_comportamentos', rede.selecionar('acoes_comportamentos', (rt.id_origem_no for rt in relacoes))),
+            "estimulos_eventos_relevantes": rede.dumps('estimulos_eventos', rede.selecionar('estimulos_eventos', (rt.id_destino_no for rt in relacoes))),
+            "relacoes_temporais_relevantes": rede.dumps('relacoes_temporais', relacoes),
+            "relacoes_funcionais_consequentes_existentes": rede.dumps('relacoes_funcionais_consequentes')
         }
 
-    def update_rede_func(rede: RedeContingencialOutput, json_data: dict) -> str: # Returns string for log
+    def update_rede_func(rede: GrafoRede, json_data: dict) -> str: # Returns string for log
         novas_rfc_data = json_data.get("relacoes_funcionais_consequentes")
         if novas_rfc_data is None:
             novas_rfc_data = []
-        rede.relacoes_funcionais_consequentes = _merge_element_list(rede.relacoes_funcionais_consequentes, novas_rfc_data, ArestaRelacaoFuncionalConsequente)
+        rede.mesclar('relacoes_funcionais_consequentes', novas_rfc_data)
 
         estimulos_atualizados_data = json_data.get("estimulos_eventos_atualizados")
         if estimulos_atualizados_data:
-            rede.estimulos_eventos = _merge_element_list(rede.estimulos_eventos, estimulos_atualizados_data, NoEstimuloEvento)
+            rede.mesclar('estimulos_eventos', estimulos_atualizados_data)
 
         acoes_atualizadas_data = json_data.get("acoes_comportamentos_atualizados")
         if acoes_atualizadas_data:
-            rede.acoes_comportamentos = _merge_element_list(rede.acoes_comportamentos, acoes_atualizadas_data, NoAcaoComportamento)
+            rede.mesclar('acoes_comportamentos', acoes_atualizadas_data)
             
-        return f"Relações Funcionais Consequentes: {len(rede.relacoes_funcionais_consequentes)}"
+        return f"Relações Funcionais Consequentes: {rede.total('relacoes_funcionais_consequentes')}"
 
-    return _processar_etapa(
+    return processar_etapa(
         texto_narrativo=texto_narrativo,
         rede_atual=rede_atual,
         client_model=client_model,
@@ -292,31 +380,37 @@ def inferir_relacoes_funcionais_consequentes(
         etapa_name="Inferência de Relações Funcionais Consequentes"
     )
 
+@declarar_campos(
+    le=('sujeitos', 'acoes_comportamentos', 'estimulos_eventos', 'relacoes_funcionais_antecedentes',
+        'relacoes_funcionais_consequentes', 'condicoes_estados'),
+    escreve=('condicoes_estados',)
+)
 def identificar_condicoes_estado(
     texto_narrativo: str,
-    rede_atual: RedeContingencialOutput,
+    rede_atual: GrafoRede,
     client_model: Client,
-) -> RedeContingencialOutput:
-    def context_builder_func(rede: RedeContingencialOutput) -> dict:
+    processar_etapa: Callable = _processar_etapa,
+) -> GrafoRede:
+    def context_builder_func(rede: GrafoRede) -> dict:
         return {
             "rede_parcial_existente_para_contexto": {
-                "sujeitos": [s.model_dump(exclude_none=True) for s in rede.sujeitos],
-                "acoes_comportamentos": [ac.model_dump(exclude_none=True) for ac in rede.acoes_comportamentos],
-                "estimulos_eventos": [e.model_dump(exclude_none=True) for e in rede.estimulos_eventos],
-                "relacoes_funcionais_antecedentes": [rfa.model_dump(exclude_none=True) for rfa in rede.relacoes_funcionais_antecedentes],
-                "relacoes_funcionais_consequentes": [rfc.model_dump(exclude_none=True) for rfc in rede.relacoes_funcionais_consequentes],
+                "sujeitos": rede.dumps('sujeitos'),
+                "acoes_comportamentos": rede.dumps('acoes_comportamentos'),
+                "estimulos_eventos": rede.dumps('estimulos_eventos'),
+                "relacoes_funcionais_antecedentes": rede.dumps('relacoes_funcionais_antecedentes'),
+                "relacoes_funcionais_consequentes": rede.dumps('relacoes_funcionais_consequentes'),
             },
-            "condicoes_estados_existentes": [ce.model_dump(exclude_none=True) for ce in rede.condicoes_estados]
+            "condicoes_estados_existentes": rede.dumps('condicoes_estados')
         }
 
-    def update_rede_func(rede: RedeContingencialOutput, json_data: dict) -> str: # Returns string for log
+    def update_rede_func(rede: GrafoRede, json_data: dict) -> str: # Returns string for log
         novas_ce_data = json_data.get("condicoes_estados")
         if novas_ce_data is None:
             novas_ce_data = []
-        rede.condicoes_estados = _merge_element_list(rede.condicoes_estados, novas_ce_data, NoCondicaoEstado)
-        return f"Condições/Estado: {len(rede.condicoes_estados)}"
+        rede.mesclar('condicoes_estados', novas_ce_data)
+        return f"Condições/Estado: {rede.total('condicoes_estados')}"
 
-    return _processar_etapa(
+    return processar_etapa(
         texto_narrativo=texto_narrativo,
         rede_atual=rede_atual,
         client_model=client_model,
@@ -327,42 +421,49 @@ def identificar_condicoes_estado(
         etapa_name="Identificação de Condições/Estado"
     )
 
+@declarar_campos(
+    le=('condicoes_estados', 'estimulos_eventos', 'acoes_comportamentos', 'relacoes_funcionais_consequentes',
+        'relacoes_moduladoras_estado'),
+    escreve=('relacoes_moduladoras_estado',),
+    atualiza=('condicoes_estados', 'estimulos_eventos', 'acoes_comportamentos')
+)
 def estabelecer_relacoes_moduladoras_estado(
     texto_narrativo: str,
-    rede_atual: RedeContingencialOutput,
+    rede_atual: GrafoRede,
     client_model: Client,
-) -> RedeContingencialOutput:
-    def context_builder_func(rede: RedeContingencialOutput) -> dict:
+    processar_etapa: Callable = _processar_etapa,
+) -> GrafoRede:
+    def context_builder_func(rede: GrafoRede) -> dict:
         return {
-            "condicoes_estados": [ce.model_dump(exclude_none=True) for ce in rede.condicoes_estados],
-            "estimulos_eventos": [e.model_dump(exclude_none=True) for e in rede.estimulos_eventos], # Especialmente consequentes
-            "acoes_comportamentos": [ac.model_dump(exclude_none=True) for ac in rede.acoes_comportamentos],
-            "relacoes_funcionais_consequentes": [rfc.model_dump(exclude_none=True) for rfc in rede.relacoes_funcionais_consequentes], # Para saber o que é reforçador/punitivo
-            "relacoes_moduladoras_estado_existentes": [rme.model_dump(exclude_none=True) for rme in rede.relacoes_moduladoras_estado]
+            "condicoes_estados": rede.dumps('condicoes_estados'),
+            "estimulos_eventos": rede.dumps('estimulos_eventos'), # Especialmente consequentes
+            "acoes_comportamentos": rede.dumps('acoes_comportamentos'),
+            "relacoes_funcionais_consequentes": rede.dumps('relacoes_funcionais_consequentes'), # Para saber o que é reforçador/punitivo
+            "relacoes_moduladoras_estado_existentes": rede.dumps('relacoes_moduladoras_estado')
         }
 
-    def update_rede_func(rede: RedeContingencialOutput, json_data: dict) -> str: # Returns string for log
+    def update_rede_func(rede: GrafoRede, json_data: dict) -> str: # Returns string for log
         novas_rme_data = json_data.get("relacoes_moduladoras_estado")
         if novas_rme_data is None:
             novas_rme_data = []
-        rede.relacoes_moduladoras_estado = _merge_element_list(rede.relacoes_moduladoras_estado, novas_rme_data, ArestaRelacaoModuladoraEstado)
+        rede.mesclar('relacoes_moduladoras_estado', novas_rme_data)
 
         # Opcional: atualizar nós se a API os retornou com modificações
         condicoes_atualizadas_data = json_data.get("condicoes_estados_atualizadas")
         if condicoes_atualizadas_data:
-             rede.condicoes_estados = _merge_element_list(rede.condicoes_estados, condicoes_atualizadas_data, NoCondicaoEstado)
+             rede.mesclar('condicoes_estados', condicoes_atualizadas_data)
 
         estimulos_atualizados_data = json_data.get("estimulos_eventos_atualizados")
         if estimulos_atualizados_data:
-            rede.estimulos_eventos = _merge_element_list(rede.estimulos_eventos, estimulos_atualizados_data, NoEstimuloEvento)
+            rede.mesclar('estimulos_eventos', estimulos_atualizados_data)
 
         acoes_atualizadas_data = json_data.get("acoes_comportamentos_atualizados")
         if acoes_atualizadas_data:
-            rede.acoes_comportamentos = _merge_element_list(rede.acoes_comportamentos, acoes_atualizadas_data, NoAcaoComportamento)
+            rede.mesclar('acoes_comportamentos', acoes_atualizadas_data)
             
-        return f"Relações Moduladoras: {len(rede.relacoes_moduladoras_estado)}"
+        return f"Relações Moduladoras: {rede.total('relacoes_moduladoras_estado')}"
 
-    return _processar_etapa(
+    return processar_etapa(
         texto_narrativo=texto_narrativo,
         rede_atual=rede_atual,
         client_model=client_model,
@@ -373,23 +474,30 @@ def estabelecer_relacoes_moduladoras_estado(
         etapa_name="Estabelecimento de Relações Moduladoras de Estado"
     )
 
+@declarar_campos(
+    le=tuple(RedeContingencialOutput.model_fields), # Usa a rede toda
+    escreve=('hipoteses_analiticas', 'evidencias_para_hipoteses')
+)
 def formular_hipoteses_analiticas_e_evidencias(
     texto_narrativo: str,
-    rede_atual: RedeContingencialOutput,
+    rede_atual: GrafoRede,
     client_model: Client,
-) -> RedeContingencialOutput:
-    def context_builder_func(rede: RedeContingencialOutput) -> dict:
-        # Ensure datetime is available in this scope if not already imported globally
-        # It is imported globally in the file.
-        data_formulacao_atual = datetime.datetime.now().isoformat()
+    processar_etapa: Callable = _processar_etapa,
+) -> GrafoRede:
+    def context_builder_func(rede: GrafoRede) -> dict:
+        # Só a data (sem a hora): o prompt entra na chave do cache de respostas (llm_cache.make_key), que muda só uma vez por dia
+        data_formulacao_atual = datetime.date.today().isoformat()
         return {
-            "rede_completa_existente": rede.model_dump(exclude_none=True), # Passa a rede toda
+            # Passa a rede toda; hipóteses e evidências já vão abaixo, então não são repetidas aqui
+            "rede_completa_existente": rede.para_dict(
+                excluir={'hipoteses_analiticas', 'evidencias_para_hipoteses', 'timeline'}
+            ),
             "data_para_formulacao_hipotese": data_formulacao_atual,
-            "hipoteses_existentes": [h.model_dump(exclude_none=True) for h in rede.hipoteses_analiticas],
-            "evidencias_existentes": [ev.model_dump(exclude_none=True) for ev in rede.evidencias_para_hipoteses]
+            "hipoteses_existentes": rede.dumps('hipoteses_analiticas'),
+            "evidencias_existentes": rede.dumps('evidencias_para_hipoteses')
         }
 
-    def update_rede_func(rede: RedeContingencialOutput, json_data: dict) -> str: # Returns string for log
+    def update_rede_func(rede: GrafoRede, json_data: dict) -> str: # Returns string for log
         novas_hipoteses_data = json_data.get("hipoteses_analiticas")
         novas_evidencias_data = json_data.get("evidencias_para_hipoteses")
 
@@ -398,12 +506,12 @@ def formular_hipoteses_analiticas_e_evidencias(
         if novas_evidencias_data is None:
             novas_evidencias_data = []
 
-        rede.hipoteses_analiticas = _merge_element_list(rede.hipoteses_analiticas, novas_hipoteses_data, NoHipoteseAnalitica)
-        rede.evidencias_para_hipoteses = _merge_element_list(rede.evidencias_para_hipoteses, novas_evidencias_data, ArestaEvidenciaParaHipotese)
+        rede.mesclar('hipoteses_analiticas', novas_hipoteses_data)
+        rede.mesclar('evidencias_para_hipoteses', novas_evidencias_data)
 
-        return f"Hipóteses: {len(rede.hipoteses_analiticas)}, Evidências: {len(rede.evidencias_para_hipoteses)}"
+        return f"Hipóteses: {rede.total('hipoteses_analiticas')}, Evidências: {rede.total('evidencias_para_hipoteses')}"
 
-    return _processar_etapa(
+    return processar_etapa(
         texto_narrativo=texto_narrativo,
         rede_atual=rede_atual,
         client_model=client_model,
@@ -411,25 +519,24 @@ def formular_hipoteses_analiticas_e_evidencias(
         output_schema=OutputEtapaHipoteses,
         context_builder_func=context_builder_func,
         update_rede_func=update_rede_func,
-        etapa_name="Formulação de Hipóteses Analíticas e Evidências"
+        etapa_name="Formulação de Hipóteses Analíticas e Evidências",
+        orcamento_tokens=config.CONTEXT_TOKEN_BUDGET_HIPOTESES
     )
 
+@declarar_campos(
+    le=('sujeitos', 'acoes_comportamentos', 'estimulos_eventos', 'hipoteses_analiticas', 'timeline'),
+    escreve=('timeline',)
+)
 def ordenar_timeline(
     texto_narrativo: str,
-    rede_atual: RedeContingencialOutput,
+    rede_atual: GrafoRede,
     client_model: Client,
-) -> RedeContingencialOutput:
-    def context_builder_func(rede: RedeContingencialOutput) -> dict:
-        # Helper to extract id and descricao, ensuring items are dicts with these keys
+    processar_etapa: Callable = _processar_etapa,
+) -> GrafoRede:
+    def context_builder_func(rede: GrafoRede) -> dict:
+        # Pares (id, descricao) de cada elemento do campo
         def name_id_extractor(key_name: str) -> list:
-            items_list = []
-            raw_items = rede.model_dump().get(key_name, [])
-            for item_model in raw_items:
-                # item_model is already a dict here due to model_dump()
-                if isinstance(item_model, dict) and 'id' in item_model and 'descricao' in item_model:
-                    items_list.append((item_model['id'], item_model['descricao']))
-                # If item_model is not a dict (e.g. if the list contains non-dict elements unexpectedly), skip.
-            return items_list
+            return [(item.id, item.descricao) for item in rede.lista(key_name)]
 
         return {
             "sujeitos" : name_id_extractor('sujeitos'),
@@ -438,7 +545,7 @@ def ordenar_timeline(
             "hipoteses_analiticas" : name_id_extractor('hipoteses_analiticas')
         }
 
-    def update_rede_func(rede: RedeContingencialOutput, json_data: dict) -> str: # Returns string for log
+    def update_rede_func(rede: GrafoRede, json_data: dict) -> str: # Returns string for log
         timeline_data = json_data.get("timeline")
 
         # Initialize timeline if it's None
@@ -450,8 +557,7 @@ def ordenar_timeline(
             rede.timeline = [str(item) for item in timeline_data]
 
         # Add Hipoteses_Analiticas nodes to the end of the timeline if not already included
-        # _get_id is imported from utils
-        hipoteses_ids = {_get_id(h) for h in rede.hipoteses_analiticas if _get_id(h) is not None}
+        hipoteses_ids = rede.ids('hipoteses_analiticas')
         current_timeline_ids = set(rede.timeline) # rede.timeline is guaranteed to be a list here
 
         for h_id in hipoteses_ids:
@@ -462,7 +568,7 @@ def ordenar_timeline(
 
         return f"Nós na timeline: {len(rede.timeline)}"
 
-    return _processar_etapa(
+    return processar_etapa(
         texto_narrativo=texto_narrativo,
         rede_atual=rede_atual,
         client_model=client_model,
@@ -473,18 +579,169 @@ def ordenar_timeline(
         etapa_name="Ordenação da Timeline"
     )
 
-# --- Função Orquestradora Principal ---
+# --- Modo por fragmentos (narrativas longas) ---
 
-def analisar(
+# Etapas que só dependem do trecho do texto em que os elementos aparecem
+NOMES_ETAPAS_POR_FRAGMENTO = (
+    'extrair_sujeitos',
+    'extrair_acoes_comportamentos',
+    'extrair_eventos_ambientais_e_relacoes_temporais'
+)
+
+def _etapas_por_fragmento() -> List[Callable]:
+    # Lidas de ETAPAS_DE_EXTRACAO pelo nome, para respeitar substituições (e.g. as etapas cronometradas do benchmark.py)
+    return [e for e in ETAPAS_DE_EXTRACAO if e.__name__ in NOMES_ETAPAS_POR_FRAGMENTO]
+
+def _reconciliar_fragmentos(rede_atual: GrafoRede, resultados: list) -> GrafoRede:
+    for i, (_, falhas) in enumerate(resultados):
+        if falhas:
+            raise RuntimeError(f"Fragmento {i + 1}/{len(resultados)}: etapas com falha ({', '.join(falhas)}).")
+    reconciliador = ReconciliadorFragmentos(rede_atual)
+    for rede_fragmento, _ in resultados:
+        reconciliador.incorporar(rede_fragmento)
+
+    registrar_resposta_bruta({
+        'fragmentos': len(resultados),
+        'duplicados_unidos': reconciliador.duplicados,
+        'arestas_descartadas': reconciliador.arestas_descartadas
+    })
+    log_details = (
+        f"Fragmentos: {len(resultados)}, Sujeitos: {rede_atual.total('sujeitos')}, "
+        f"Ações: {rede_atual.total('acoes_comportamentos')}, Estímulos: {rede_atual.total('estimulos_eventos')}, "
+        f"Duplicados unidos: {reconciliador.duplicados}"
+    )
+    registrar_resumo_etapa(log_details)
+    logger.info(f"Etapa de fragmentos concluída. {log_details}")
+    return rede_atual
+
+async def _extrair_fragmentos_async(
+    fragmentos: List[str],
+    rede_atual: GrafoRede,
+    client_model: Client,
+    processar_etapa: Callable
+) -> GrafoRede:
+    # Cada fragmento é uma tarefa com seu próprio contexto (respostas brutas não se misturam)
+    resultados = await asyncio.gather(*(
+        executar_etapas_async(
+            _etapas_por_fragmento(), fragmento, GrafoRede(), client_model,
+            kwargs_etapa={'processar_etapa': processar_etapa}
+        )
+        for fragmento in fragmentos
+    ))
+    return _reconciliar_fragmentos(rede_atual, list(resultados))
+
+@declarar_campos(
+    le=(),
+    escreve=('sujeitos', 'acoes_comportamentos', 'emissoes_comportamentais', 'estimulos_eventos', 'relacoes_temporais')
+)
+def extrair_por_fragmentos(
     texto_narrativo: str,
-    debug: bool = False
-) -> Optional[Dict[str, Any]]:
-    
-    load_dotenv()
-    if debug:
-        logger.setLevel(logging.DEBUG)
-    else:
-        logger.setLevel(logging.INFO)
+    rede_atual: GrafoRede,
+    client_model: Client,
+    processar_etapa: Callable = _processar_etapa,
+) -> GrafoRede:
+    """
+    Substitui as etapas de NOMES_ETAPAS_POR_FRAGMENTO em textos longos: elas rodam sobre cada fragmento do texto
+    (fragmentos.dividir_texto), com os fragmentos em paralelo, e as redes parciais são reconciliadas na rede atual.
+    As etapas seguintes (funcionais, hipóteses, timeline) continuam recebendo o texto completo.
+    """
+    fragmentos = dividir_texto(texto_narrativo)
+    logger.info(f"Iniciando Etapa: Extração por fragmentos ({len(fragmentos)} fragmentos)")
+    if asyncio.iscoroutinefunction(processar_etapa):
+        return _extrair_fragmentos_async(fragmentos, rede_atual, client_model, processar_etapa)
+
+    with ThreadPoolExecutor(max_workers=min(config.MAX_FRAGMENTOS_PARALELOS, len(fragmentos))) as executor:
+        futures = [
+            executor.submit(
+                copy_context().run, executar_etapas, _etapas_por_fragmento(), fragmento, GrafoRede(), client_model,
+                kwargs_etapa={'processar_etapa': processar_etapa}
+            )
+            for fragmento in fragmentos
+        ]
+        resultados = [f.result() for f in futures]
+    return _reconciliar_fragmentos(rede_atual, resultados)
+
+# --- Função Orquestradora Principal ---
+
+def _carregar_checkpoint(run_uuid: str, texto_narrativo: str):
+    """Retorna (rede, nomes das etapas já concluídas) de uma execução anterior, ou None se não houver."""
+    run = get_run(run_uuid)
+    if run is None:
+        return None
+    if run['texto_entrada'] != texto_narrativo:
+        raise ValueError(f"O texto informado não corresponde ao texto da execução {run_uuid}.")
+
+    stages = get_run_stages(run_uuid)
+    if not stages:
+        return GrafoRede(), set()
+    rede = RedeContingencialOutput.model_validate_json(stages[-1]['network_data'])
+    return GrafoRede.de_rede(rede), {stage['stage_name'] for stage in stages}
+
+class _ProgressoElementos:
+    """
+    ao_receber_elemento do agendador: conta os elementos distintos já recebidos de cada etapa em andamento e grava
+    a contagem em run_progress (no máximo uma vez a cada config.SSE_POLL_INTERVAL por etapa), de onde o stream de
+    progresso (/analise/eventos em app.py) a lê. Elementos repetidos por uma nova tentativa não contam duas vezes.
+    """
+    def __init__(self, run_uuid: str):
+        self.run_uuid = run_uuid
+        self._lock = threading.Lock() # Etapas de uma mesma onda chamam de threads diferentes
+        self._recebidos: Dict[str, Dict[str, set]] = {}
+        self._gravado_em: Dict[str, float] = {}
+
+    def __call__(self, etapa_func: Callable, campo: str, elemento: Any) -> None:
+        etapa_name = etapa_func.__name__
+        chave = (elemento.get('id') if isinstance(elemento, dict) else None) or json.dumps(elemento, sort_keys=True)
+        with self._lock:
+            recebidos = self._recebidos.setdefault(etapa_name, {})
+            recebidos.setdefault(campo, set()).add(chave)
+            agora = time.monotonic()
+            if agora - self._gravado_em.get(etapa_name, float('-inf')) < config.SSE_POLL_INTERVAL:
+                return
+            self._gravado_em[etapa_name] = agora
+            contagem = json.dumps({c: len(ids) for c, ids in recebidos.items()})
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None:
+            self._gravar(etapa_name, contagem)
+        else:
+            # analisar_async: a gravação no SQLite sai do event loop (uma gravação atrasada depois do fim da etapa é
+            # descartada por save_run_progress)
+            loop.run_in_executor(None, self._gravar, etapa_name, contagem)
+
+    def _gravar(self, etapa_name: str, contagem: str) -> None:
+        try:
+            save_run_progress(self.run_uuid, etapa_name, contagem)
+        except sqlite3.Error as e:
+            logger.warning(f"Falha ao gravar o progresso da etapa {etapa_name}: {e}")
+
+# Sequência de execução das etapas modulares (ordem de referência para o agendador)
+ETAPAS_DE_EXTRACAO = [
+    extrair_sujeitos,
+    extrair_acoes_comportamentos,
+    extrair_eventos_ambientais_e_relacoes_temporais,
+    inferir_relacoes_funcionais_antecedentes,
+    inferir_relacoes_funcionais_consequentes,
+    #identificar_condicoes_estado,
+    #estabelecer_relacoes_moduladoras_estado,
+    formular_hipoteses_analiticas_e_evidencias,
+    ordenar_timeline
+]
+
+def _etapas_da_execucao(texto_narrativo: str) -> List[Callable]:
+    """ETAPAS_DE_EXTRACAO, ou, para textos acima de config.FRAGMENTOS_MIN_CARACTERES, com as etapas iniciais por fragmento."""
+    limite = config.FRAGMENTOS_MIN_CARACTERES
+    if limite is None or len(texto_narrativo) <= limite:
+        return list(ETAPAS_DE_EXTRACAO)
+    return [extrair_por_fragmentos] + [e for e in ETAPAS_DE_EXTRACAO if e.__name__ not in NOMES_ETAPAS_POR_FRAGMENTO]
+
+def _criar_cliente():
+    """Cliente do modelo conforme config.LLM_BACKEND: Gemini, ou respostas gravadas (cassette.py) sem rede."""
+    if config.LLM_BACKEND == 'cassette':
+        from cassette import obter_cliente
+        return obter_cliente()
 
     api_key = os.environ.get("GEMINI_API_KEY")
     if not api_key:
@@ -493,49 +750,188 @@ def analisar(
         return None
 
     try:
-        client_model = Client(api_key=api_key) # Modelo é instanciado aqui
+        return Client(api_key=api_key) # Modelo é instanciado aqui
     except Exception as e:
         logger.error(f"Falha ao inicializar o modelo Gemini: {e}", exc_info=True)
         print(f"Erro ao inicializar o modelo Gemini: {e}")
         return None
 
-    rede_final = RedeContingencialOutput()
-    
-    # Sequência de execução das etapas modulares
-    etapas_de_extracao = [
-        extrair_sujeitos,
-        extrair_acoes_comportamentos,
-        extrair_eventos_ambientais_e_relacoes_temporais,
-        inferir_relacoes_funcionais_antecedentes,
-        inferir_relacoes_funcionais_consequentes,
-        #identificar_condicoes_estado,
-        #estabelecer_relacoes_moduladoras_estado,
-        formular_hipoteses_analiticas_e_evidencias,
-        ordenar_timeline
-    ]
-
-    for i, etapa_func in enumerate(etapas_de_extracao):
-        logger.info(f"--- Iniciando processamento da Etapa {i+1}: {etapa_func.__name__} ---")
+def _preparar_execucao(texto_narrativo: str, debug: bool, run_uuid: Optional[str]):
+    """
+    Configura o logging, o cliente Gemini e o checkpoint da execução.
+    Retorna (client_model, rede inicial, etapas pendentes, ao_concluir_etapa, ao_receber_elemento, run_uuid),
+    ou None em caso de erro.
+    """
+    load_dotenv()
+    if debug:
+        logger.setLevel(logging.DEBUG)
+    else:
+        logger.setLevel(logging.INFO)
+
+    client_model = _criar_cliente()
+    if client_model is None:
+        return None
+
+    rede_inicial = GrafoRede() # A RedeContingencialOutput só é montada nos checkpoints e no fim (_finalizar_execucao)
+    etapas_concluidas = set()
+    ao_concluir_etapa = ao_receber_elemento = None
+    if config.CHECKPOINTS_ENABLED:
+        init_db()
+        run_uuid = run_uuid or str(uuid.uuid4())
         try:
-            rede_final = etapa_func(texto_narrativo, rede_final, client_model) # Passa client_model
-            logger.debug(f"Rede após Etapa {i+1} ({etapa_func.__name__}):\n{rede_final.model_dump_json(indent=2, exclude_none=True)}")
-        except Exception as e:
-            logger.error(f"Erro durante a execução da etapa {etapa_func.__name__}: {e}", exc_info=True)
-            # Decide se quer parar ou continuar em caso de erro em uma etapa
-            # Por enquanto, continua para tentar obter o máximo possível
-    
+            checkpoint = _carregar_checkpoint(run_uuid, texto_narrativo)
+        except ValueError as e:
+            logger.error(str(e))
+            return None
+        if checkpoint is None:
+            create_run(texto_narrativo, run_uuid)
+            logger.info(f"Execução {run_uuid} iniciada.")
+        else:
+            rede_inicial, etapas_concluidas = checkpoint
+            logger.info(f"Retomando execução {run_uuid}. Etapas já concluídas: {', '.join(sorted(etapas_concluidas)) or 'nenhuma'}")
+
+        # O grafo de vis.js é calculado uma vez por etapa aqui, e o stream de progresso (app.py) só repassa as diferenças
+        vis_anterior = diferenca_vis(rede_inicial.para_dict(), ({}, {}))[2] if etapas_concluidas else ({}, {})
+
+        def ao_concluir_etapa(etapa_func, rede, resposta, detalhes):
+            nonlocal vis_anterior
+            dados_rede = rede.para_dict()
+            nodes, edges, vis_anterior = diferenca_vis(dados_rede, vis_anterior)
+            save_run_stage(
+                run_uuid, etapa_func.__name__, json.dumps(resposta, ensure_ascii=False),
+                json.dumps(dados_rede, ensure_ascii=False),
+                duration_s=detalhes['duracao_s'], summary=detalhes['resumo'],
+                vis_delta=json.dumps({"nodes": nodes, "edges": edges}, ensure_ascii=False)
+            )
+
+        if config.LLM_STREAMING:
+            ao_receber_elemento = _ProgressoElementos(run_uuid) # Sem streaming, os elementos só chegam no fim da etapa
+
+    etapas_pendentes = [e for e in _etapas_da_execucao(texto_narrativo) if e.__name__ not in etapas_concluidas]
+    return client_model, rede_inicial, etapas_pendentes, ao_concluir_etapa, ao_receber_elemento, run_uuid
+
+def _gravar_metricas(run_uuid: Optional[str], medicoes: List[metricas.MedicaoEtapa]) -> None:
+    if not config.METRICAS_PERSISTIR or run_uuid is None or not medicoes:
+        return
+    try:
+        save_run_metrics(run_uuid, [medicao.para_dict() for medicao in medicoes])
+    except sqlite3.Error as e:
+        logger.error(f"Falha ao gravar as métricas da execução {run_uuid}: {e}") # Não invalida a análise
+
+def _podar_checkpoints() -> None:
+    """
+    Aplica config.CHECKPOINTS_RETENCAO_SEGUNDOS às execuções concluídas. A execução que acaba de terminar fica:
+    o stream de progresso (app.py) ainda pode estar lendo as etapas dela, e o worker só marca o job como concluído
+    depois de gravar a análise.
+    """
+    if config.CHECKPOINTS_RETENCAO_SEGUNDOS is None:
+        return
+    try:
+        removidas = prune_completed_runs(config.CHECKPOINTS_RETENCAO_SEGUNDOS)
+    except sqlite3.Error as e:
+        logger.error(f"Falha ao apagar checkpoints antigos: {e}") # Não invalida a análise
+        return
+    if removidas:
+        logger.info(f"{removidas} etapa(s) de execuções concluídas apagada(s).")
+
+def _finalizar_execucao(
+    grafo_final: GrafoRede,
+    falhas: List[str],
+    run_uuid: Optional[str],
+    medicoes: List[metricas.MedicaoEtapa]
+) -> Optional[Dict[str, Any]]:
+    rede_final = grafo_final.para_dict() # Sem serializar e reler a rede: os elementos já estão em cache
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Rede final:\n{json.dumps(rede_final, indent=2, ensure_ascii=False)}")
+
+    _gravar_metricas(run_uuid, medicoes)
+    if config.CHECKPOINTS_ENABLED:
+        update_run_status(run_uuid, RUN_INCOMPLETE if falhas else RUN_COMPLETE)
+        _podar_checkpoints()
+    if falhas:
+        logger.error(f"Etapas com falha: {', '.join(falhas)}. Retome com run_uuid={run_uuid}.")
+        return None
+
     logger.info("Todas as etapas de extração foram processadas.")
-    return json.loads(rede_final.model_dump_json(exclude_none=True))
+    return rede_final
+
+@tracing.rastrear(argumentos=('run_uuid',))
+def analisar(
+    texto_narrativo: str,
+    debug: bool = False,
+    run_uuid: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Executa o pipeline completo. Com config.CHECKPOINTS_ENABLED, a rede é gravada após cada etapa sob `run_uuid`;
+    chamar novamente com o mesmo `run_uuid` retoma a partir da última etapa concluída.
+    Retorna None se alguma etapa falhar (a execução pode então ser retomada).
+    """
+    preparo = _preparar_execucao(texto_narrativo, debug, run_uuid)
+    if preparo is None:
+        return None
+    client_model, rede_final, etapas_pendentes, ao_concluir_etapa, ao_receber_elemento, run_uuid = preparo
+
+    # Etapas independentes (e.g. antecedentes e consequentes) rodam em paralelo; ver scheduler.py
+    with metricas.medir_execucao() as medicoes:
+        rede_final, falhas = executar_etapas(
+            etapas_pendentes, texto_narrativo, rede_final, client_model,
+            ao_concluir_etapa=ao_concluir_etapa,
+            ao_receber_elemento=ao_receber_elemento
+        )
+    return _finalizar_execucao(rede_final, falhas, run_uuid, medicoes)
+
+@tracing.rastrear(argumentos=('run_uuid',))
+async def analisar_async(
+    texto_narrativo: str,
+    debug: bool = False,
+    run_uuid: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Versão asyncio de analisar(), com o cliente assíncrono do SDK (client.aio).
+    Várias análises podem compartilhar o mesmo event loop, e.g.:
+        resultados = await asyncio.gather(*(analisar_async(t) for t in textos))
+    Checkpoints e retomada funcionam como em analisar(); as gravações no SQLite rodam em threads (asyncio.to_thread).
+    """
+    preparo = await asyncio.to_thread(_preparar_execucao, texto_narrativo, debug, run_uuid)
+    if preparo is None:
+        return None
+    client_model, rede_final, etapas_pendentes, ao_concluir_etapa, ao_receber_elemento, run_uuid = preparo
+
+    with metricas.medir_execucao() as medicoes:
+        rede_final, falhas = await executar_etapas_async(
+            etapas_pendentes, texto_narrativo, rede_final, client_model,
+            ao_concluir_etapa=ao_concluir_etapa,
+            kwargs_etapa={'processar_etapa': _processar_etapa_async},
+            ao_receber_elemento=ao_receber_elemento
+        )
+    return await asyncio.to_thread(_finalizar_execucao, rede_final, falhas, run_uuid, medicoes)
 
 # --- Exemplo de Uso ---
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Analisa um texto narrativo e gera uma rede contingencial em JSON.")
-    parser.add_argument("input_filepath", help="Caminho para o arquivo de texto de entrada.")
-    parser.add_argument("output_filepath", help="Caminho para salvar o arquivo JSON de saída.")
+    parser.add_argument("input_filepath", help="Caminho para o arquivo de texto de entrada (com --batch: diretório, glob ou JSONL).")
+    parser.add_argument("output_filepath", help="Caminho para salvar o arquivo JSON de saída (com --batch: diretório ou arquivo .jsonl).")
     parser.add_argument("--debug", action="store_true", help="Ativa o logging de debug.")
+    parser.add_argument("--cache", choices=["use", "refresh", "bypass"], default=config.LLM_CACHE_MODE,
+                        help="Uso do cache de respostas do modelo: 'use' (padrão), 'refresh' (ignora e regrava) ou 'bypass'.")
+
+    parser.add_argument("--resume", metavar="RUN_ID", help="Retoma uma execução anterior a partir da última etapa concluída.")
+    parser.add_argument("--batch", action="store_true", help="Modo em lote: analisa todos os textos de input_filepath (ver batch.py).")
+    parser.add_argument("--workers", type=int, default=config.BATCH_WORKERS, help="Análises concorrentes no modo em lote.")
+    parser.add_argument("--async", dest="usar_async", action="store_true", help="Usa o pipeline asyncio (analisar_async).")
+    parser.add_argument("--fragmentos", action="store_true",
+                        help="Extrai as etapas iniciais por fragmentos do texto sempre que ele exceder config.FRAGMENTO_CARACTERES.")
 
     args = parser.parse_args()
+    config.LLM_CACHE_MODE = args.cache
+    if args.fragmentos:
+        config.FRAGMENTOS_MIN_CARACTERES = config.FRAGMENTO_CARACTERES
+
+    if args.batch:
+        from batch import executar_lote
+        resumo = executar_lote(args.input_filepath, args.output_filepath, workers=args.workers, debug=args.debug)
+        exit(1 if resumo['falhas'] else 0)
 
     try:
         with open(args.input_filepath, "r", encoding="utf-8") as f:
@@ -547,10 +943,21 @@ if __name__ == "__main__":
         print(f"Erro ao ler o arquivo de entrada: {e}")
         exit(1)
     
-    resultado_analise_modular = analisar(
-        texto_narrativo=texto_para_analise,
-        debug=args.debug 
-    )
+    run_uuid = args.resume or str(uuid.uuid4())
+    print(f"ID da execução: {run_uuid} (use --resume {run_uuid} para retomar em caso de falha)")
+
+    if args.usar_async:
+        resultado_analise_modular = asyncio.run(analisar_async(
+            texto_narrativo=texto_para_analise,
+            debug=args.debug,
+            run_uuid=run_uuid
+        ))
+    else:
+        resultado_analise_modular = analisar(
+            texto_narrativo=texto_para_analise,
+            debug=args.debug,
+            run_uuid=run_uuid
+        )
 
     if resultado_analise_modular:
         print(f"\n--- Análise da Rede Contingencial (JSON Final Agregado Modular para {args.input_filepath}) ---")
@@ -571,3 +978,4 @@ if __name__ == "__main__":
             exit(1)
     else:
         print(f"\nA análise modular para {args.input_filepath} falhou ou não retornou dados válidos.")
+        print(f"Para retomar: python analysis.py {args.input_filepath} {args.output_filepath} --resume {run_uuid}")
@@ -1,21 +1,83 @@
 # app.py
 import os
 import glob # For finding files
-from flask import Flask, render_template, request, jsonify, redirect, url_for, Response # Added Response
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response, stream_with_context, g # Added Response
 import io # For BytesIO
+import base64
+import html
 import json # Import json para serializar para o template
-from analysis import analisar # Importa a função do arquivo analysis.py
-from utils import transformar_para_vis # Importa a função do arquivo utils.py
-import datetime # Added
-from db import init_db, insert_analysis, get_analysis_by_uuid, get_all_analyses # New import for this route
+import hashlib
+import time
+import threading
+import cProfile
+import config
+import http_cache
+import metricas
+import tracing
+from contingencias import buscar_triades
+from utils import transformar_para_vis, diferenca_vis, VIS_VERSION # Importa a função do arquivo utils.py
+from db import init_db, get_analysis_by_uuid, get_analysis_vis, get_analysis_body, save_analysis_bodies, count_analyses, list_analyses, search_analyses, SNIPPET_START, SNIPPET_END, enqueue_job, get_job_by_uuid, retry_job, get_run_stages_after, get_run_progress, JOB_DONE, JOB_FAILED
 
 app = Flask(__name__)
 
 # Initialize the database
 init_db()
-# Confere estado do DB
-all_analyses = get_all_analyses()
-app.logger.info(f"Análises salvas no Banco de Dados: {len(all_analyses)}")
+# Confere estado do DB (contagem mantida por trigger, sem percorrer a tabela)
+app.logger.info(f"Análises salvas no Banco de Dados: {count_analyses()}")
+
+def _versao_templates() -> str:
+    """Hash dos templates: mudar um template invalida os ETags das páginas de visualização já em cache."""
+    digest = hashlib.sha256()
+    for caminho in sorted(glob.glob(os.path.join(app.root_path, 'templates', '*.html'))):
+        with open(caminho, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+# Versão do corpo da página /analysis/view: muda com a transformação (VIS_VERSION) ou com os templates
+VIEW_VERSION = f"{VIS_VERSION}.{_versao_templates()}"
+
+# Um ?profile=1 por vez: dois cProfile ativos ao mesmo tempo falham no Python 3.12+ e misturam os relatórios antes dele
+_profile_lock = threading.Lock()
+
+def _encerrar_profile():
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profile_lock.release()
+    return profiler
+
+@app.before_request
+def _iniciar_rastreamento():
+    """Span da requisição (config.TRACING_ENABLED) e, com config.PROFILE_POR_REQUISICAO, o cProfile de ?profile=1."""
+    rota = request.url_rule.rule if request.url_rule else request.path
+    g.span = tracing.iniciar_span(f"{request.method} {rota}", caminho=request.path)
+    if config.PROFILE_POR_REQUISICAO and request.args.get('profile') == '1':
+        if not _profile_lock.acquire(blocking=False):
+            return Response("Outra requisição com ?profile=1 está em andamento.\n", status=409, content_type='text/plain; charset=utf-8')
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e: # Outra ferramenta de profiling ativa no processo (e.g. um depurador)
+            _profile_lock.release()
+            return Response(f"Profiling indisponível: {e}\n", status=503, content_type='text/plain; charset=utf-8')
+        g.profiler = profiler
+
+@app.after_request
+def _concluir_rastreamento(response):
+    if g.get('span') is not None:
+        g.span.definir(status=response.status_code)
+    # Respostas em streaming (e.g. /analise/eventos) só têm medida a parte executada antes do primeiro byte
+    profiler = _encerrar_profile()
+    if profiler is None:
+        return response
+    return Response(tracing.relatorio_profile(profiler), content_type='text/plain; charset=utf-8')
+
+@app.teardown_request
+def _encerrar_rastreamento(erro):
+    _encerrar_profile() # after_request não roda quando a rota levanta uma exceção
+    span = g.pop('span', None)
+    if span is not None:
+        span.encerrar(erro)
 
 # Create static/json/examples directory if it doesn't exist
 examples_dir = os.path.join('static', 'json', 'examples')
@@ -23,11 +85,11 @@ os.makedirs(examples_dir, exist_ok=True)
 
 @app.route('/')
 def index():
-    json_data_main = get_analysis_by_uuid('0849e1cd-c9c6-4402-bb48-b388571fd091') # Usuário da Ferramenta
+    nodes_data_main, edges_data_main = '[]', '[]'
     try:
-        nodes_main, edges_main = transformar_para_vis(json.loads(json_data_main['analysis_data']))
-        nodes_data_main = json.dumps(nodes_main)
-        edges_data_main = json.dumps(edges_main)
+        vis_main = get_analysis_vis('0849e1cd-c9c6-4402-bb48-b388571fd091') # Usuário da Ferramenta
+        nodes_data_main = vis_main['nodes_data']
+        edges_data_main = vis_main['edges_data']
     except Exception as e:
         app.logger.error(f"Error loading main example for index page: {e}")
         # nodes_data_main and edges_data_main will remain empty
@@ -48,69 +110,291 @@ def analise_route(): # Renamed to avoid conflict with imported 'analisar'
     if not texto_entrada:
         # Handle empty input, maybe return an error or redirect
         return redirect(url_for('index'))
+    # force=1 reanalisa um texto que já tem análise (em vez de reutilizá-la)
+    force = (request.form.get('force') or request.args.get('force')) == '1'
 
-    # Calls the analysis function from analysis.py
-    json_analisado_dict = analisar(texto_entrada)
-
-    if not json_analisado_dict:
-        # Handle analysis failure
-        # You might want to flash a message to the user here
+    # A análise é feita pelo worker (worker.py); aqui apenas enfileiramos o job.
+    # Textos já analisados ou em análise reaproveitam a análise/o job existente (ver enqueue_job)
+    try:
+        job_uuid = enqueue_job(texto_entrada, force=force)
+        job = get_job_by_uuid(job_uuid)
+    except Exception as e:
+        app.logger.error(f"Error enqueuing analysis job: {e}")
         return redirect(url_for('index'))
 
-    # Add original text to the analysis dictionary before saving
-    json_analisado_dict['texto_original'] = texto_entrada
-    
-    # Convert the dict to a JSON string for storage
-    analysis_data_json_string = json.dumps(json_analisado_dict)
+    if job['status'] == JOB_DONE:
+        view_url = url_for('view_analysis_route', analysis_uuid=job['analysis_uuid'])
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({"job_uuid": job_uuid, "status": job['status'], "analysis_uuid": job['analysis_uuid'], "view_url": view_url})
+        return redirect(view_url)
+
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({"job_uuid": job_uuid, "status_url": url_for('job_status_route', job_uuid=job_uuid)}), 202
+
+    return render_template('job.html', job_uuid=job_uuid)
+
+@app.route('/analise/status/<string:job_uuid>')
+def job_status_route(job_uuid):
+    job = get_job_by_uuid(job_uuid)
+    if not job:
+        return jsonify({"error": "Job não encontrado."}), 404
+
+    status = {
+        "job_uuid": job['job_uuid'],
+        "status": job['status'],
+        "created_at": job['created_at'],
+        "updated_at": job['updated_at'],
+    }
+    if job['status'] == JOB_DONE:
+        status['analysis_uuid'] = job['analysis_uuid']
+        status['view_url'] = url_for('view_analysis_route', analysis_uuid=job['analysis_uuid'])
+    elif job['status'] == JOB_FAILED:
+        status['error'] = job['error']
+    return jsonify(status)
+
+def _evento_sse(evento: str, dados: dict, event_id=None) -> str:
+    linhas = [f"id: {event_id}"] if event_id is not None else []
+    linhas += [f"event: {evento}", f"data: {json.dumps(dados, ensure_ascii=False)}"]
+    return "\n".join(linhas) + "\n\n"
+
+@app.route('/analise/eventos/<string:job_uuid>')
+def job_events_route(job_uuid):
+    """
+    Server-Sent Events com o progresso de um job. O worker grava um checkpoint por etapa concluída
+    (run_stages, com run_uuid = job_uuid) junto com os nodes/edges de vis.js novos ou alterados na etapa;
+    cada um vira um evento 'etapa' com o nome, a duração, o resumo das contagens e essas diferenças.
+    Com config.LLM_STREAMING, eventos 'parcial' (sem id) trazem a contagem de elementos já recebidos de cada etapa
+    em andamento. Termina com 'concluido' (view_url) ou 'falha' (error). Para não prender um worker web durante a análise
+    inteira, o stream dura no máximo config.SSE_MAX_SECONDS; o id do evento é o id da etapa, então o navegador
+    reconecta (Last-Event-ID) e continua de onde parou.
+    """
+    if not get_job_by_uuid(job_uuid):
+        return jsonify({"error": "Job não encontrado."}), 404
+    try:
+        ultimo_id = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        ultimo_id = 0
+
+    def gerar():
+        nonlocal ultimo_id
+        parciais_enviados = {}
+        yield f"retry: {int(config.SSE_POLL_INTERVAL * 1000)}\n\n"
+
+        inicio = ultimo_evento = time.monotonic()
+        while time.monotonic() - inicio < config.SSE_MAX_SECONDS:
+            job = get_job_by_uuid(job_uuid) # Antes das etapas: se já terminou, todas as etapas já foram gravadas
+            for stage in get_run_stages_after(job_uuid, ultimo_id):
+                if stage['vis_delta'] is not None:
+                    delta = json.loads(stage['vis_delta'])
+                    nodes, edges = delta['nodes'], delta['edges']
+                else:
+                    # Etapa gravada antes de vis_delta: o grafo inteiro (o cliente atualiza os elementos por id)
+                    nodes, edges, _ = diferenca_vis(json.loads(stage['network_data']), ({}, {}))
+                yield _evento_sse('etapa', {
+                    "etapa": stage['stage_name'],
+                    "duracao_s": stage['duration_s'],
+                    "resumo": stage['summary'],
+                    "concluida_em": stage['completed_at'],
+                    "nodes": nodes,
+                    "edges": edges,
+                }, event_id=stage['id'])
+                ultimo_id = stage['id']
+                ultimo_evento = time.monotonic()
+
+            for parcial in get_run_progress(job_uuid):
+                if parciais_enviados.get(parcial['stage_name']) == parcial['elements']:
+                    continue
+                yield _evento_sse('parcial', {"etapa": parcial['stage_name'], "elementos": json.loads(parcial['elements'])})
+                parciais_enviados[parcial['stage_name']] = parcial['elements']
+                ultimo_evento = time.monotonic()
+
+            if job['status'] == JOB_DONE:
+                yield _evento_sse('concluido', {
+                    "analysis_uuid": job['analysis_uuid'],
+                    "view_url": url_for('view_analysis_route', analysis_uuid=job['analysis_uuid']),
+                })
+                return
+            if job['status'] == JOB_FAILED:
+                yield _evento_sse('falha', {"error": job['error']})
+                return
+            if time.monotonic() - ultimo_evento >= config.SSE_KEEPALIVE_SECONDS:
+                yield ": keepalive\n\n"
+                ultimo_evento = time.monotonic()
+            time.sleep(config.SSE_POLL_INTERVAL)
+
+    return Response(
+        stream_with_context(gerar()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/analise/retry/<string:job_uuid>', methods=['POST'])
+def retry_job_route(job_uuid):
+    """Devolve um job que falhou à fila; o worker retoma a análise a partir da última etapa concluída."""
+    if not retry_job(job_uuid):
+        return jsonify({"error": "Job não encontrado ou não está em estado de falha."}), 409
+
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({"job_uuid": job_uuid, "status_url": url_for('job_status_route', job_uuid=job_uuid)}), 202
+    return render_template('job.html', job_uuid=job_uuid)
 
-    # Create a name for the analysis (e.g., based on timestamp or first few words)
-    # For now, using a timestamp
-    analysis_name = f"Análise de {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+def _codificar_cursor(row) -> str:
+    return base64.urlsafe_b64encode(f"{row['created_at']}|{row['id']}".encode('utf-8')).decode('ascii')
 
+def _decodificar_cursor(cursor: str) -> tuple:
+    created_at, row_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+    return created_at, int(row_id)
+
+@app.route('/api/analyses')
+def list_analyses_route():
+    """Lista metadados das análises (mais recentes primeiro) com paginação por keyset: ?after=<cursor>&limit=N."""
+    try:
+        limit = min(max(int(request.args.get('limit', config.API_PAGE_SIZE)), 1), config.API_MAX_PAGE_SIZE)
+        after = request.args.get('after')
+        after = _decodificar_cursor(after) if after else None
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({"error": "Parâmetros 'limit' ou 'after' inválidos."}), 400
+
+    # Uma linha a mais indica se há próxima página
+    rows = list_analyses(limit + 1, after)
+    pagina = rows[:limit]
+    return jsonify({
+        "items": [
+            {
+                "analysis_uuid": row['analysis_uuid'],
+                "name": row['name'],
+                "created_at": row['created_at'],
+                "view_url": url_for('view_analysis_route', analysis_uuid=row['analysis_uuid']),
+            }
+            for row in pagina
+        ],
+        "next_cursor": _codificar_cursor(pagina[-1]) if len(rows) > limit else None,
+        "total": count_analyses(),
+    })
+
+@app.route('/api/search')
+def search_analyses_route():
+    """Busca textual nas análises: ?q=<termos>&limit=N&offset=M. Resultados por relevância, com trecho destacado."""
+    query = request.args.get('q', '').strip()
+    try:
+        limit = min(max(int(request.args.get('limit', config.API_PAGE_SIZE)), 1), config.API_MAX_PAGE_SIZE)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"error": "Parâmetros 'limit' ou 'offset' inválidos."}), 400
+    if not query:
+        return jsonify({"error": "Informe o parâmetro 'q'."}), 400
+
+    rows, total = search_analyses(query, limit, offset)
+    return jsonify({
+        "items": [
+            {
+                "analysis_uuid": row['analysis_uuid'],
+                "name": row['name'],
+                "created_at": row['created_at'],
+                # Texto escapado; apenas os termos encontrados vêm marcados com <mark>
+                "snippet": html.escape(row['snippet']).replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>'),
+                "score": row['score'],
+                "view_url": url_for('view_analysis_route', analysis_uuid=row['analysis_uuid']),
+            }
+            for row in rows
+        ],
+        "total": total,
+        "next_offset": offset + limit if offset + limit < total else None,
+    })
+
+@app.route('/api/contingencias')
+def contingencias_route():
+    """
+    Tríades antecedente -> ação -> consequente de todas as análises, em JSON Lines (uma por linha, enviadas
+    à medida que são lidas do banco). Filtros: ?antecedente=<FuncaoAntecedente>&consequente=<FuncaoConsequente>
+    &analysis_uuid=<uuid>&limit=N
+    """
     try:
-        # Save to database
-        analysis_uuid = insert_analysis(
-            name=analysis_name,
-            analysis_data=analysis_data_json_string
+        limite = request.args.get('limit', type=int)
+        triades = buscar_triades(
+            request.args.get('antecedente'),
+            request.args.get('consequente'),
+            request.args.get('analysis_uuid'),
+            limite if limite is None else max(limite, 0)
         )
-        # Redirect to the new view page for this analysis
-        return redirect(url_for('view_analysis_route', analysis_uuid=analysis_uuid))
-    except Exception as e:
-        # Log the error
-        app.logger.error(f"Error saving analysis to database: {e}")
-        # Flash a message to the user
-        # For now, redirect to index
-        return redirect(url_for('index'))
+    except ValueError as e:
+        return jsonify({"error": f"Filtro inválido: {e}"}), 400
+
+    def gerar():
+        for triade in triades:
+            yield json.dumps(triade, ensure_ascii=False) + "\n"
+    return Response(stream_with_context(gerar()), mimetype='application/x-ndjson')
+
+@app.route('/metrics')
+def metrics_route():
+    """
+    Métricas deste processo no formato do Prometheus (metricas.py): banco, transformar_para_vis e, quando a análise
+    roda aqui, etapas e chamadas ao modelo. As etapas do worker são expostas por ele (config.METRICAS_PORTA_WORKER).
+    """
+    return Response(metricas.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/explanation')
 def explanation_page():
     """Renders the explanation page."""
     return render_template('explanation.html')
 
+def _nao_modificado(analysis_uuid: str, corpo: str, versao: str) -> bool:
+    """True se o If-None-Match do cliente já contém alguma representação desta versão do corpo."""
+    return any(request.if_none_match.contains_weak(tag) for tag in http_cache.etags_possiveis(analysis_uuid, corpo, versao))
+
+def _resposta_cacheavel(body, mimetype: str, analysis_uuid: str, corpo: str, versao: str,
+                        encoding: str, max_age: int, headers: dict = None) -> Response:
+    response = Response(body, status=304 if body is None else 200, mimetype=mimetype, headers=headers)
+    response.set_etag(http_cache.etag(analysis_uuid, corpo, versao, encoding))
+    response.headers['Cache-Control'] = f"public, max-age={max_age}" + (", immutable" if corpo == http_cache.CORPO_DOWNLOAD else "")
+    response.headers['Vary'] = 'Accept-Encoding'
+    if body is not None and encoding != http_cache.ENCODING_IDENTITY:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def _nome_arquivo_download(analysis_name: str) -> str:
+    # Sanitize the filename a bit (optional, but good practice)
+    safe_filename = "".join(c if c.isalnum() or c in (' ', '.', '_') else '_' for c in analysis_name)
+    if not safe_filename.lower().endswith(".json"):
+        safe_filename += ".json"
+
+    # Ensure it's not too long
+    return safe_filename[:100] if len(safe_filename) > 100 else safe_filename
+
 @app.route('/analysis/download/<string:analysis_uuid>')
 def download_analysis_route(analysis_uuid):
-    analysis_record = get_analysis_by_uuid(analysis_uuid)
+    encoding = http_cache.escolher_encoding(request.accept_encodings)
+    # Uma análise é imutável: um ETag conhecido pelo cliente dispensa qualquer leitura do banco
+    if _nao_modificado(analysis_uuid, http_cache.CORPO_DOWNLOAD, http_cache.DOWNLOAD_VERSION):
+        return _resposta_cacheavel(None, "application/json", analysis_uuid, http_cache.CORPO_DOWNLOAD,
+                                   http_cache.DOWNLOAD_VERSION, encoding, config.HTTP_CACHE_MAX_AGE_DOWNLOAD)
+
+    if encoding == http_cache.ENCODING_IDENTITY:
+        analysis_record = get_analysis_by_uuid(analysis_uuid)
+    else:
+        # Variante pré-comprimida gravada por insert_analysis
+        analysis_record = get_analysis_body(analysis_uuid, http_cache.CORPO_DOWNLOAD, encoding)
 
     if not analysis_record:
         app.logger.warn(f"Download request for non-existent analysis UUID {analysis_uuid}")
         # Or return a 404 error page
         return '404 Not Found'
 
-    analysis_data_json_string = analysis_record['analysis_data']
-    analysis_name = analysis_record['name']
-
-    # Sanitize the filename a bit (optional, but good practice)
-    safe_filename = "".join(c if c.isalnum() or c in (' ', '.', '_') else '_' for c in analysis_name)
-    if not safe_filename.lower().endswith(".json"):
-        safe_filename += ".json"
-
-    # Ensure it's not too long
-    safe_filename = safe_filename[:100] if len(safe_filename) > 100 else safe_filename
-
-    return Response(
-        analysis_data_json_string,
-        mimetype="application/json",
-        headers={"Content-disposition": f"attachment; filename={safe_filename}"}
+    if encoding == http_cache.ENCODING_IDENTITY:
+        body = analysis_record['analysis_data']
+    elif analysis_record['version'] == http_cache.DOWNLOAD_VERSION:
+        body = analysis_record['body']
+    else:
+        # Análise inserida antes das variantes comprimidas (ou com outra versão): comprime e grava uma vez
+        analysis_data = get_analysis_by_uuid(analysis_uuid)['analysis_data']
+        variants = http_cache.comprimir_variantes(analysis_data.encode('utf-8'))
+        save_analysis_bodies(analysis_uuid, http_cache.CORPO_DOWNLOAD, http_cache.DOWNLOAD_VERSION, variants)
+        body = variants[encoding]
+
+    return _resposta_cacheavel(
+        body, "application/json", analysis_uuid, http_cache.CORPO_DOWNLOAD, http_cache.DOWNLOAD_VERSION,
+        encoding, config.HTTP_CACHE_MAX_AGE_DOWNLOAD,
+        headers={"Content-disposition": f"attachment; filename={_nome_arquivo_download(analysis_record['name'])}"}
     )
 
 @app.route('/examples')
@@ -151,11 +435,26 @@ def load_example(example_filename):
 
 @app.route('/analysis/view/<string:analysis_uuid>')
 def view_analysis_route(analysis_uuid):
-    analysis_record = get_analysis_by_uuid(analysis_uuid)
-    print(f"Viewing analysis with UUID: {analysis_uuid}")
-    print(f"Analysis record: {analysis_record}")
+    encoding = http_cache.escolher_encoding(request.accept_encodings)
+    if _nao_modificado(analysis_uuid, http_cache.CORPO_VIEW, VIEW_VERSION):
+        return _resposta_cacheavel(None, "text/html", analysis_uuid, http_cache.CORPO_VIEW, VIEW_VERSION,
+                                   encoding, config.HTTP_CACHE_MAX_AGE_VIEW)
 
-    if not analysis_record:
+    try:
+        # Página já renderizada e comprimida numa visita anterior: uma leitura, sem renderização
+        pagina = get_analysis_body(analysis_uuid, http_cache.CORPO_VIEW, encoding)
+        if pagina is not None and pagina['version'] == VIEW_VERSION:
+            return _resposta_cacheavel(pagina['body'], "text/html", analysis_uuid, http_cache.CORPO_VIEW,
+                                       VIEW_VERSION, encoding, config.HTTP_CACHE_MAX_AGE_VIEW)
+
+        # Payload da visualização pré-calculado na inserção (tabela analysis_vis): uma leitura, sem transformação
+        vis = get_analysis_vis(analysis_uuid) if pagina is not None else None
+    except Exception as e:
+        app.logger.error(f"Error processing analysis {analysis_uuid} for viewing: {e}")
+        # flash("Erro ao carregar a análise.", "error") # Example
+        return redirect(url_for('index'))
+
+    if not vis:
         # Handle case where analysis_uuid is not found
         # Maybe redirect to an error page or the main list
         # For now, redirect to index and flash a message (if flash is set up)
@@ -163,33 +462,23 @@ def view_analysis_route(analysis_uuid):
         app.logger.warn(f"Analysis with UUID {analysis_uuid} not found.")
         return redirect(url_for('index'))
 
+    pagina_html = render_template('network.html',
+                                  nodes_data=vis['nodes_data'],
+                                  edges_data=vis['edges_data'],
+                                  texto_original=vis['texto_original'],
+                                  timeline_data=vis['timeline_data'],
+                                  analysis_name=vis['name'], # Pass the name for display
+                                  analysis_uuid=analysis_uuid) # Pass UUID for potential use in template (e.g. download link)
+
+    # Renderiza e comprime uma única vez por versão; as próximas visitas leem o corpo gravado
+    corpo = pagina_html.encode('utf-8')
+    variants = {http_cache.ENCODING_IDENTITY: corpo, **http_cache.comprimir_variantes(corpo)}
     try:
-        # The 'analysis_data' is stored as a JSON string, so parse it
-        analysis_data_dict = json.loads(analysis_record['analysis_data'])
-
-        # The 'narrative_text' is stored directly
-        narrative_text = analysis_data_dict.get('texto_original', '')
-
-        # Ensure 'texto_original' is in analysis_data_dict for transformar_para_vis if it expects it
-        # Based on previous logic, 'texto_original' is part of the JSON saved in 'analysis_data'
-        # If transformar_para_vis expects it as a separate top-level key from the DB record, adjust accordingly
-        # For now, assume 'texto_original' is within analysis_data_dict as 'texto_original'
-
-        nodes, edges = transformar_para_vis(analysis_data_dict)
-
-        timeline_data = analysis_data_dict.get('timeline', [])
-
-        return render_template('network.html',
-                               nodes_data=json.dumps(nodes),
-                               edges_data=json.dumps(edges),
-                               texto_original=narrative_text, # Use narrative_text from DB record
-                               timeline_data=json.dumps(timeline_data),
-                               analysis_name=analysis_record['name'], # Pass the name for display
-                               analysis_uuid=analysis_uuid) # Pass UUID for potential use in template (e.g. download link)
+        save_analysis_bodies(analysis_uuid, http_cache.CORPO_VIEW, VIEW_VERSION, variants)
     except Exception as e:
-        app.logger.error(f"Error processing analysis {analysis_uuid} for viewing: {e}")
-        # flash("Erro ao carregar a análise.", "error") # Example
-        return redirect(url_for('index'))
+        app.logger.error(f"Error storing rendered view for analysis {analysis_uuid}: {e}")
+    return _resposta_cacheavel(variants[encoding], "text/html", analysis_uuid, http_cache.CORPO_VIEW,
+                               VIEW_VERSION, encoding, config.HTTP_CACHE_MAX_AGE_VIEW)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
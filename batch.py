@@ -0,0 +1,170 @@
+# batch.py
+# Modo em lote do CLI de analysis.py: analisa vários textos com um pool de análises concorrentes.
+# Uso: python analysis.py --batch <diretório|glob|arquivo.jsonl> <diretório de saída|saida.jsonl> [--workers N]
+from typing import Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+import config
+from analysis import analisar
+
+logger = logging.getLogger(__name__)
+
+def _tem_curinga(caminho: str) -> bool:
+    return any(c in caminho for c in '*?[')
+
+def carregar_entradas(entrada: str) -> Iterator[Tuple[str, str]]:
+    """
+    Gera pares (id, texto) a partir de:
+    - um diretório (todos os *.txt, em ordem alfabética; id = nome do arquivo sem extensão);
+    - um padrão glob (e.g. 'transcricoes/*.txt');
+    - um arquivo JSONL com objetos {"id": ..., "texto": ...} (id padrão: número da linha).
+    """
+    if entrada.endswith('.jsonl') and not _tem_curinga(entrada):
+        with open(entrada, 'r', encoding='utf-8') as f:
+            for numero_linha, linha in enumerate(f, start=1):
+                if not linha.strip():
+                    continue
+                registro = json.loads(linha)
+                texto = registro.get('texto', registro.get('text'))
+                if not texto:
+                    logger.warning(f"Linha {numero_linha} de {entrada} sem campo 'texto'; ignorada.")
+                    continue
+                yield str(registro.get('id', numero_linha)), texto
+        return
+
+    if os.path.isdir(entrada):
+        caminhos = glob.glob(os.path.join(entrada, '*.txt'))
+    else:
+        caminhos = glob.glob(entrada)
+
+    for caminho in sorted(caminhos):
+        with open(caminho, 'r', encoding='utf-8') as f:
+            yield os.path.splitext(os.path.basename(caminho))[0], f.read()
+
+class _SaidaJsonl:
+    """Saída em um único JSONL (uma linha {"id", "resultado"} por documento)."""
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self.existentes = set()
+        if os.path.exists(caminho):
+            with open(caminho, 'r', encoding='utf-8') as f:
+                for linha in f:
+                    if linha.strip():
+                        self.existentes.add(str(json.loads(linha).get('id')))
+
+    def ja_existe(self, doc_id: str) -> bool:
+        return doc_id in self.existentes
+
+    def gravar(self, doc_id: str, resultado: Dict) -> None:
+        linha = json.dumps({"id": doc_id, "resultado": resultado}, ensure_ascii=False)
+        with self._lock:
+            with open(self.caminho, 'a', encoding='utf-8') as f:
+                f.write(linha + '\n')
+            self.existentes.add(doc_id)
+
+class _SaidaArquivos:
+    """Saída em um arquivo <id>.json por documento."""
+    def __init__(self, diretorio: str):
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, doc_id: str) -> str:
+        nome_seguro = "".join(c if c.isalnum() or c in ('-', '_', '.') else '_' for c in doc_id)
+        return os.path.join(self.diretorio, f"{nome_seguro}.json")
+
+    def ja_existe(self, doc_id: str) -> bool:
+        return os.path.exists(self._caminho(doc_id))
+
+    def gravar(self, doc_id: str, resultado: Dict) -> None:
+        # Grava em arquivo temporário e renomeia, para não deixar saídas parciais que seriam puladas depois
+        caminho = self._caminho(doc_id)
+        with open(caminho + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        os.replace(caminho + '.tmp', caminho)
+
+def _run_uuid(doc_id: str, texto: str) -> str:
+    """ID de execução determinístico: rodar o lote de novo retoma documentos interrompidos (checkpoints)."""
+    digest = hashlib.sha256(texto.encode('utf-8')).hexdigest()
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"batch:{doc_id}:{digest}"))
+
+def _percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    # Nearest-rank
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+def _analisar_documento(doc_id: str, texto: str, debug: bool) -> Tuple[str, Optional[Dict], float]:
+    inicio = time.perf_counter()
+    try:
+        resultado = analisar(texto_narrativo=texto, debug=debug, run_uuid=_run_uuid(doc_id, texto))
+    except Exception as e:
+        logger.error(f"Erro inesperado ao analisar o documento {doc_id}: {e}", exc_info=True)
+        resultado = None
+    if resultado:
+        resultado['texto_original'] = texto
+    return doc_id, resultado, time.perf_counter() - inicio
+
+def executar_lote(
+    entrada: str,
+    saida: str,
+    workers: int = config.BATCH_WORKERS,
+    debug: bool = False
+) -> Dict[str, float]:
+    """Analisa todos os documentos de `entrada` e grava em `saida`. Retorna o resumo de throughput."""
+    destino = _SaidaJsonl(saida) if saida.endswith('.jsonl') else _SaidaArquivos(saida)
+
+    pendentes, pulados, vistos = [], 0, set()
+    for doc_id, texto in carregar_entradas(entrada):
+        if doc_id in vistos:
+            logger.warning(f"ID duplicado na entrada: {doc_id}; apenas a primeira ocorrência será analisada.")
+            continue
+        vistos.add(doc_id)
+        if destino.ja_existe(doc_id):
+            pulados += 1
+            continue
+        pendentes.append((doc_id, texto))
+
+    print(f"{len(pendentes)} documento(s) para analisar, {pulados} já existente(s) pulado(s). Workers: {workers}")
+
+    duracoes: List[float] = []
+    falhas: List[str] = []
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(_analisar_documento, doc_id, texto, debug) for doc_id, texto in pendentes]
+        for future in as_completed(futures):
+            doc_id, resultado, duracao = future.result()
+            if resultado:
+                destino.gravar(doc_id, resultado)
+                duracoes.append(duracao)
+                print(f"[{len(duracoes) + len(falhas)}/{len(pendentes)}] {doc_id}: {duracao:.1f}s")
+            else:
+                falhas.append(doc_id)
+                print(f"[{len(duracoes) + len(falhas)}/{len(pendentes)}] {doc_id}: FALHOU")
+    decorrido = time.perf_counter() - inicio
+
+    resumo = {
+        "analisados": len(duracoes),
+        "falhas": len(falhas),
+        "pulados": pulados,
+        "tempo_total_s": round(decorrido, 1),
+        "docs_por_min": round(len(duracoes) / decorrido * 60, 2) if decorrido > 0 else 0.0,
+        "p50_s": round(_percentil(duracoes, 50), 1),
+        "p95_s": round(_percentil(duracoes, 95), 1),
+    }
+    print("\n--- Resumo do lote ---")
+    print(f"Analisados: {resumo['analisados']} | Falhas: {resumo['falhas']} | Pulados: {resumo['pulados']}")
+    print(f"Tempo total: {resumo['tempo_total_s']}s | Throughput: {resumo['docs_por_min']} docs/min")
+    print(f"Tempo por documento: p50 {resumo['p50_s']}s | p95 {resumo['p95_s']}s")
+    if falhas:
+        print(f"Documentos com falha (rode o lote novamente para retomá-los): {', '.join(sorted(falhas))}")
+    return resumo
@@ -0,0 +1,183 @@
+# benchmark.py
+# Benchmark de ponta a ponta sem rede: roda analisar() + transformar_para_vis sobre o corpus de cassetes
+# (backend 'cassette', ver cassette.py) e relata o tempo por etapa e o uso de memória.
+# Uso: python benchmark.py [--semear] [--repeticoes N] [--latencia S] [--taxa-erro X] [--streaming] [--saida relatorio.json]
+from typing import Callable, Dict, List
+import functools
+import inspect
+import json
+import logging
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+import uuid
+import config
+import db
+import llm_inference
+import analysis
+import cassette
+from batch import _percentil
+from rate_limiter import RateLimiter
+from utils import transformar_para_vis
+
+def _cronometrar(etapa_func: Callable, tempos: Dict[str, List[float]]) -> Callable:
+    """Envolve uma etapa (síncrona ou que retorna corrotina) registrando sua duração em `tempos`."""
+    @functools.wraps(etapa_func) # Preserva __name__ e os campos declarados (scheduler.declarar_campos)
+    def etapa(*args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = etapa_func(*args, **kwargs)
+        if inspect.iscoroutine(resultado):
+            async def aguardar():
+                try:
+                    return await resultado
+                finally:
+                    tempos.setdefault(etapa_func.__name__, []).append(time.perf_counter() - inicio)
+            return aguardar()
+        tempos.setdefault(etapa_func.__name__, []).append(time.perf_counter() - inicio)
+        return resultado
+    return etapa
+
+def _resumo(valores: List[float]) -> Dict[str, float]:
+    return {
+        "n": len(valores),
+        "media_s": round(sum(valores) / len(valores), 4) if valores else 0.0,
+        "p50_s": round(_percentil(valores, 50), 4),
+        "p95_s": round(_percentil(valores, 95), 4),
+    }
+
+def executar_benchmark(
+    diretorio: str = config.CASSETTE_DIR,
+    repeticoes: int = 1,
+    medir_memoria: bool = False,
+    com_limites: bool = False
+) -> Dict:
+    """
+    Analisa cada documento do corpus `repeticoes` vezes, sequencialmente, para que o tempo de cada etapa
+    não inclua espera por outras análises. O cache de respostas é ignorado e os checkpoints vão para um
+    banco temporário, de modo que todas as chamadas passam pelo backend e nada é gravado em analysis_database.db.
+    """
+    corpus = cassette.carregar_corpus(diretorio)
+    if not corpus:
+        raise SystemExit(f"Nenhum cassete em {diretorio}. Rode com --semear ou 'python cassette.py --semear'.")
+
+    config.LLM_BACKEND = 'cassette'
+    config.CASSETTE_DIR = diretorio
+    config.LLM_CACHE_MODE = 'bypass'
+    cliente = cassette.obter_cliente(recriar=True)
+    if not com_limites:
+        # Sem os limites de RPM/TPM da conta: mede só o overhead local e a política de retries
+        llm_inference.limiter = RateLimiter(None, None, max_concorrentes=1_000_000)
+
+    tempos_etapas: Dict[str, List[float]] = {}
+    etapas_originais = list(analysis.ETAPAS_DE_EXTRACAO)
+    analysis.ETAPAS_DE_EXTRACAO[:] = [_cronometrar(e, tempos_etapas) for e in etapas_originais]
+
+    tempos_analise: List[float] = []
+    tempos_vis: List[float] = []
+    picos_memoria: List[float] = []
+    falhas: List[str] = []
+    nome_banco_original = db.DATABASE_NAME
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            db.DATABASE_NAME = os.path.join(tmp, 'benchmark.db')
+            inicio_total = time.perf_counter()
+            for repeticao in range(repeticoes):
+                for doc_id, texto in corpus.items():
+                    if medir_memoria:
+                        tracemalloc.start()
+                    inicio = time.perf_counter()
+                    resultado = analysis.analisar(texto, run_uuid=str(uuid.uuid4()))
+                    tempos_analise.append(time.perf_counter() - inicio)
+
+                    if resultado is None:
+                        falhas.append(doc_id)
+                    else:
+                        resultado['texto_original'] = texto
+                        inicio = time.perf_counter()
+                        transformar_para_vis(resultado)
+                        tempos_vis.append(time.perf_counter() - inicio)
+
+                    if medir_memoria:
+                        picos_memoria.append(tracemalloc.get_traced_memory()[1] / 1024 / 1024)
+                        tracemalloc.stop()
+                    print(f"[{repeticao + 1}/{repeticoes}] {doc_id}: {tempos_analise[-1]:.3f}s{' FALHOU' if resultado is None else ''}")
+            decorrido = time.perf_counter() - inicio_total
+            db.close_db_connections() # Antes de apagar o banco temporário
+    finally:
+        db.DATABASE_NAME = nome_banco_original
+        analysis.ETAPAS_DE_EXTRACAO[:] = etapas_originais
+
+    latencia_simulada = cliente.stats['latencia_total_s']
+    return {
+        "documentos": len(corpus),
+        "repeticoes": repeticoes,
+        "analises": len(tempos_analise),
+        "falhas": len(falhas),
+        "tempo_total_s": round(decorrido, 3),
+        # Tempo fora do "modelo": tudo o que não é latência simulada (contexto, validação, mescla, checkpoints, backoff)
+        "overhead_local_s": round(sum(tempos_analise) - latencia_simulada, 3),
+        "analisar": _resumo(tempos_analise),
+        "transformar_para_vis": _resumo(tempos_vis),
+        "etapas": {nome: _resumo(tempos_etapas.get(nome, [])) for nome in (e.__name__ for e in etapas_originais)},
+        "backend": {**cliente.stats, "latencia_total_s": round(latencia_simulada, 3)},
+        "memoria": {
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1), # KB no Linux
+            "pico_tracemalloc_mb": round(max(picos_memoria), 2) if picos_memoria else None,
+        },
+    }
+
+def imprimir_relatorio(relatorio: Dict) -> None:
+    print("\n--- Benchmark ---")
+    print(f"Documentos: {relatorio['documentos']} x {relatorio['repeticoes']} repetição(ões) | "
+          f"Falhas: {relatorio['falhas']} | Tempo total: {relatorio['tempo_total_s']}s")
+    backend = relatorio['backend']
+    print(f"Chamadas ao backend: {backend['chamadas']} | Erros simulados: {backend['erros_simulados']} | "
+          f"JSON inválidos: {backend['json_invalidos']} | Latência simulada: {backend['latencia_total_s']}s")
+    print(f"Overhead local (tempo de análise - latência simulada): {relatorio['overhead_local_s']}s")
+    print(f"\n{'Etapa':<50} {'n':>4} {'média':>9} {'p50':>9} {'p95':>9}")
+    linhas = list(relatorio['etapas'].items()) + [
+        ('analisar (total)', relatorio['analisar']),
+        ('transformar_para_vis', relatorio['transformar_para_vis']),
+    ]
+    for nome, r in linhas:
+        print(f"{nome:<50} {r['n']:>4} {r['media_s']:>8.4f}s {r['p50_s']:>8.4f}s {r['p95_s']:>8.4f}s")
+    memoria = relatorio['memoria']
+    print(f"\nMemória: max RSS {memoria['max_rss_mb']} MB"
+          + (f" | pico tracemalloc por documento {memoria['pico_tracemalloc_mb']} MB" if memoria['pico_tracemalloc_mb'] is not None else ""))
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark offline do pipeline com respostas gravadas (cassette.py).")
+    parser.add_argument("--cassettes", default=config.CASSETTE_DIR, help="Diretório dos cassetes.")
+    parser.add_argument("--semear", action="store_true", help="Grava os cassetes a partir dos exemplos e do banco antes de rodar.")
+    parser.add_argument("--repeticoes", type=int, default=1, help="Quantas vezes analisar cada documento.")
+    parser.add_argument("--latencia", type=float, default=config.CASSETTE_LATENCIA_SEGUNDOS, help="Latência simulada por chamada (s).")
+    parser.add_argument("--jitter", type=float, default=config.CASSETTE_JITTER_SEGUNDOS, help="Variação da latência (+/- s).")
+    parser.add_argument("--taxa-erro", type=float, default=config.CASSETTE_TAXA_ERRO, help="Fração de chamadas com erro 429/503 simulado.")
+    parser.add_argument("--taxa-json-invalido", type=float, default=config.CASSETTE_TAXA_JSON_INVALIDO, help="Fração de respostas truncadas.")
+    parser.add_argument("--streaming", action="store_true", help="Usa generate_content_stream com validação incremental (config.LLM_STREAMING).")
+    parser.add_argument("--com-limites", action="store_true", help="Aplica os limites GEMINI_RPM/TPM/MAX_CONCORRENTES de config.py.")
+    parser.add_argument("--memoria", action="store_true", help="Mede o pico de alocação por documento com tracemalloc (mais lento).")
+    parser.add_argument("--saida", help="Grava o relatório em JSON neste arquivo.")
+    parser.add_argument("--debug", action="store_true", help="Mantém o logging do pipeline.")
+    args = parser.parse_args()
+
+    if not args.debug:
+        logging.disable(logging.ERROR) # Erros simulados e retries aparecem no resumo do backend
+    if args.semear:
+        print(f"{cassette.semear(args.cassettes)} cassete(s) gravado(s) em {args.cassettes}.")
+
+    config.CASSETTE_LATENCIA_SEGUNDOS = args.latencia
+    config.CASSETTE_JITTER_SEGUNDOS = args.jitter
+    config.CASSETTE_TAXA_ERRO = args.taxa_erro
+    config.CASSETTE_TAXA_JSON_INVALIDO = args.taxa_json_invalido
+    config.LLM_STREAMING = args.streaming
+
+    relatorio = executar_benchmark(args.cassettes, args.repeticoes, medir_memoria=args.memoria, com_limites=args.com_limites)
+    imprimir_relatorio(relatorio)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+        print(f"\nRelatório salvo em: {args.saida}")
@@ -0,0 +1,265 @@
+# cassette.py
+# Backend offline para _make_api_call: em vez do Gemini, devolve respostas gravadas por etapa
+# (um "cassete" por documento), com latência e taxas de erro simuladas.
+# Estrutura do diretório: <CASSETTE_DIR>/<doc_id>/texto.txt e <CASSETTE_DIR>/<doc_id>/<OutputEtapa...>.json
+# Uso: python cassette.py --semear   (grava cassetes a partir de static/json/examples e do analysis_database.db)
+from typing import Dict, Optional
+from types import SimpleNamespace
+from pydantic import ValidationError
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import config
+import output_schemas
+from context_encoder import estimar_tokens
+
+logger = logging.getLogger(__name__)
+
+ARQUIVO_TEXTO = 'texto.txt'
+RACIOCINIO_GRAVADO = 'Resposta gravada (cassete).'
+
+# O texto narrativo vai no prompt entre cercas ``` logo após este cabeçalho (ver _processar_etapa em analysis.py)
+_TEXTO_NO_PROMPT = re.compile(r"Texto narrativo para análise:\n```\n(.*?)\n```\n\n", re.DOTALL)
+
+CARACTERES_POR_PEDACO = 256 # Tamanho dos pedaços entregues por generate_content_stream
+
+class ErroSimulado(Exception):
+    """Erro de API simulado; `code` segue os códigos HTTP usados pelo SDK (e.g. 503, 429)."""
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+def _hash_texto(texto: str) -> str:
+    return hashlib.sha256(texto.strip().encode('utf-8')).hexdigest()
+
+def _schemas_de_etapa() -> Dict[str, type]:
+    return {
+        nome: schema for nome, schema in vars(output_schemas).items()
+        if nome.startswith('OutputEtapa') and isinstance(schema, type)
+    }
+
+# --- Gravação ---
+
+def gravar_cassete(diretorio: str, doc_id: str, texto: str, respostas: Dict[str, dict]) -> str:
+    """Grava o texto e as respostas (nome do schema -> JSON da resposta) de um documento."""
+    destino = os.path.join(diretorio, doc_id)
+    os.makedirs(destino, exist_ok=True)
+    with open(os.path.join(destino, ARQUIVO_TEXTO), 'w', encoding='utf-8') as f:
+        f.write(texto)
+    for nome_schema, resposta in respostas.items():
+        with open(os.path.join(destino, f"{nome_schema}.json"), 'w', encoding='utf-8') as f:
+            json.dump(resposta, f, ensure_ascii=False, indent=2)
+    return destino
+
+def respostas_de_analise(analysis_data: dict) -> Dict[str, dict]:
+    """
+    Deriva a resposta de cada etapa a partir de uma análise final: cada schema recebe os campos da rede
+    que ele declara. Respostas que não validam contra o schema atual são descartadas.
+    """
+    respostas = {}
+    for nome_schema, schema in _schemas_de_etapa().items():
+        resposta = {'raciocinio': RACIOCINIO_GRAVADO}
+        resposta.update({campo: analysis_data[campo] for campo in schema.model_fields if campo in analysis_data})
+        try:
+            schema(**resposta)
+        except ValidationError as e:
+            logger.warning(f"Resposta derivada inválida para {nome_schema}; etapa não gravada: {e}")
+            continue
+        respostas[nome_schema] = resposta
+    return respostas
+
+def _nome_seguro(nome: str) -> str:
+    return "".join(c if c.isalnum() or c in ('-', '_') else '_' for c in nome)
+
+def semear(diretorio: str = config.CASSETTE_DIR, incluir_banco: bool = True) -> int:
+    """Grava cassetes a partir dos exemplos em static/json/examples e das análises do banco. Retorna quantos."""
+    fontes = []
+    for caminho in sorted(glob.glob(os.path.join('static', 'json', 'examples', '*.json'))):
+        with open(caminho, 'r', encoding='utf-8') as f:
+            fontes.append((os.path.splitext(os.path.basename(caminho))[0], json.load(f)))
+
+    if incluir_banco:
+        from db import DATABASE_NAME
+        if os.path.exists(DATABASE_NAME):
+            conn = sqlite3.connect(DATABASE_NAME)
+            try:
+                for analysis_uuid, analysis_data in conn.execute('SELECT analysis_uuid, analysis_data FROM analyses'):
+                    fontes.append((f"db_{analysis_uuid}", json.loads(analysis_data)))
+            finally:
+                conn.close()
+
+    gravados, vistos = 0, set()
+    for doc_id, analysis_data in fontes:
+        texto = analysis_data.get('texto_original')
+        if not texto:
+            logger.warning(f"{doc_id} não tem texto_original; ignorado.")
+            continue
+        if _hash_texto(texto) in vistos:
+            continue # O banco costuma conter os próprios exemplos
+        vistos.add(_hash_texto(texto))
+        gravar_cassete(diretorio, _nome_seguro(doc_id), texto, respostas_de_analise(analysis_data))
+        gravados += 1
+    return gravados
+
+def carregar_corpus(diretorio: str = config.CASSETTE_DIR) -> Dict[str, str]:
+    """Retorna {doc_id: texto} de todos os cassetes do diretório."""
+    corpus = {}
+    for caminho in sorted(glob.glob(os.path.join(diretorio, '*', ARQUIVO_TEXTO))):
+        with open(caminho, 'r', encoding='utf-8') as f:
+            corpus[os.path.basename(os.path.dirname(caminho))] = f.read()
+    return corpus
+
+# --- Reprodução ---
+
+class _ModelsCassete:
+    def __init__(self, cassete: 'CassetteClient'):
+        self._cassete = cassete
+
+    def generate_content(self, model: str, contents, config):
+        latencia, resposta = self._cassete._responder(contents, config)
+        time.sleep(latencia)
+        return self._cassete._entregar(contents, resposta)
+
+    def generate_content_stream(self, model: str, contents, config):
+        latencia, resposta = self._cassete._responder(contents, config)
+        return self._stream(contents, resposta, latencia)
+
+    def _stream(self, contents, resposta, latencia: float):
+        if isinstance(resposta, Exception):
+            time.sleep(latencia)
+        pedacos = self._cassete._pedacos(contents, resposta)
+        for pedaco in pedacos:
+            time.sleep(latencia / len(pedacos)) # A latência se distribui ao longo do stream
+            yield pedaco
+
+class _AsyncModelsCassete:
+    def __init__(self, cassete: 'CassetteClient'):
+        self._cassete = cassete
+
+    async def generate_content(self, model: str, contents, config):
+        latencia, resposta = self._cassete._responder(contents, config)
+        await asyncio.sleep(latencia)
+        return self._cassete._entregar(contents, resposta)
+
+    async def generate_content_stream(self, model: str, contents, config):
+        latencia, resposta = self._cassete._responder(contents, config)
+        return self._stream(contents, resposta, latencia)
+
+    async def _stream(self, contents, resposta, latencia: float):
+        if isinstance(resposta, Exception):
+            await asyncio.sleep(latencia)
+        pedacos = self._cassete._pedacos(contents, resposta)
+        for pedaco in pedacos:
+            await asyncio.sleep(latencia / len(pedacos))
+            yield pedaco
+
+class CassetteClient:
+    """
+    Substitui genai.Client: expõe generate_content e generate_content_stream em client.models e client.aio.models,
+    de modo que retries, rate limiting, validação e cache em llm_inference.py são exercitados normalmente.
+    """
+    def __init__(
+        self,
+        diretorio: Optional[str] = None,
+        latencia_segundos: Optional[float] = None,
+        jitter_segundos: Optional[float] = None,
+        taxa_erro: Optional[float] = None,
+        taxa_json_invalido: Optional[float] = None,
+        seed: Optional[int] = None
+    ):
+        # Padrões lidos de config na criação, para que o benchmark possa ajustá-los em tempo de execução
+        self.diretorio = diretorio or config.CASSETTE_DIR
+        self.latencia_segundos = config.CASSETTE_LATENCIA_SEGUNDOS if latencia_segundos is None else latencia_segundos
+        self.jitter_segundos = config.CASSETTE_JITTER_SEGUNDOS if jitter_segundos is None else jitter_segundos
+        self.taxa_erro = config.CASSETTE_TAXA_ERRO if taxa_erro is None else taxa_erro
+        self.taxa_json_invalido = config.CASSETTE_TAXA_JSON_INVALIDO if taxa_json_invalido is None else taxa_json_invalido
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._docs = {_hash_texto(texto): doc_id for doc_id, texto in carregar_corpus(self.diretorio).items()}
+        self.stats = {'chamadas': 0, 'erros_simulados': 0, 'json_invalidos': 0, 'latencia_total_s': 0.0}
+        self.models = _ModelsCassete(self)
+        self.aio = SimpleNamespace(models=_AsyncModelsCassete(self))
+        if not self._docs:
+            logger.warning(f"Nenhum cassete encontrado em {self.diretorio}. Rode 'python cassette.py --semear'.")
+
+    def _carregar_resposta(self, prompt: str, nome_schema: str) -> str:
+        match = _TEXTO_NO_PROMPT.search(prompt)
+        doc_id = self._docs.get(_hash_texto(match.group(1))) if match else None
+        if doc_id is None:
+            raise ErroSimulado(404, "Nenhum cassete gravado para o texto deste prompt.")
+        caminho = os.path.join(self.diretorio, doc_id, f"{nome_schema}.json")
+        if not os.path.exists(caminho):
+            raise ErroSimulado(404, f"Cassete {doc_id} não tem resposta para {nome_schema}.")
+        with open(caminho, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def _responder(self, contents, generation_config):
+        """Sorteia latência e falhas e carrega a resposta. Retorna (latência, texto ou exceção a levantar)."""
+        prompt = contents[0].parts[0].text
+        with self._lock:
+            latencia = max(0.0, self.latencia_segundos + self._random.uniform(-self.jitter_segundos, self.jitter_segundos))
+            sorteio = self._random.random()
+            self.stats['chamadas'] += 1
+            self.stats['latencia_total_s'] += latencia
+            if sorteio < self.taxa_erro:
+                self.stats['erros_simulados'] += 1
+                codigo = self._random.choice((429, 503))
+                return latencia, ErroSimulado(codigo, 'RESOURCE_EXHAUSTED' if codigo == 429 else 'UNAVAILABLE')
+            json_invalido = sorteio < self.taxa_erro + self.taxa_json_invalido
+            if json_invalido:
+                self.stats['json_invalidos'] += 1
+
+        try:
+            texto = self._carregar_resposta(prompt, generation_config.response_schema.__name__)
+        except ErroSimulado as e:
+            return latencia, e
+        if json_invalido:
+            texto = texto[:len(texto) // 2] # Resposta truncada
+        return latencia, texto
+
+    def _entregar(self, contents, resposta):
+        if isinstance(resposta, Exception):
+            raise resposta
+        tokens = estimar_tokens(contents[0].parts[0].text) + estimar_tokens(resposta)
+        return SimpleNamespace(text=resposta, usage_metadata=SimpleNamespace(total_token_count=tokens))
+
+    def _pedacos(self, contents, resposta):
+        """A resposta dividida como em generate_content_stream: só o último pedaço traz usage_metadata."""
+        completa = self._entregar(contents, resposta)
+        textos = [resposta[i:i + CARACTERES_POR_PEDACO] for i in range(0, len(resposta), CARACTERES_POR_PEDACO)] or [""]
+        pedacos = [SimpleNamespace(text=texto, usage_metadata=None) for texto in textos]
+        pedacos[-1].usage_metadata = completa.usage_metadata
+        return pedacos
+
+_cliente: Optional[CassetteClient] = None
+_cliente_lock = threading.Lock()
+
+def obter_cliente(recriar: bool = False) -> CassetteClient:
+    """Cliente compartilhado pelo processo (o índice de cassetes é lido uma vez). `recriar` relê config e zera stats."""
+    global _cliente
+    with _cliente_lock:
+        if _cliente is None or recriar:
+            _cliente = CassetteClient()
+        return _cliente
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Gerencia os cassetes do backend offline (config.LLM_BACKEND='cassette').")
+    parser.add_argument("--semear", action="store_true", help="Grava cassetes a partir dos exemplos e do banco de análises.")
+    parser.add_argument("--sem-banco", action="store_true", help="Com --semear, usa apenas static/json/examples.")
+    parser.add_argument("--diretorio", default=config.CASSETTE_DIR, help="Diretório dos cassetes.")
+    args = parser.parse_args()
+
+    if args.semear:
+        total = semear(args.diretorio, incluir_banco=not args.sem_banco)
+        print(f"{total} cassete(s) gravado(s) em {args.diretorio}.")
+    corpus = carregar_corpus(args.diretorio)
+    print(f"{len(corpus)} cassete(s) em {args.diretorio}: {', '.join(corpus) or 'nenhum'}")
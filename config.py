@@ -1,2 +1,92 @@
 MODEL='gemini-2.5-flash-preview-05-20'
-MAX_TRIES=3
\ No newline at end of file
+MAX_TRIES=3
+LLM_REPAIR_TRIES=1 # Pedidos de correção só dos elementos inválidos antes de regenerar a resposta inteira (0 = desativado)
+
+# Fila de análises (worker.py)
+WORKER_POLL_INTERVAL=2 # segundos entre consultas à fila vazia
+WORKER_HEARTBEAT_SECONDS=30 # intervalo em que o worker renova jobs.updated_at do job em execução
+WORKER_STALE_JOB_SECONDS=180 # jobs 'running' sem heartbeat há mais tempo que isso voltam para a fila
+WORKER_REQUEUE_INTERVAL=60 # segundos entre as buscas por jobs abandonados, feitas por qualquer worker ocioso
+
+# Agendador de etapas (scheduler.py)
+MAX_ETAPAS_PARALELAS=4 # 1 = execução estritamente sequencial
+
+# Análise por fragmentos de narrativas longas (fragmentos.py)
+FRAGMENTOS_MIN_CARACTERES=None # Textos maiores que isso têm as etapas iniciais extraídas por fragmento (None = desativado)
+FRAGMENTO_CARACTERES=6000
+FRAGMENTO_SOBREPOSICAO=600 # Caracteres compartilhados por fragmentos vizinhos
+MAX_FRAGMENTOS_PARALELOS=4
+FRAGMENTO_SIMILARIDADE_MINIMA=0.6 # Jaccard mínimo entre descrições para unir ações/estímulos da sobreposição
+
+# Cache de respostas do modelo (llm_cache.py)
+LLM_CACHE_DB='llm_cache.db'
+LLM_CACHE_MODE='use' # 'use', 'refresh' (ignora o cache mas regrava) ou 'bypass'
+LLM_CACHE_MAX_BYTES=200 * 1024 * 1024
+LLM_CACHE_MAX_AGE_SECONDS=30 * 24 * 3600
+
+# Streaming das respostas do modelo (llm_inference.py / json_incremental.py)
+LLM_STREAMING=False # True: generate_content_stream, abortando a tentativa no primeiro erro de estrutura do JSON
+
+# Contexto enviado em cada etapa (context_encoder.py)
+CONTEXT_FORMAT='minified' # 'indent' (original), 'minified' ou 'tabular'
+CONTEXT_CAMPOS_OMITIDOS=('raciocinio',) # Atributos não reenviados ao modelo nos campos que a etapa só lê (não escreve nem atualiza)
+CONTEXT_TOKEN_BUDGET=8000 # Orçamento de tokens do contexto por etapa (None = sem limite)
+CONTEXT_TOKEN_BUDGET_HIPOTESES=16000 # A etapa de hipóteses recebe a rede inteira
+CHARS_PER_TOKEN=4 # Estimativa usada no orçamento
+
+# Checkpoints do pipeline (tabelas runs/run_stages em db.py)
+CHECKPOINTS_ENABLED=True
+CHECKPOINTS_RETENCAO_SEGUNDOS=24 * 3600 # Etapas de execuções concluídas são apagadas após esse prazo (None = mantidas)
+
+# Modo em lote do CLI (batch.py)
+BATCH_WORKERS=4 # Análises concorrentes
+
+# Limites de chamadas ao Gemini por processo (rate_limiter.py).
+# Com vários processos (web + workers), divida os limites da conta pelo número de processos.
+GEMINI_RPM=60 # Requisições por minuto (None = sem limite)
+GEMINI_TPM=1_000_000 # Tokens por minuto (None = sem limite)
+GEMINI_MAX_CONCORRENTES=8 # Chamadas simultâneas
+BACKOFF_BASE_SECONDS=1
+BACKOFF_MAX_SECONDS=60
+
+# Backend do modelo: 'gemini' ou 'cassette' (respostas gravadas, sem rede; ver cassette.py)
+LLM_BACKEND='gemini'
+CASSETTE_DIR='cassettes'
+CASSETTE_LATENCIA_SEGUNDOS=0.0 # Latência simulada por chamada
+CASSETTE_JITTER_SEGUNDOS=0.0 # Variação uniforme (+/-) em torno da latência
+CASSETTE_TAXA_ERRO=0.0 # Fração de chamadas que falham com 429/503 simulado
+CASSETTE_TAXA_JSON_INVALIDO=0.0 # Fração de respostas truncadas (JSON inválido)
+
+# Cache HTTP das análises (app.py, http_cache.py)
+HTTP_CACHE_MAX_AGE_DOWNLOAD=365 * 24 * 3600 # Download de uma análise: imutável
+HTTP_CACHE_MAX_AGE_VIEW=24 * 3600 # Página de visualização: revalidada por ETag após esse prazo (templates podem mudar)
+
+# Métricas do pipeline no formato do Prometheus (metricas.py, /metrics em app.py)
+METRICAS_PERSISTIR=False # Grava as medições de cada etapa na tabela run_metrics (db.py), por execução
+METRICAS_PORTA_WORKER=None # Porta em que o worker.py expõe /metrics (None = desativado)
+
+# Rastreamento e profiling (tracing.py; rotas em app.py)
+TRACING_ENABLED=False # Spans de rotas, análises, etapas, chamadas ao modelo, mesclas e funções de db.py
+TRACING_ARQUIVO='traces.jsonl'
+TRACING_FORMATO='jsonl' # 'jsonl' ou 'chrome' (chrome://tracing, Perfetto)
+PROFILE_POR_REQUISICAO=False # Permite ?profile=1 em qualquer rota, que retorna o relatório do cProfile no lugar da resposta
+PROFILE_LINHAS=60 # Funções listadas no relatório
+
+# Consultas de contingências em todo o corpus (contingencias.py, /api/contingencias em app.py)
+CONTINGENCIAS_LOTE=500 # Tríades lidas por consulta; a conexão volta ao pool entre os lotes
+
+# Banco de análises (db.py)
+DB_POOL_SIZE=8 # Conexões reutilizadas por processo
+DB_BUSY_TIMEOUT_SECONDS=30 # Espera por um lock de escrita (e por uma conexão livre no pool)
+DB_STATEMENT_CACHE=256 # Statements preparados em cache por conexão
+DB_MMAP_BYTES=256 * 1024 * 1024
+DB_CACHE_KB=64 * 1024 # Cache de páginas por conexão
+
+# API de listagem de análises (app.py)
+API_PAGE_SIZE=50
+API_MAX_PAGE_SIZE=200
+
+# Progresso de análises em andamento via Server-Sent Events (app.py, /analise/eventos)
+SSE_POLL_INTERVAL=1.0 # segundos entre consultas às etapas gravadas pelo worker
+SSE_KEEPALIVE_SECONDS=15 # comentário enviado quando não há eventos, para manter proxies com a conexão aberta
+SSE_MAX_SECONDS=25 # duração máxima de cada conexão (ocupa um worker web); o navegador reconecta com Last-Event-ID
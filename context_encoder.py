@@ -0,0 +1,104 @@
+# context_encoder.py
+# Codificação compacta do contexto enviado em cada etapa (ver _processar_etapa em analysis.py).
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import json
+import config
+
+FORMATO_INDENTADO = 'indent'  # json.dumps(indent=2), formato original
+FORMATO_MINIFICADO = 'minified'
+FORMATO_TABULAR = 'tabular'   # Listas de objetos viram {"colunas": [...], "linhas": [[...], ...]}
+
+INSTRUCAO_TABULAR = (
+    "Listas de objetos no contexto estão em formato tabular: 'colunas' dá o nome dos campos "
+    "e cada item de 'linhas' traz os valores nessa mesma ordem."
+)
+
+def estimar_tokens(texto: str) -> int:
+    """Estimativa barata de tokens (sem tokenizador): caracteres / config.CHARS_PER_TOKEN."""
+    return len(texto) // config.CHARS_PER_TOKEN + 1
+
+def _minificar(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+def remover_campos(obj: Any, campos: Iterable[str]) -> Any:
+    """Remove recursivamente as chaves `campos` de dicts aninhados (e.g. 'raciocinio' de nós já extraídos)."""
+    campos = frozenset(campos)
+    if isinstance(obj, dict):
+        return {k: remover_campos(v, campos) for k, v in obj.items() if k not in campos}
+    if isinstance(obj, list):
+        return [remover_campos(v, campos) for v in obj]
+    return obj
+
+def tabular(obj: Any) -> Any:
+    """Converte listas homogêneas de dicts em colunas + linhas, eliminando a repetição das chaves."""
+    if isinstance(obj, dict):
+        return {k: tabular(v) for k, v in obj.items()}
+    if isinstance(obj, list) and obj and all(isinstance(v, dict) for v in obj):
+        colunas: List[str] = []
+        for item in obj:
+            for k in item:
+                if k not in colunas:
+                    colunas.append(k)
+        return {"colunas": colunas, "linhas": [[tabular(item.get(c)) for c in colunas] for item in obj]}
+    if isinstance(obj, list):
+        return [tabular(v) for v in obj]
+    return obj
+
+def _listas(obj: Any, caminho: Tuple[str, ...] = ()) -> List[Tuple[Tuple[str, ...], list]]:
+    """Todas as listas dentro de dicts aninhados, com o caminho de chaves até elas."""
+    encontradas = []
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            if isinstance(v, list):
+                encontradas.append((caminho + (k,), v))
+            elif isinstance(v, dict):
+                encontradas.extend(_listas(v, caminho + (k,)))
+    return encontradas
+
+def truncar(contexto: Dict[str, Any], orcamento_tokens: int) -> Dict[str, Any]:
+    """
+    Remove itens do fim da lista mais pesada até o contexto caber no orçamento.
+    Determinístico: o resultado depende só do conteúdo (empates resolvidos pelo caminho da lista).
+    As remoções são registradas em '_omitidos' para que o modelo saiba que o contexto está incompleto.
+    """
+    limite_chars = orcamento_tokens * config.CHARS_PER_TOKEN
+    total = len(_minificar(contexto))
+    if total <= limite_chars:
+        return contexto
+
+    contexto = json.loads(_minificar(contexto)) # Cópia profunda; o original não é alterado
+    listas = _listas(contexto)
+    tamanhos = {caminho: [len(_minificar(item)) + 1 for item in lista] for caminho, lista in listas}
+    omitidos: Dict[str, int] = {}
+
+    while total > limite_chars:
+        candidatas = [(sum(tamanhos[c]), c, l) for c, l in listas if l]
+        if not candidatas:
+            break
+        _, caminho, lista = max(candidatas, key=lambda t: (t[0], t[1]))
+        lista.pop()
+        total -= tamanhos[caminho].pop()
+        chave = '.'.join(caminho)
+        omitidos[chave] = omitidos.get(chave, 0) + 1
+
+    contexto['_omitidos'] = omitidos
+    return contexto
+
+def codificar_contexto(
+    contexto: Dict[str, Any],
+    formato: Optional[str] = None,
+    orcamento_tokens: Optional[int] = None,
+    campos_omitidos: Iterable[str] = ()
+) -> str:
+    """Aplica remoção de campos, orçamento de tokens e o formato escolhido ao contexto de uma etapa."""
+    formato = formato or config.CONTEXT_FORMAT
+    if campos_omitidos:
+        contexto = remover_campos(contexto, campos_omitidos)
+    if orcamento_tokens:
+        contexto = truncar(contexto, orcamento_tokens)
+
+    if formato == FORMATO_INDENTADO:
+        return json.dumps(contexto, indent=2)
+    if formato == FORMATO_TABULAR:
+        return _minificar(tabular(contexto))
+    return _minificar(contexto)
@@ -0,0 +1,129 @@
+# contingencias.py
+# Consultas de contingências de três termos (antecedente -> ação -> consequente) em todo o corpus.
+# Usa as tabelas normalizadas nodes/edges (db.py): cada tríade é um join indexado entre uma
+# RELACAO_FUNCIONAL_ANTECEDENTE (estímulo -> ação) e uma RELACAO_FUNCIONAL_CONSEQUENTE (ação -> estímulo)
+# da mesma análise, sem carregar o analysis_data de nenhuma delas.
+# Uso: python contingencias.py --antecedente ESTIMULO_DISCRIMINATIVO_SD --consequente PUNICAO_POSITIVA_SP_MAIS > saida.jsonl
+from typing import Dict, Iterator, Optional, Type
+from enum import Enum
+import json
+import config
+from db import get_db_connection, EDGE_FIELDS
+from output_schemas import FuncaoAntecedente, FuncaoConsequente
+
+ARESTA_ANTECEDENTE = EDGE_FIELDS['relacoes_funcionais_antecedentes'][0]
+ARESTA_CONSEQUENTE = EDGE_FIELDS['relacoes_funcionais_consequentes'][0]
+
+# Lido em lotes por paginação keyset sobre (análise, aresta consequente, aresta antecedente): a conexão volta ao pool
+# entre um lote e outro, e cada lote continua do índice onde o anterior parou em vez de pular linhas com OFFSET.
+_SQL_TRIADES = """
+    SELECT ec.analysis_id AS chave_analise, ec.id AS chave_consequente, ea.id AS chave_antecedente,
+           an.analysis_uuid, an.name,
+           ea.edge_id AS aresta_antecedente_id, ea.edge_function AS funcao_antecedente,
+           ec.edge_id AS aresta_consequente_id, ec.edge_function AS funcao_consequente,
+           ea.source_node_id AS antecedente_id, na.descricao AS antecedente_descricao,
+           ec.source_node_id AS acao_id, nac.descricao AS acao_descricao,
+           ec.target_node_id AS consequente_id, nc.descricao AS consequente_descricao
+    FROM edges ec
+    JOIN edges ea ON ea.analysis_id = ec.analysis_id AND ea.target_node_id = ec.source_node_id
+                 AND ea.edge_type = :tipo_antecedente
+    JOIN analyses an ON an.id = ec.analysis_id
+    LEFT JOIN nodes na ON na.analysis_id = ea.analysis_id AND na.node_id = ea.source_node_id
+    LEFT JOIN nodes nac ON nac.analysis_id = ec.analysis_id AND nac.node_id = ec.source_node_id
+    LEFT JOIN nodes nc ON nc.analysis_id = ec.analysis_id AND nc.node_id = ec.target_node_id
+    WHERE ec.edge_type = :tipo_consequente
+      AND (ec.analysis_id, ec.id, ea.id) > (:chave_analise, :chave_consequente, :chave_antecedente)
+      {filtros}
+    ORDER BY ec.analysis_id, ec.id, ea.id
+    LIMIT :lote
+"""
+
+# Só os filtros informados entram na consulta: um `(:param IS NULL OR ...)` impede o SQLite de usar
+# edge_function de idx_edges_type_function
+_FILTROS_TRIADES = {
+    'funcao_consequente': "ec.edge_function = :funcao_consequente",
+    'funcao_antecedente': "ea.edge_function = :funcao_antecedente",
+    'analysis_uuid': "an.analysis_uuid = :analysis_uuid",
+}
+
+def normalizar_funcao(valor: Optional[str], enum: Type[Enum]) -> Optional[str]:
+    """
+    Aceita o valor gravado (e.g. 'PUNIÇÃO_POSITIVA_SP+') ou o nome do membro (e.g. 'PUNICAO_POSITIVA_SP_MAIS').
+    Levanta ValueError para funções desconhecidas.
+    """
+    if not valor:
+        return None
+    if valor in enum.__members__:
+        return enum[valor].value
+    return enum(valor).value
+
+def buscar_triades(
+    funcao_antecedente: Optional[str] = None,
+    funcao_consequente: Optional[str] = None,
+    analysis_uuid: Optional[str] = None,
+    limite: Optional[int] = None
+) -> Iterator[Dict]:
+    """
+    Retorna um iterador das tríades antecedente -> ação -> consequente que casam com os filtros.
+    Os filtros são validados já na chamada (ValueError); as tríades são lidas em lotes de
+    config.CONTINGENCIAS_LOTE à medida que são consumidas, sem manter uma conexão do pool entre os lotes.
+    """
+    filtros = {
+        'funcao_antecedente': normalizar_funcao(funcao_antecedente, FuncaoAntecedente),
+        'funcao_consequente': normalizar_funcao(funcao_consequente, FuncaoConsequente),
+        'analysis_uuid': analysis_uuid,
+    }
+    filtros = {nome: valor for nome, valor in filtros.items() if valor is not None}
+    sql = _SQL_TRIADES.format(filtros="".join(f"AND {_FILTROS_TRIADES[nome]}\n      " for nome in filtros).rstrip())
+    parametros = {'tipo_antecedente': ARESTA_ANTECEDENTE, 'tipo_consequente': ARESTA_CONSEQUENTE, **filtros}
+    return _iterar_triades(sql, parametros, limite)
+
+def _ler_lote(sql: str, parametros: Dict) -> list:
+    conn = get_db_connection('buscar_triades')
+    try:
+        return conn.execute(sql, parametros).fetchall()
+    finally:
+        conn.close()
+
+def _iterar_triades(sql: str, parametros: Dict, limite: Optional[int]) -> Iterator[Dict]:
+    chave = (0, 0, 0) # ids do SQLite começam em 1
+    restantes = limite
+    while restantes is None or restantes > 0:
+        lote = config.CONTINGENCIAS_LOTE if restantes is None else min(config.CONTINGENCIAS_LOTE, restantes)
+        linhas = _ler_lote(sql, {
+            **parametros, 'lote': lote,
+            'chave_analise': chave[0], 'chave_consequente': chave[1], 'chave_antecedente': chave[2],
+        })
+        for row in linhas:
+            yield {
+                "analysis_uuid": row['analysis_uuid'],
+                "name": row['name'],
+                "antecedente": {"id": row['antecedente_id'], "descricao": row['antecedente_descricao'],
+                                "funcao": row['funcao_antecedente'], "aresta_id": row['aresta_antecedente_id']},
+                "acao": {"id": row['acao_id'], "descricao": row['acao_descricao']},
+                "consequente": {"id": row['consequente_id'], "descricao": row['consequente_descricao'],
+                                "funcao": row['funcao_consequente'], "aresta_id": row['aresta_consequente_id']},
+            }
+        if len(linhas) < lote:
+            return
+        ultima = linhas[-1]
+        chave = (ultima['chave_analise'], ultima['chave_consequente'], ultima['chave_antecedente'])
+        if restantes is not None:
+            restantes -= len(linhas)
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description="Lista tríades antecedente -> ação -> consequente de todas as análises (JSON Lines).")
+    parser.add_argument("--antecedente", help="Função do antecedente, e.g. ESTIMULO_DISCRIMINATIVO_SD.")
+    parser.add_argument("--consequente", help="Função do consequente, e.g. PUNICAO_POSITIVA_SP_MAIS.")
+    parser.add_argument("--analise", help="Restringe a uma análise (UUID).")
+    parser.add_argument("--limite", type=int, help="Número máximo de tríades.")
+    args = parser.parse_args()
+
+    try:
+        triades = buscar_triades(args.antecedente, args.consequente, args.analise, args.limite)
+        for triade in triades:
+            sys.stdout.write(json.dumps(triade, ensure_ascii=False) + "\n")
+    except ValueError as e:
+        parser.error(str(e))
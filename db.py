@@ -1,17 +1,169 @@
 import os
+import re
+import json
+import atexit
+import hashlib
+import time
 import sqlite3
+import threading
 import uuid
+import config
+import metricas
+import tracing
+import unicodedata
 from datetime import datetime
+from typing import Optional
+from utils import montar_payload_vis, VIS_VERSION
+from http_cache import comprimir_variantes, CORPO_DOWNLOAD, DOWNLOAD_VERSION
 
 DATABASE_NAME = 'analysis_database.db'
 
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE_NAME)
+def _open_connection(database: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        database,
+        timeout=config.DB_BUSY_TIMEOUT_SECONDS,
+        check_same_thread=False, # A conexão passa entre threads pelo pool, mas nunca é usada por duas ao mesmo tempo
+        cached_statements=config.DB_STATEMENT_CACHE # Statements preparados reaproveitados enquanto a conexão vive
+    )
     conn.row_factory = sqlite3.Row
+    # WAL: leitores não bloqueiam o escritor (web + workers gravando análises)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={int(config.DB_MMAP_BYTES)}")
+    conn.execute(f"PRAGMA cache_size={-int(config.DB_CACHE_KB)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
     return conn
 
+class _PooledConnection:
+    """
+    Conexão emprestada do pool: close() a devolve em vez de fechá-la.
+    O tempo de empréstimo (incluindo a espera por uma conexão livre) vai para metricas.DB_SEGUNDOS, rotulado
+    com a operação informada a get_db_connection, e para um span 'db.<operação>' com o rastreamento ativo (tracing.py).
+    """
+    def __init__(self, pool: '_ConnectionPool', conn: sqlite3.Connection, operacao: str = '', inicio: float = 0.0):
+        self._pool = pool
+        self._conn = conn
+        self._operacao = operacao
+        self._inicio = inicio
+        self._span = tracing.iniciar_span(f"db.{operacao}", atual=False)
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+            metricas.DB_SEGUNDOS.observar(time.perf_counter() - self._inicio, operacao=self._operacao)
+            if self._span is not None:
+                self._span.encerrar()
+
+    def __del__(self):
+        # Devolve ao pool conexões de funções que saíram por exceção sem chamar close()
+        self.close()
+
+class _ConnectionPool:
+    """Pool limitado de conexões para um arquivo de banco."""
+    def __init__(self, database: str, max_size: int):
+        self.database = database
+        self.max_size = max_size
+        self.pid = os.getpid()
+        self._idle: list = []
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def acquire(self, operacao: str = '') -> _PooledConnection:
+        inicio = time.perf_counter()
+        with self._cond:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Database connection pool is closed.")
+            while not self._idle and self._size >= self.max_size:
+                if not self._cond.wait(timeout=config.DB_BUSY_TIMEOUT_SECONDS):
+                    raise sqlite3.OperationalError(f"No database connection available (pool of {self.max_size}).")
+            if self._idle:
+                return _PooledConnection(self, self._idle.pop(), operacao, inicio)
+            self._size += 1
+        try:
+            return _PooledConnection(self, _open_connection(self.database), operacao, inicio)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        try:
+            if conn.in_transaction:
+                conn.rollback() # Transação deixada aberta por quem emprestou
+        except sqlite3.Error:
+            conn.close()
+            conn = None
+        with self._cond:
+            if conn is not None and not self._closed:
+                self._idle.append(conn)
+            else:
+                self._size -= 1
+                if conn is not None:
+                    conn.close()
+            self._cond.notify()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            for conn in self._idle:
+                conn.close()
+            self._size -= len(self._idle)
+            self._idle = []
+
+_pools: dict = {}
+_pools_lock = threading.Lock()
+
+def get_db_connection(operacao: str):
+    """
+    Conexão do pool do banco atual (DATABASE_NAME). Chame close() para devolvê-la.
+    `operacao`: rótulo da métrica e do span da conexão, o nome da função de db.py que a usa (e.g. 'insert_analysis').
+    """
+    with _pools_lock:
+        pool = _pools.get(DATABASE_NAME)
+        if pool is None or pool.pid != os.getpid():
+            # Após um fork, o processo filho não reutiliza conexões herdadas do pai
+            pool = _pools[DATABASE_NAME] = _ConnectionPool(DATABASE_NAME, config.DB_POOL_SIZE)
+    return pool.acquire(operacao)
+
+
+def close_db_connections() -> None:
+    """Fecha as conexões ociosas de todos os pools (chamada no encerramento do processo)."""
+    with _pools_lock:
+        pools = [pool for pool in _pools.values() if pool.pid == os.getpid()]
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+atexit.register(close_db_connections)
+
+# Campos de RedeContingencialOutput gravados nas tabelas nodes/edges.
+# Nós: campo -> node_type. Arestas: campo -> (edge_type, campo que classifica a aresta em edge_function).
+NODE_FIELDS = {
+    'sujeitos': 'SUJEITO',
+    'acoes_comportamentos': 'ACAO_COMPORTAMENTO',
+    'estimulos_eventos': 'ESTIMULO_EVENTO',
+    'condicoes_estados': 'CONDICAO_ESTADO',
+    'hipoteses_analiticas': 'HIPOTESE_ANALITICA',
+}
+EDGE_FIELDS = {
+    'emissoes_comportamentais': ('EMISSAO_COMPORTAMENTAL', None),
+    'relacoes_temporais': ('RELACAO_TEMPORAL', 'tipo_temporalidade'),
+    'relacoes_funcionais_antecedentes': ('RELACAO_FUNCIONAL_ANTECEDENTE', 'funcao_antecedente'),
+    'relacoes_funcionais_consequentes': ('RELACAO_FUNCIONAL_CONSEQUENTE', 'funcao_consequente'),
+    'relacoes_moduladoras_estado': ('RELACAO_MODULADORA_ESTADO', 'tipo_modulacao_estado'),
+    'evidencias_para_hipoteses': ('EVIDENCIA_PARA_HIPOTESE', 'tipo_evidencia'),
+}
+
 def init_db():
-    conn = get_db_connection()
+    conn = get_db_connection('init_db')
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS analyses (
@@ -26,18 +178,263 @@ def init_db():
     cursor.execute('''
         CREATE INDEX IF NOT EXISTS idx_analysis_uuid ON analyses (analysis_uuid)
     ''')
+    # Listagem paginada por keyset (list_analyses): mais recentes primeiro
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_analyses_created ON analyses (created_at, id)
+    ''')
+    # Contagem mantida por triggers, para que count_analyses() não percorra a tabela
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_counts (
+            table_name TEXT PRIMARY KEY,
+            row_count INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO table_counts (table_name, row_count)
+        SELECT 'analyses', COUNT(*) FROM analyses
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_analyses_count_insert AFTER INSERT ON analyses
+        BEGIN
+            UPDATE table_counts SET row_count = row_count + 1 WHERE table_name = 'analyses';
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_analyses_count_delete AFTER DELETE ON analyses
+        BEGIN
+            UPDATE table_counts SET row_count = row_count - 1 WHERE table_name = 'analyses';
+        END
+    ''')
+    # Grafo normalizado de cada análise (nós e arestas de analysis_data), para consultas sobre o corpus
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS nodes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            analysis_id INTEGER NOT NULL REFERENCES analyses (id),
+            node_id TEXT,
+            node_type TEXT NOT NULL,
+            descricao TEXT,
+            raciocinio TEXT,
+            node_data TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_nodes_analysis ON nodes (analysis_id, node_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_nodes_type ON nodes (node_type, analysis_id)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS edges (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            analysis_id INTEGER NOT NULL REFERENCES analyses (id),
+            edge_id TEXT,
+            edge_type TEXT NOT NULL,
+            edge_function TEXT,
+            source_node_id TEXT,
+            target_node_id TEXT,
+            raciocinio TEXT,
+            edge_data TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_edges_type_function ON edges (edge_type, edge_function, analysis_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_edges_source ON edges (analysis_id, source_node_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_edges_target ON edges (analysis_id, target_node_id)
+    ''')
+    # Busca textual (search_analyses): narrativa, nome e textos dos nós; acentos ignorados na busca.
+    # O rowid de cada linha é o id da análise, então inserir, remover e testar se uma análise está no índice não
+    # percorre a tabela (uma coluna UNINDEXED de uma tabela fts5 só é filtrada por varredura).
+    _migrate_search_index(cursor)
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS analyses_fts USING fts5 (
+            name,
+            texto_original,
+            nodes_text,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+    # Payload da visualização (vis.js) pré-calculado por análise; recalculado quando VIS_VERSION muda
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_vis (
+            analysis_uuid TEXT PRIMARY KEY,
+            vis_version INTEGER NOT NULL,
+            nodes_data TEXT NOT NULL,
+            edges_data TEXT NOT NULL,
+            timeline_data TEXT NOT NULL,
+            texto_original TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Corpos de resposta pré-comprimidos por análise (http_cache.py): download e página de visualização
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_bodies (
+            analysis_uuid TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            encoding TEXT NOT NULL,
+            version TEXT NOT NULL,
+            body BLOB NOT NULL,
+            PRIMARY KEY (analysis_uuid, kind, encoding)
+        )
+    ''')
+    # Fila durável de análises pendentes, consumida pelo worker (worker.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_uuid TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL DEFAULT 'pending',
+            texto_entrada TEXT NOT NULL,
+            analysis_uuid TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)
+    ''')
+    # Checkpoints do pipeline: snapshot da rede e resposta bruta de cada etapa concluída
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_uuid TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL DEFAULT 'running',
+            texto_entrada TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS run_stages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_uuid TEXT NOT NULL,
+            stage_name TEXT NOT NULL,
+            response_data TEXT,
+            network_data TEXT NOT NULL,
+            completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_run_stages_run ON run_stages (run_uuid, id)
+    ''')
+    # Elementos já recebidos de cada etapa em andamento (respostas em streaming); removidos quando a etapa é gravada
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS run_progress (
+            run_uuid TEXT NOT NULL,
+            stage_name TEXT NOT NULL,
+            elements TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (run_uuid, stage_name)
+        )
+    ''')
+    # Medições de cada etapa de uma execução (config.METRICAS_PERSISTIR; ver metricas.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS run_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_uuid TEXT NOT NULL,
+            stage_name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            duration_s REAL,
+            llm_s REAL,
+            llm_calls INTEGER,
+            failures TEXT,
+            prompt_chars INTEGER,
+            response_chars INTEGER,
+            tokens INTEGER,
+            cache_hits INTEGER,
+            elements TEXT,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_run_metrics_run ON run_metrics (run_uuid, id)
+    ''')
+    # Colunas adicionadas depois da criação da tabela (bancos existentes)
+    _add_missing_columns(cursor, 'run_stages', {'duration_s': 'REAL', 'summary': 'TEXT', 'vis_delta': 'TEXT'})
+    _add_missing_columns(cursor, 'analyses', {'input_hash': 'TEXT'})
+    _add_missing_columns(cursor, 'jobs', {'input_hash': 'TEXT'})
+    # Deduplicação de submissões (enqueue_job): no máximo uma análise por texto normalizado...
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_analyses_input_hash ON analyses (input_hash) WHERE input_hash IS NOT NULL
+    ''')
+    # ...e no máximo um job em andamento por texto: os demais aguardam o mesmo job, mesmo entre processos
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_input_hash_in_flight ON jobs (input_hash)
+        WHERE status IN ('pending', 'running')
+    ''')
     conn.commit()
     conn.close()
 
+def _migrate_search_index(cursor: sqlite3.Cursor) -> None:
+    """Converte o analyses_fts antigo (chaveado pela coluna analysis_uuid) para linhas com rowid = analyses.id."""
+    columns = {row['name'] for row in cursor.execute("PRAGMA table_info(analyses_fts)")}
+    if 'analysis_uuid' not in columns:
+        return
+    cursor.execute("ALTER TABLE analyses_fts RENAME TO analyses_fts_old")
+    cursor.execute('''
+        CREATE VIRTUAL TABLE analyses_fts USING fts5 (
+            name,
+            texto_original,
+            nodes_text,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+    # Uma única passada sobre o índice antigo, com cada uuid resolvido por idx_analysis_uuid
+    cursor.execute('''
+        INSERT INTO analyses_fts (rowid, name, texto_original, nodes_text)
+        SELECT a.id, f.name, f.texto_original, f.nodes_text
+        FROM analyses_fts_old f JOIN analyses a ON a.analysis_uuid = f.analysis_uuid
+    ''')
+    cursor.execute("DROP TABLE analyses_fts_old")
+
+def _add_missing_columns(cursor: sqlite3.Cursor, table: str, columns: dict) -> None:
+    existing = {row['name'] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    for column, column_type in columns.items():
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+def hash_input_text(texto_entrada: str) -> str:
+    """Hash do texto normalizado (Unicode NFC, espaços colapsados): reenvios com diferenças só de espaçamento coincidem."""
+    normalized = re.sub(r'\s+', ' ', unicodedata.normalize('NFC', texto_entrada)).strip()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
 def insert_analysis(name: str, analysis_data: str) -> str:
-    conn = get_db_connection()
+    """
+    Grava uma análise. Se ela tiver texto_original, passa a ser a análise associada a esse texto (input_hash),
+    substituindo uma anterior do mesmo texto (e.g. reexecutada com force=1), que continua acessível pelo UUID.
+    """
+    conn = get_db_connection('insert_analysis')
     cursor = conn.cursor()
     new_uuid = str(uuid.uuid4())
     try:
+        analysis_dict = json.loads(analysis_data)
+    except ValueError as e:
+        print(f"Aviso: analysis_data da análise {new_uuid} não é JSON válido ({e}); grafo e visualização não pré-calculados.")
+        analysis_dict = None
+    texto_original = analysis_dict.get('texto_original') if isinstance(analysis_dict, dict) else None
+    input_hash = hash_input_text(texto_original) if isinstance(texto_original, str) and texto_original else None
+    try:
+        if input_hash:
+            cursor.execute("UPDATE analyses SET input_hash = NULL WHERE input_hash = ?", (input_hash,))
         cursor.execute(
-            "INSERT INTO analyses (analysis_uuid, name, analysis_data) VALUES (?, ?, ?)",
-            (new_uuid, name, analysis_data)
+            "INSERT INTO analyses (analysis_uuid, name, analysis_data, input_hash) VALUES (?, ?, ?, ?)",
+            (new_uuid, name, analysis_data, input_hash)
         )
+        analysis_id = cursor.lastrowid
+        if isinstance(analysis_dict, dict):
+            # Nós e arestas normalizados e índice de busca, na mesma transação da análise
+            _save_graph(cursor, analysis_id, analysis_dict)
+            _save_search_index(cursor, analysis_id, name, analysis_dict)
+            # A análise não muda depois de inserida: a visualização é calculada uma única vez, aqui
+            try:
+                _save_analysis_vis(cursor, new_uuid, montar_payload_vis(analysis_dict))
+            except (ValueError, TypeError, AttributeError) as e:
+                print(f"Aviso: visualização da análise {new_uuid} não pré-calculada ({e}); será calculada na leitura.")
+        _save_analysis_bodies(cursor, new_uuid, CORPO_DOWNLOAD, DOWNLOAD_VERSION, comprimir_variantes(analysis_data.encode('utf-8')))
         conn.commit()
     except sqlite3.Error as e:
         conn.rollback()
@@ -48,21 +445,681 @@ def insert_analysis(name: str, analysis_data: str) -> str:
     return new_uuid
 
 def get_analysis_by_uuid(analysis_uuid: str) -> sqlite3.Row:
-    conn = get_db_connection()
+    conn = get_db_connection('get_analysis_by_uuid')
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM analyses WHERE analysis_uuid = ?", (analysis_uuid,))
     analysis = cursor.fetchone()
     conn.close()
     return analysis
 
+def _save_graph(cursor: sqlite3.Cursor, analysis_id: int, analysis_data: dict) -> None:
+    """(Re)grava nas tabelas nodes/edges os elementos de uma análise."""
+    cursor.execute("DELETE FROM nodes WHERE analysis_id = ?", (analysis_id,))
+    cursor.execute("DELETE FROM edges WHERE analysis_id = ?", (analysis_id,))
+    cursor.executemany(
+        "INSERT INTO nodes (analysis_id, node_id, node_type, descricao, raciocinio, node_data) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (analysis_id, node.get('id'), node_type, node.get('descricao'), node.get('raciocinio'),
+             json.dumps(node, ensure_ascii=False))
+            for field, node_type in NODE_FIELDS.items()
+            for node in analysis_data.get(field) or []
+            if isinstance(node, dict)
+        ]
+    )
+    cursor.executemany(
+        "INSERT INTO edges (analysis_id, edge_id, edge_type, edge_function, source_node_id, target_node_id, raciocinio, edge_data) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (analysis_id, edge.get('id'), edge_type, edge.get(function_field) if function_field else None,
+             edge.get('id_origem_no'), edge.get('id_destino_no'), edge.get('raciocinio'),
+             json.dumps(edge, ensure_ascii=False))
+            for field, (edge_type, function_field) in EDGE_FIELDS.items()
+            for edge in analysis_data.get(field) or []
+            if isinstance(edge, dict)
+        ]
+    )
+
+def backfill_graph(batch_size: int = 500) -> int:
+    """
+    Popula nodes/edges para análises inseridas antes dessas tabelas (ou sem nenhum elemento gravado).
+    Processa em lotes, com um commit por lote. Retorna quantas análises foram migradas; as que não puderam
+    ser lidas são listadas num aviso e não entram na contagem.
+    """
+    processed, failed, last_id = 0, [], 0
+    while True:
+        conn = get_db_connection('backfill_graph')
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """
+                SELECT id, analysis_data FROM analyses a
+                WHERE id > ?
+                  AND NOT EXISTS (SELECT 1 FROM nodes n WHERE n.analysis_id = a.id)
+                  AND NOT EXISTS (SELECT 1 FROM edges e WHERE e.analysis_id = a.id)
+                ORDER BY id LIMIT ?
+                """,
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            for row in rows:
+                try:
+                    _save_graph(cursor, row['id'], json.loads(row['analysis_data']))
+                except (ValueError, AttributeError) as e:
+                    print(f"Aviso: análise {row['id']} ignorada no backfill ({e}).")
+                    failed.append(row['id'])
+                    continue
+                processed += 1
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            raise e
+        finally:
+            conn.close()
+        if not rows:
+            if failed:
+                print(f"Aviso: {len(failed)} análise(s) sem grafo normalizado: {', '.join(map(str, failed))}.")
+            return processed
+        last_id = rows[-1]['id']
+
+def backfill_input_hash(batch_size: int = 500) -> int:
+    """
+    Preenche input_hash das análises gravadas antes da deduplicação. Quando várias têm o mesmo texto, a mais
+    recente fica com o hash (as análises são percorridas da mais nova para a mais antiga).
+    Retorna quantas análises receberam o hash.
+    """
+    updated, last_id = 0, None
+    while True:
+        conn = get_db_connection('backfill_input_hash')
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """
+                SELECT id, json_extract(analysis_data, '$.texto_original') AS texto_original FROM analyses
+                WHERE (? IS NULL OR id < ?) AND input_hash IS NULL AND json_valid(analysis_data)
+                ORDER BY id DESC LIMIT ?
+                """,
+                (last_id, last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            for row in rows:
+                if not isinstance(row['texto_original'], str) or not row['texto_original']:
+                    continue
+                input_hash = hash_input_text(row['texto_original'])
+                cursor.execute(
+                    "UPDATE analyses SET input_hash = ? WHERE id = ? "
+                    "AND NOT EXISTS (SELECT 1 FROM analyses WHERE input_hash = ?)",
+                    (input_hash, row['id'], input_hash)
+                )
+                updated += cursor.rowcount
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            raise e
+        finally:
+            conn.close()
+        if not rows:
+            return updated
+        last_id = rows[-1]['id']
+
+def _save_search_index(cursor: sqlite3.Cursor, analysis_id: int, name: str, analysis_data: dict) -> None:
+    """Indexa uma análise que ainda não está em analyses_fts (rowid = analyses.id; ids nunca são reutilizados)."""
+    nodes_text = "\n".join(
+        text
+        for field in NODE_FIELDS
+        for node in analysis_data.get(field) or []
+        if isinstance(node, dict)
+        for text in (node.get('descricao'), node.get('raciocinio'))
+        if text
+    )
+    cursor.execute(
+        "INSERT INTO analyses_fts (rowid, name, texto_original, nodes_text) VALUES (?, ?, ?, ?)",
+        (analysis_id, name, analysis_data.get('texto_original') or '', nodes_text)
+    )
+
+def backfill_search_index(batch_size: int = 500) -> int:
+    """Indexa em analyses_fts as análises que ainda não estão no índice. Retorna quantas foram indexadas."""
+    processed, last_id = 0, 0
+    while True:
+        conn = get_db_connection('backfill_search_index')
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """
+                SELECT id, name, analysis_data FROM analyses a
+                WHERE id > ? AND NOT EXISTS (SELECT 1 FROM analyses_fts f WHERE f.rowid = a.id)
+                ORDER BY id LIMIT ?
+                """,
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            for row in rows:
+                try:
+                    _save_search_index(cursor, row['id'], row['name'], json.loads(row['analysis_data']))
+                except (ValueError, AttributeError) as e:
+                    print(f"Aviso: análise {row['id']} não indexada ({e}).")
+                    continue
+                processed += 1
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            raise e
+        finally:
+            conn.close()
+        if not rows:
+            return processed
+        last_id = rows[-1]['id']
+
+# Marcadores do trecho destacado em search_analyses (substituídos após escapar o texto, ver app.py)
+SNIPPET_START = '\x02'
+SNIPPET_END = '\x03'
+
+def _fts_query(query: str) -> str:
+    """Converte o texto digitado numa consulta FTS5 segura: todos os termos (entre aspas) devem ocorrer."""
+    terms = [term.replace('"', '""') for term in query.split()]
+    return " ".join(f'"{term}"' for term in terms)
+
+def search_analyses(query: str, limit: int, offset: int = 0) -> tuple:
+    """
+    Busca nas narrativas, nomes e nós das análises, ordenando por relevância (bm25; o nome pesa mais).
+    Retorna (linhas com analysis_uuid, name, created_at, snippet e score, total de resultados).
+    """
+    fts_query = _fts_query(query)
+    if not fts_query:
+        return [], 0
+    conn = get_db_connection('search_analyses')
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM analyses_fts WHERE analyses_fts MATCH ?", (fts_query,))
+        total = cursor.fetchone()[0]
+        cursor.execute(
+            """
+            SELECT a.analysis_uuid, a.name, a.created_at,
+                   snippet(analyses_fts, -1, ?, ?, '…', 16) AS snippet,
+                   bm25(analyses_fts, 10.0, 1.0, 2.0) AS score
+            FROM analyses_fts
+            JOIN analyses a ON a.id = analyses_fts.rowid
+            WHERE analyses_fts MATCH ?
+            ORDER BY score
+            LIMIT ? OFFSET ?
+            """,
+            (SNIPPET_START, SNIPPET_END, fts_query, limit, offset)
+        )
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+    return rows, total
+
+def _save_analysis_vis(cursor: sqlite3.Cursor, analysis_uuid: str, payload: dict) -> None:
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO analysis_vis
+            (analysis_uuid, vis_version, nodes_data, edges_data, timeline_data, texto_original, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """,
+        (analysis_uuid, payload['vis_version'], payload['nodes_data'], payload['edges_data'],
+         payload['timeline_data'], payload['texto_original'])
+    )
+
+def get_analysis_vis(analysis_uuid: str) -> Optional[dict]:
+    """
+    Retorna name, nodes_data, edges_data, timeline_data e texto_original de uma análise (None se não existir).
+    Lê apenas o payload pré-calculado; se ele faltar ou tiver outra VIS_VERSION, recalcula a partir de
+    analysis_data e grava o resultado.
+    """
+    conn = get_db_connection('get_analysis_vis')
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT a.name, v.vis_version, v.nodes_data, v.edges_data, v.timeline_data, v.texto_original
+            FROM analyses a LEFT JOIN analysis_vis v ON v.analysis_uuid = a.analysis_uuid
+            WHERE a.analysis_uuid = ?
+            """,
+            (analysis_uuid,)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        if row['vis_version'] == VIS_VERSION:
+            return dict(row)
+
+        cursor.execute("SELECT analysis_data FROM analyses WHERE analysis_uuid = ?", (analysis_uuid,))
+        payload = montar_payload_vis(json.loads(cursor.fetchone()['analysis_data']))
+        _save_analysis_vis(cursor, analysis_uuid, payload)
+        conn.commit()
+        return {"name": row['name'], **payload}
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+def _save_analysis_bodies(cursor: sqlite3.Cursor, analysis_uuid: str, kind: str, version: str, variants: dict) -> None:
+    cursor.executemany(
+        "INSERT OR REPLACE INTO analysis_bodies (analysis_uuid, kind, encoding, version, body) VALUES (?, ?, ?, ?, ?)",
+        [(analysis_uuid, kind, encoding, version, body) for encoding, body in variants.items()]
+    )
+
+def save_analysis_bodies(analysis_uuid: str, kind: str, version: str, variants: dict) -> None:
+    """Grava os corpos de resposta de uma análise ({encoding: bytes}), substituindo versões anteriores."""
+    conn = get_db_connection('save_analysis_bodies')
+    cursor = conn.cursor()
+    try:
+        _save_analysis_bodies(cursor, analysis_uuid, kind, version, variants)
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+def get_analysis_body(analysis_uuid: str, kind: str, encoding: str) -> Optional[sqlite3.Row]:
+    """
+    Retorna (name, version, body) do corpo gravado de uma análise; version e body são NULL se o corpo
+    ainda não foi gravado. Retorna None se a análise não existir.
+    """
+    conn = get_db_connection('get_analysis_body')
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT a.name, b.version, b.body
+        FROM analyses a
+        LEFT JOIN analysis_bodies b ON b.analysis_uuid = a.analysis_uuid AND b.kind = ? AND b.encoding = ?
+        WHERE a.analysis_uuid = ?
+        """,
+        (kind, encoding, analysis_uuid)
+    )
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+def count_analyses() -> int:
+    conn = get_db_connection('count_analyses')
+    cursor = conn.cursor()
+    cursor.execute("SELECT row_count FROM table_counts WHERE table_name = 'analyses'")
+    row = cursor.fetchone()
+    conn.close()
+    return row['row_count'] if row else 0
+
+def list_analyses(limit: int, after: Optional[tuple] = None) -> list:
+    """
+    Página de metadados das análises, das mais recentes para as mais antigas.
+    `after` é o (created_at, id) da última linha da página anterior (paginação por keyset sobre
+    idx_analyses_created): o custo não depende de quantas páginas já foram percorridas.
+    """
+    conn = get_db_connection('list_analyses')
+    cursor = conn.cursor()
+    if after is None:
+        cursor.execute(
+            "SELECT id, analysis_uuid, name, created_at FROM analyses "
+            "ORDER BY created_at DESC, id DESC LIMIT ?",
+            (limit,)
+        )
+    else:
+        cursor.execute(
+            "SELECT id, analysis_uuid, name, created_at FROM analyses "
+            "WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?",
+            (after[0], after[1], limit)
+        )
+    analyses = cursor.fetchall()
+    conn.close()
+    return analyses
+
 def get_all_analyses():
-    conn = get_db_connection()
+    conn = get_db_connection('get_all_analyses')
     cursor = conn.cursor()
     cursor.execute("SELECT id, analysis_uuid, name, created_at FROM analyses ORDER BY created_at DESC")
     analyses = cursor.fetchall()
     conn.close()
     return analyses
 
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+def enqueue_job(texto_entrada: str, force: bool = False) -> str:
+    """
+    Enfileira a análise de um texto e retorna o job_uuid. Textos iguais após normalização (hash_input_text):
+    - já analisados: o job é criado como 'done', apontando para a análise existente (a menos que `force`);
+    - com um job pendente ou em execução: retorna esse job, em vez de iniciar uma execução paralela.
+    """
+    conn = get_db_connection('enqueue_job')
+    cursor = conn.cursor()
+    new_uuid = str(uuid.uuid4())
+    input_hash = hash_input_text(texto_entrada)
+    try:
+        # BEGIN IMMEDIATE: a consulta e a inserção não se intercalam com as de outra submissão
+        cursor.execute("BEGIN IMMEDIATE")
+        existing = None
+        if not force:
+            cursor.execute("SELECT analysis_uuid FROM analyses WHERE input_hash = ?", (input_hash,))
+            existing = cursor.fetchone()
+        if existing is not None:
+            cursor.execute(
+                "INSERT INTO jobs (job_uuid, status, texto_entrada, analysis_uuid, input_hash) VALUES (?, ?, ?, ?, ?)",
+                (new_uuid, JOB_DONE, texto_entrada, existing['analysis_uuid'], input_hash)
+            )
+        else:
+            cursor.execute(
+                "SELECT job_uuid FROM jobs WHERE input_hash = ? AND status IN (?, ?)",
+                (input_hash, JOB_PENDING, JOB_RUNNING)
+            )
+            in_flight = cursor.fetchone()
+            if in_flight is not None:
+                new_uuid = in_flight['job_uuid']
+            else:
+                cursor.execute(
+                    "INSERT INTO jobs (job_uuid, status, texto_entrada, input_hash) VALUES (?, ?, ?, ?)",
+                    (new_uuid, JOB_PENDING, texto_entrada, input_hash)
+                )
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+    return new_uuid
+
+def claim_next_job() -> Optional[sqlite3.Row]:
+    """Marca o job pendente mais antigo como 'running' e o retorna (ou None se a fila estiver vazia)."""
+    conn = get_db_connection('claim_next_job')
+    cursor = conn.cursor()
+    try:
+        # BEGIN IMMEDIATE garante que dois workers não peguem o mesmo job
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (JOB_PENDING,))
+        job = cursor.fetchone()
+        if job is not None:
+            cursor.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (JOB_RUNNING, job['id'])
+            )
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+    return job
+
+def complete_job(job_uuid: str, analysis_uuid: str) -> None:
+    _update_job(job_uuid, JOB_DONE, analysis_uuid=analysis_uuid)
+
+def fail_job(job_uuid: str, error: str) -> None:
+    _update_job(job_uuid, JOB_FAILED, error=error)
+
+def heartbeat_job(job_uuid: str, attempt: int) -> bool:
+    """
+    Renova updated_at de um job em execução (worker.py, a cada config.WORKER_HEARTBEAT_SECONDS).
+    Retorna False se o job não está mais com esta tentativa (e.g. foi devolvido à fila e pego por outro worker).
+    """
+    conn = get_db_connection('heartbeat_job')
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "UPDATE jobs SET updated_at = CURRENT_TIMESTAMP WHERE job_uuid = ? AND status = ? AND attempts = ?",
+            (job_uuid, JOB_RUNNING, attempt)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+def requeue_stale_jobs(max_age_seconds: int) -> int:
+    """Devolve à fila jobs 'running' sem heartbeat há mais de max_age_seconds (worker que morreu no meio da análise)."""
+    conn = get_db_connection('requeue_stale_jobs')
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "UPDATE jobs SET status = ?, updated_at = CURRENT_TIMESTAMP "
+            "WHERE status = ? AND updated_at < datetime('now', ?)",
+            (JOB_PENDING, JOB_RUNNING, f'-{int(max_age_seconds)} seconds')
+        )
+        conn.commit()
+        count = cursor.rowcount
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+    return count
+
+def _update_job(job_uuid: str, status: str, analysis_uuid: Optional[str] = None, error: Optional[str] = None) -> None:
+    conn = get_db_connection('_update_job')
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "UPDATE jobs SET status = ?, analysis_uuid = ?, error = ?, updated_at = CURRENT_TIMESTAMP WHERE job_uuid = ?",
+            (status, analysis_uuid, error, job_uuid)
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+def get_job_by_uuid(job_uuid: str) -> Optional[sqlite3.Row]:
+    conn = get_db_connection('get_job_by_uuid')
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT job_uuid, status, analysis_uuid, error, attempts, created_at, updated_at FROM jobs WHERE job_uuid = ?",
+        (job_uuid,)
+    )
+    job = cursor.fetchone()
+    conn.close()
+    return job
+
+RUN_RUNNING = 'running'
+RUN_COMPLETE = 'complete'
+RUN_INCOMPLETE = 'incomplete'
+
+def create_run(texto_entrada: str, run_uuid: Optional[str] = None) -> str:
+    conn = get_db_connection('create_run')
+    cursor = conn.cursor()
+    new_uuid = run_uuid or str(uuid.uuid4())
+    try:
+        cursor.execute(
+            "INSERT INTO runs (run_uuid, status, texto_entrada) VALUES (?, ?, ?)",
+            (new_uuid, RUN_RUNNING, texto_entrada)
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+    return new_uuid
+
+def get_run(run_uuid: str) -> Optional[sqlite3.Row]:
+    conn = get_db_connection('get_run')
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM runs WHERE run_uuid = ?", (run_uuid,))
+    run = cursor.fetchone()
+    conn.close()
+    return run
+
+def update_run_status(run_uuid: str, status: str) -> None:
+    conn = get_db_connection('update_run_status')
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "UPDATE runs SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE run_uuid = ?",
+            (status, run_uuid)
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+def save_run_stage(
+    run_uuid: str,
+    stage_name: str,
+    response_data: Optional[str],
+    network_data: str,
+    duration_s: Optional[float] = None,
+    summary: Optional[str] = None,
+    vis_delta: Optional[str] = None
+) -> None:
+    """`vis_delta`: nodes/edges de vis.js novos ou alterados nesta etapa (JSON), lidos pelo stream de progresso."""
+    conn = get_db_connection('save_run_stage')
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO run_stages (run_uuid, stage_name, response_data, network_data, duration_s, summary, vis_delta) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (run_uuid, stage_name, response_data, network_data, duration_s, summary, vis_delta)
+        )
+        cursor.execute("DELETE FROM run_progress WHERE run_uuid = ? AND stage_name = ?", (run_uuid, stage_name))
+        cursor.execute("UPDATE runs SET updated_at = CURRENT_TIMESTAMP WHERE run_uuid = ?", (run_uuid,))
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+def save_run_progress(run_uuid: str, stage_name: str, elements: str) -> None:
+    """
+    Grava a contagem de elementos já recebidos ({campo: n}, JSON) de uma etapa em andamento.
+    Ignorada se a etapa já foi gravada por save_run_stage (gravação atrasada, e.g. feita numa thread por analisar_async).
+    """
+    conn = get_db_connection('save_run_progress')
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO run_progress (run_uuid, stage_name, elements) SELECT ?, ?, ? "
+            "WHERE NOT EXISTS (SELECT 1 FROM run_stages WHERE run_uuid = ? AND stage_name = ?) "
+            "ON CONFLICT (run_uuid, stage_name) DO UPDATE SET elements = excluded.elements, updated_at = CURRENT_TIMESTAMP",
+            (run_uuid, stage_name, elements, run_uuid, stage_name)
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+def get_run_progress(run_uuid: str) -> list:
+    """Etapas em andamento de uma execução com os elementos já recebidos (ver save_run_progress)."""
+    conn = get_db_connection('get_run_progress')
+    cursor = conn.cursor()
+    cursor.execute("SELECT stage_name, elements FROM run_progress WHERE run_uuid = ? ORDER BY stage_name", (run_uuid,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def save_run_metrics(run_uuid: str, stage_metrics: list) -> None:
+    """Grava as medições das etapas de uma execução (dicts de metricas.MedicaoEtapa.para_dict) numa transação."""
+    conn = get_db_connection('save_run_metrics')
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(
+            "INSERT INTO run_metrics (run_uuid, stage_name, status, duration_s, llm_s, llm_calls, failures, "
+            "prompt_chars, response_chars, tokens, cache_hits, elements) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    run_uuid, m['etapa'], m['status'], m['duracao_s'], m['llm_s'], m['chamadas_llm'],
+                    json.dumps(m['falhas']), m['prompt_caracteres'], m['resposta_caracteres'], m['tokens'],
+                    m['cache_acertos'], json.dumps(m['elementos'])
+                )
+                for m in stage_metrics
+            ]
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+def get_run_metrics(run_uuid: str) -> list:
+    """Medições gravadas por save_run_metrics, na ordem em que as etapas terminaram."""
+    conn = get_db_connection('get_run_metrics')
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM run_metrics WHERE run_uuid = ? ORDER BY id", (run_uuid,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def prune_completed_runs(max_age_seconds: int) -> int:
+    """
+    Apaga as etapas (run_stages, run_progress) de execuções concluídas há mais de max_age_seconds.
+    A linha em runs fica: chamar analisar() de novo com o mesmo run_uuid refaz a execução do início.
+    Execuções incompletas mantêm as etapas para serem retomadas. Retorna o número de etapas apagadas.
+    """
+    conn = get_db_connection('prune_completed_runs')
+    cursor = conn.cursor()
+    try:
+        concluidas = "SELECT run_uuid FROM runs WHERE status = ? AND updated_at < datetime('now', ?)"
+        parametros = (RUN_COMPLETE, f'-{int(max_age_seconds)} seconds')
+        cursor.execute(f"DELETE FROM run_stages WHERE run_uuid IN ({concluidas})", parametros)
+        count = cursor.rowcount
+        cursor.execute(f"DELETE FROM run_progress WHERE run_uuid IN ({concluidas})", parametros)
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+    return count
+
+def get_run_stages(run_uuid: str) -> list:
+    """Etapas concluídas de uma execução, na ordem em que foram gravadas."""
+    conn = get_db_connection('get_run_stages')
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM run_stages WHERE run_uuid = ? ORDER BY id", (run_uuid,))
+    stages = cursor.fetchall()
+    conn.close()
+    return stages
+
+def get_run_stages_after(run_uuid: str, after_id: int = 0) -> list:
+    """
+    Etapas gravadas depois da etapa `after_id` (id de run_stages), para acompanhar uma execução em andamento.
+    network_data só é lido para etapas gravadas sem vis_delta (antes da coluna existir).
+    """
+    conn = get_db_connection('get_run_stages_after')
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, stage_name, vis_delta, CASE WHEN vis_delta IS NULL THEN network_data END AS network_data, "
+        "duration_s, summary, completed_at FROM run_stages "
+        "WHERE run_uuid = ? AND id > ? ORDER BY id",
+        (run_uuid, after_id)
+    )
+    stages = cursor.fetchall()
+    conn.close()
+    return stages
+
+def retry_job(job_uuid: str) -> bool:
+    """
+    Devolve um job que falhou à fila; o worker retoma a execução a partir do último checkpoint.
+    Retorna False se o job não está em falha ou se outro job do mesmo texto já está em andamento.
+    """
+    conn = get_db_connection('retry_job')
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "UPDATE jobs SET status = ?, error = NULL, updated_at = CURRENT_TIMESTAMP WHERE job_uuid = ? AND status = ?",
+            (JOB_PENDING, job_uuid, JOB_FAILED)
+        )
+        conn.commit()
+        requeued = cursor.rowcount > 0
+    except sqlite3.IntegrityError: # idx_jobs_input_hash_in_flight
+        conn.rollback()
+        requeued = False
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+    return requeued
+
 def add_examples() -> list[str]:
     examples: list[str] = [
         os.path.join('static', 'json', 'usuário_da_ferramenta.json'),
@@ -83,10 +1140,26 @@ def add_examples() -> list[str]:
     return ids
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Inicializa o banco de análises.")
+    parser.add_argument("--backfill-graph", action="store_true", help="Popula as tabelas nodes/edges para as análises existentes e sai.")
+    parser.add_argument("--backfill-search", action="store_true", help="Indexa as análises existentes para a busca textual e sai.")
+    parser.add_argument("--backfill-hash", action="store_true", help="Calcula o hash do texto das análises existentes (deduplicação) e sai.")
+    args = parser.parse_args()
+
     # This will initialize the database and table if the script is run directly
     init_db()
     print(f"Database '{DATABASE_NAME}' initialized and 'analyses' table created/verified.")
 
+    if args.backfill_graph:
+        print(f"Grafo normalizado gravado para {backfill_graph()} análise(s).")
+    if args.backfill_search:
+        print(f"Índice de busca atualizado para {backfill_search_index()} análise(s).")
+    if args.backfill_hash:
+        print(f"Hash do texto gravado para {backfill_input_hash()} análise(s).")
+    if args.backfill_graph or args.backfill_search or args.backfill_hash:
+        raise SystemExit(0)
+
     # Example usage (optional, for testing)
     #try:
     print(add_examples())
@@ -0,0 +1,158 @@
+# fragmentos.py
+# Modo por fragmentos para narrativas longas (ver extrair_por_fragmentos em analysis.py): o texto é dividido em
+# trechos sobrepostos, as etapas iniciais rodam em cada trecho e as redes parciais são reconciliadas numa só.
+# Cada fragmento numera seus elementos do zero (S1, AC1, E1...), então a reconciliação renumera os IDs e une
+# as entidades repetidas entre fragmentos.
+from typing import Dict, FrozenSet, List, Optional, Tuple
+import logging
+import re
+import unicodedata
+import config
+from grafo import GrafoRede, CAMPOS_NOS, CAMPOS_ARESTAS, MODELOS_POR_CAMPO
+
+logger = logging.getLogger(__name__)
+
+# Fronteiras para cortar o texto, da melhor para a pior. O fim de um fragmento prefere parágrafos; o início do
+# seguinte, a primeira frase da sobreposição (um parágrafo costuma estar longe demais).
+_FRONTEIRAS = (('\n\n',), ('\n', '. ', '! ', '? ', '… '), (' ',))
+_FRONTEIRAS_INICIO = (('\n', '. ', '! ', '? ', '… '), (' ',))
+_ID_NUMERADO = re.compile(r'^(.*?)(\d+)$')
+
+def _recuar_ate_fronteira(texto: str, pos: int, limite: int) -> int:
+    """Última fronteira em texto[limite:pos] (posição logo após ela), ou `pos` se não houver nenhuma."""
+    for separadores in _FRONTEIRAS:
+        encontrados = [texto.rfind(sep, limite, pos) for sep in separadores]
+        melhor = max(((i, sep) for i, sep in zip(encontrados, separadores) if i != -1), default=None)
+        if melhor is not None:
+            return melhor[0] + len(melhor[1])
+    return pos
+
+def _avancar_ate_fronteira(texto: str, pos: int, limite: int) -> int:
+    """Primeira fronteira em texto[pos:limite] (posição logo após ela), ou `pos` se não houver nenhuma."""
+    for separadores in _FRONTEIRAS_INICIO:
+        encontrados = [(i, sep) for sep in separadores if (i := texto.find(sep, pos, limite - len(sep))) != -1]
+        if encontrados:
+            i, sep = min(encontrados)
+            return i + len(sep)
+    return pos
+
+def dividir_texto(
+    texto: str,
+    tamanho: int = config.FRAGMENTO_CARACTERES,
+    sobreposicao: int = config.FRAGMENTO_SOBREPOSICAO
+) -> List[str]:
+    """
+    Divide o texto em fragmentos de até `tamanho` caracteres, cortando em parágrafos ou frases sempre que possível.
+    Fragmentos vizinhos compartilham cerca de `sobreposicao` caracteres, para que eventos na fronteira
+    apareçam inteiros em pelo menos um deles.
+    """
+    if len(texto) <= tamanho:
+        return [texto]
+    fragmentos = []
+    inicio = 0
+    while True:
+        fim = inicio + tamanho
+        if fim >= len(texto):
+            fragmentos.append(texto[inicio:])
+            return fragmentos
+        fim = _recuar_ate_fronteira(texto, fim, inicio + tamanho // 2)
+        fragmentos.append(texto[inicio:fim])
+        proximo = _avancar_ate_fronteira(texto, max(fim - sobreposicao, inicio + 1), fim)
+        inicio = proximo if proximo < fim else max(fim - sobreposicao, inicio + 1)
+
+def _normalizar(descricao: Optional[str]) -> str:
+    sem_acentos = unicodedata.normalize('NFKD', descricao or '').encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(re.findall(r'\w+', sem_acentos.casefold()))
+
+def _similaridade(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def _chave_aresta(campo: str, aresta) -> tuple:
+    tipo = getattr(aresta, 'tipo_temporalidade', None)
+    return (campo, aresta.id_origem_no, aresta.id_destino_no, getattr(tipo, 'value', tipo))
+
+class ReconciliadorFragmentos:
+    """
+    Incorpora as redes dos fragmentos, na ordem do texto, numa rede de destino.
+    - Sujeitos com a mesma descrição normalizada são o mesmo sujeito em qualquer fragmento.
+    - Ações e estímulos só são unidos aos do fragmento anterior (a sobreposição) quando as descrições têm
+      similaridade >= `similaridade_minima`; comparar com o texto todo uniria episódios que se repetem de fato.
+    - Arestas têm as pontas remapeadas; arestas repetidas (mesmo tipo e pontas) são descartadas.
+    Os IDs novos mantêm o prefixo do original e continuam a numeração da rede de destino (S1, S2...).
+    """
+    def __init__(self, destino: GrafoRede, similaridade_minima: float = config.FRAGMENTO_SIMILARIDADE_MINIMA):
+        self.destino = destino
+        self.similaridade_minima = similaridade_minima
+        self.duplicados = 0
+        self.arestas_descartadas = 0
+        self._contadores: Dict[str, int] = {}
+        for campo in MODELOS_POR_CAMPO:
+            for elemento_id in destino.ids(campo):
+                self._reservar(elemento_id)
+        self._sujeitos = {_normalizar(s.descricao): s.id for s in destino.lista('sujeitos')}
+        self._chaves_arestas = {
+            _chave_aresta(campo, aresta) for campo in CAMPOS_ARESTAS for aresta in destino.lista(campo)
+        }
+        # campo -> (tokens da descrição, id na rede de destino) dos nós do último fragmento incorporado
+        self._anteriores: Dict[str, List[Tuple[FrozenSet[str], str]]] = {}
+
+    def _reservar(self, elemento_id: str) -> None:
+        match = _ID_NUMERADO.match(elemento_id)
+        if match:
+            prefixo, numero = match.group(1), int(match.group(2))
+            self._contadores[prefixo] = max(self._contadores.get(prefixo, 0), numero)
+
+    def _novo_id(self, id_original: str) -> str:
+        match = _ID_NUMERADO.match(id_original)
+        prefixo = match.group(1) if match else f"{id_original}_"
+        self._contadores[prefixo] = self._contadores.get(prefixo, 0) + 1
+        return f"{prefixo}{self._contadores[prefixo]}"
+
+    def _equivalente(self, campo: str, no, tokens: FrozenSet[str]) -> Optional[str]:
+        if campo == 'sujeitos':
+            return self._sujeitos.get(_normalizar(no.descricao))
+        melhor_id, melhor = None, self.similaridade_minima
+        for tokens_anterior, anterior_id in self._anteriores.get(campo, ()):
+            similaridade = _similaridade(tokens, tokens_anterior)
+            if similaridade >= melhor:
+                melhor_id, melhor = anterior_id, similaridade
+        return melhor_id
+
+    def incorporar(self, fragmento: GrafoRede) -> None:
+        mapa: Dict[str, str] = {}
+        atuais: Dict[str, List[Tuple[FrozenSet[str], str]]] = {}
+        for campo in CAMPOS_NOS:
+            novos = []
+            for no in fragmento.lista(campo):
+                tokens = frozenset(_normalizar(no.descricao).split())
+                existente = self._equivalente(campo, no, tokens)
+                if existente is not None:
+                    mapa[no.id] = existente
+                    self.duplicados += 1
+                else:
+                    mapa[no.id] = self._novo_id(no.id)
+                    novos.append(no.model_copy(update={'id': mapa[no.id]}))
+                    if campo == 'sujeitos':
+                        self._sujeitos[_normalizar(no.descricao)] = mapa[no.id]
+                atuais.setdefault(campo, []).append((tokens, mapa[no.id]))
+            self.destino.inserir(campo, novos)
+
+        for campo in CAMPOS_ARESTAS:
+            novas = []
+            for aresta in fragmento.lista(campo):
+                origem, destino = mapa.get(aresta.id_origem_no), mapa.get(aresta.id_destino_no)
+                if origem is None or destino is None:
+                    logger.warning(f"Aresta {aresta.id} ({campo}) aponta para nó inexistente no fragmento; descartada.")
+                    self.arestas_descartadas += 1
+                    continue
+                remapeada = aresta.model_copy(update={'id_origem_no': origem, 'id_destino_no': destino})
+                chave = _chave_aresta(campo, remapeada)
+                if chave in self._chaves_arestas:
+                    self.duplicados += 1
+                    continue
+                self._chaves_arestas.add(chave)
+                novas.append(remapeada.model_copy(update={'id': self._novo_id(aresta.id)}))
+            self.destino.inserir(campo, novas)
+        self._anteriores = atuais
@@ -0,0 +1,252 @@
+# grafo.py
+# Estrutura de trabalho da rede durante o pipeline (analysis.py / scheduler.py).
+# Em vez das listas de RedeContingencialOutput, mantém um dicionário id -> elemento por campo, listas de
+# adjacência por tipo de aresta e um índice das relações temporais por tipo_temporalidade. Mesclar k elementos
+# custa O(k) e os context builders consultam os índices diretamente; a RedeContingencialOutput só é montada
+# em para_rede(). Cada elemento é serializado (model_dump) uma única vez, até ser substituído por uma mescla;
+# os contextos das etapas e o resultado final (para_dict) reutilizam esses dicts.
+from typing import Any, Dict, Iterable, List, Optional, Type, get_args
+from contextlib import contextmanager
+from pydantic import BaseModel, ValidationError
+import logging
+import tracing
+from output_schemas import RedeContingencialOutput, NoBase, ArestaBase
+
+logger = logging.getLogger(__name__)
+
+# Campo da rede -> modelo dos seus elementos (e.g. 'sujeitos' -> NoSujeito)
+MODELOS_POR_CAMPO: Dict[str, Type[BaseModel]] = {
+    campo: get_args(info.annotation)[0]
+    for campo, info in RedeContingencialOutput.model_fields.items()
+    if campo != 'timeline'
+}
+CAMPOS_NOS = tuple(c for c, m in MODELOS_POR_CAMPO.items() if issubclass(m, NoBase))
+CAMPOS_ARESTAS = tuple(c for c, m in MODELOS_POR_CAMPO.items() if issubclass(m, ArestaBase))
+
+class GrafoRede:
+    """
+    Rede contingencial indexada. Os elementos são modelos Pydantic já validados e nunca alterados no lugar
+    (uma atualização substitui o elemento), por isso copiar() só copia os índices.
+    A ordem de cada campo é a ordem de inserção; atualizar um elemento mantém a sua posição.
+    """
+    def __init__(self):
+        self._elementos: Dict[str, Dict[str, BaseModel]] = {campo: {} for campo in MODELOS_POR_CAMPO}
+        self._posicao: Dict[str, Dict[str, int]] = {campo: {} for campo in MODELOS_POR_CAMPO}
+        # campo de aresta -> id do nó -> ids das arestas (dict como conjunto ordenado)
+        self._saindo: Dict[str, Dict[str, Dict[str, None]]] = {campo: {} for campo in CAMPOS_ARESTAS}
+        self._chegando: Dict[str, Dict[str, Dict[str, None]]] = {campo: {} for campo in CAMPOS_ARESTAS}
+        # tipo_temporalidade -> ids das relações temporais
+        self._temporais_por_tipo: Dict[str, Dict[str, None]] = {}
+        # campo -> id -> model_dump(mode='json', exclude_none=True) do elemento atual (preenchido sob demanda)
+        self._dumps: Dict[str, Dict[str, dict]] = {campo: {} for campo in MODELOS_POR_CAMPO}
+        # campo -> ids inseridos ou substituídos desde a criação ou a cópia (lidos por mesclar_alteracoes)
+        self._alterados: Dict[str, Dict[str, None]] = {campo: {} for campo in MODELOS_POR_CAMPO}
+        # campo -> atributos deixados de fora por dumps() enquanto o contexto de uma etapa é montado (omitindo())
+        self._omitir: Dict[str, frozenset] = {}
+        self.timeline: List[str] = []
+
+    # --- Conversão ---
+
+    @classmethod
+    def de_rede(cls, rede: RedeContingencialOutput) -> 'GrafoRede':
+        grafo = cls()
+        for campo in MODELOS_POR_CAMPO:
+            grafo.inserir(campo, getattr(rede, campo))
+        grafo.timeline = list(rede.timeline)
+        return grafo
+
+    def para_dict(self, excluir: Iterable[str] = ()) -> Dict[str, Any]:
+        """
+        Equivalente a json.loads(para_rede().model_dump_json(exclude_none=True, exclude=excluir)),
+        montado a partir dos dicts já serializados. Os dicts dos elementos são compartilhados com o grafo.
+        """
+        excluir = frozenset(excluir)
+        resultado: Dict[str, Any] = {campo: self.dumps(campo) for campo in MODELOS_POR_CAMPO if campo not in excluir}
+        if 'timeline' not in excluir:
+            resultado['timeline'] = list(self.timeline)
+        return resultado
+
+    def para_rede(self) -> RedeContingencialOutput:
+        # Os elementos já foram validados na mescla
+        return RedeContingencialOutput.model_construct(
+            **{campo: list(elementos.values()) for campo, elementos in self._elementos.items()},
+            timeline=list(self.timeline)
+        )
+
+    def copiar(self) -> 'GrafoRede':
+        """Cópia independente dos índices; as alterações registradas na cópia começam vazias."""
+        copia = GrafoRede.__new__(GrafoRede)
+        copia._elementos = {campo: dict(d) for campo, d in self._elementos.items()}
+        copia._posicao = {campo: dict(d) for campo, d in self._posicao.items()}
+        copia._saindo = {campo: {no: dict(ids) for no, ids in d.items()} for campo, d in self._saindo.items()}
+        copia._chegando = {campo: {no: dict(ids) for no, ids in d.items()} for campo, d in self._chegando.items()}
+        copia._temporais_por_tipo = {tipo: dict(ids) for tipo, ids in self._temporais_por_tipo.items()}
+        copia._dumps = {campo: dict(d) for campo, d in self._dumps.items()}
+        copia._alterados = {campo: {} for campo in MODELOS_POR_CAMPO}
+        copia._omitir = {}
+        copia.timeline = list(self.timeline)
+        return copia
+
+    # --- Escrita ---
+
+    def inserir(self, campo: str, elementos: Iterable[BaseModel]) -> None:
+        """Insere ou substitui (pelo id) elementos já validados."""
+        atuais = self._elementos[campo]
+        posicoes = self._posicao[campo]
+        dumps = self._dumps[campo]
+        alterados = self._alterados[campo]
+        for elemento in elementos:
+            elemento_id = elemento.id
+            anterior = atuais.get(elemento_id)
+            if anterior is not None:
+                self._desindexar(campo, anterior)
+                dumps.pop(elemento_id, None)
+            else:
+                posicoes[elemento_id] = len(posicoes)
+            atuais[elemento_id] = elemento
+            alterados[elemento_id] = None
+            self._indexar(campo, elemento)
+
+    @tracing.rastrear(argumentos=('campo',))
+    def mesclar(self, campo: str, novos_dados: Optional[List[dict]]) -> None:
+        """Valida os dicts retornados pela API e os mescla por id (atualiza existentes, adiciona novos)."""
+        if not novos_dados:
+            return
+        modelo = MODELOS_POR_CAMPO[campo]
+        validos = []
+        for data in novos_dados:
+            try:
+                validos.append(modelo(**data))
+            except ValidationError as e:
+                logger.warning(f"Erro de validação ao processar {modelo.__name__} com dados {data}: {e}")
+            except Exception as e:
+                logger.error(f"Erro inesperado ao mesclar {modelo.__name__} com dados {data}: {e}")
+        self.inserir(campo, validos)
+
+    @tracing.rastrear(argumentos=('campo',))
+    def mesclar_alteracoes(self, campo: str, resultado: 'GrafoRede', snapshot: 'GrafoRede') -> None:
+        """
+        Aplica os elementos de `campo` que uma etapa, rodando sobre `snapshot` (resultado = snapshot.copiar()),
+        criou ou alterou em `resultado`. Só os ids registrados pela cópia são visitados: O(k) para k alterações.
+        Se uma etapa anterior da mesma onda já alterou o elemento (e.g. antecedentes e consequentes refinando o
+        mesmo nó), a mescla é feita por atributo contra o `snapshot` (_mesclar_atributos), em vez de substituí-lo.
+        """
+        originais = snapshot._elementos[campo]
+        elementos_resultado = resultado._elementos[campo]
+        atuais = self._elementos[campo]
+        alterados, reaproveitar_dump = [], []
+        for elemento_id in resultado._alterados[campo]:
+            elemento = elementos_resultado[elemento_id]
+            original = originais.get(elemento_id)
+            if original is elemento or original == elemento:
+                continue # Inalterado pela etapa
+            atual = atuais.get(elemento_id)
+            if original is not None and atual is not None and atual is not original and atual != original:
+                elemento = _mesclar_atributos(original, atual, elemento)
+            else:
+                reaproveitar_dump.append(elemento_id)
+            alterados.append(elemento)
+        self.inserir(campo, alterados)
+        dumps, dumps_resultado = self._dumps[campo], resultado._dumps[campo]
+        for elemento_id in reaproveitar_dump:
+            if elemento_id in dumps_resultado: # Já serializado pela etapa
+                dumps[elemento_id] = dumps_resultado[elemento_id]
+
+    def _indexar(self, campo: str, elemento: BaseModel) -> None:
+        if campo not in self._saindo:
+            return
+        self._saindo[campo].setdefault(elemento.id_origem_no, {})[elemento.id] = None
+        self._chegando[campo].setdefault(elemento.id_destino_no, {})[elemento.id] = None
+        if campo == 'relacoes_temporais':
+            self._temporais_por_tipo.setdefault(_tipo_temporalidade(elemento), {})[elemento.id] = None
+
+    def _desindexar(self, campo: str, elemento: BaseModel) -> None:
+        if campo not in self._saindo:
+            return
+        self._saindo[campo].get(elemento.id_origem_no, {}).pop(elemento.id, None)
+        self._chegando[campo].get(elemento.id_destino_no, {}).pop(elemento.id, None)
+        if campo == 'relacoes_temporais':
+            self._temporais_por_tipo.get(_tipo_temporalidade(elemento), {}).pop(elemento.id, None)
+
+    # --- Consulta ---
+
+    @contextmanager
+    def omitindo(self, atributos: Iterable[str], campos: Iterable[str]):
+        """
+        Dentro do bloco, dumps() e para_dict() devolvem os elementos de `campos` sem os `atributos`
+        (e.g. o 'raciocinio' dos campos que uma etapa só lê, ao montar o seu contexto).
+        """
+        anterior = self._omitir
+        atributos = frozenset(atributos)
+        self._omitir = {campo: atributos for campo in campos} if atributos else {}
+        try:
+            yield self
+        finally:
+            self._omitir = anterior
+
+    def lista(self, campo: str) -> List[BaseModel]:
+        return list(self._elementos[campo].values())
+
+    def dumps(self, campo: str, elementos: Optional[Iterable[BaseModel]] = None) -> List[dict]:
+        """
+        Elementos de `campo` (todos, ou os `elementos` dados, e.g. de selecionar()) serializados como em
+        model_dump(mode='json', exclude_none=True). Os dicts são reutilizados entre etapas: não os altere.
+        """
+        cache = self._dumps[campo]
+        omitir = self._omitir.get(campo)
+        resultado = []
+        for elemento in self._elementos[campo].values() if elementos is None else elementos:
+            dump = cache.get(elemento.id)
+            if dump is None:
+                dump = cache[elemento.id] = elemento.model_dump(mode='json', exclude_none=True)
+            resultado.append({k: v for k, v in dump.items() if k not in omitir} if omitir else dump)
+        return resultado
+
+    def total(self, campo: str) -> int:
+        return len(self._elementos[campo])
+
+    def ids(self, campo: str) -> List[str]:
+        return list(self._elementos[campo])
+
+    def obter(self, campo: str, elemento_id: str) -> Optional[BaseModel]:
+        return self._elementos[campo].get(elemento_id)
+
+    def selecionar(self, campo: str, ids: Iterable[str]) -> List[BaseModel]:
+        """Elementos de `campo` com os ids dados, na ordem do campo."""
+        elementos = self._elementos[campo]
+        posicoes = self._posicao[campo]
+        encontrados = sorted({i for i in ids if i in elementos}, key=posicoes.__getitem__)
+        return [elementos[i] for i in encontrados]
+
+    def saindo(self, campo: str, no_id: str) -> List[BaseModel]:
+        """Arestas de `campo` com origem no nó `no_id`."""
+        return self.selecionar(campo, self._saindo[campo].get(no_id, ()))
+
+    def chegando(self, campo: str, no_id: str) -> List[BaseModel]:
+        """Arestas de `campo` com destino no nó `no_id`."""
+        return self.selecionar(campo, self._chegando[campo].get(no_id, ()))
+
+    def relacoes_temporais(self, tipo_temporalidade: str) -> List[BaseModel]:
+        """Relações temporais de um tipo (e.g. 'PRECEDE_IMEDIATAMENTE'), na ordem do campo."""
+        return self.selecionar('relacoes_temporais', self._temporais_por_tipo.get(tipo_temporalidade, ()))
+
+def _mesclar_atributos(original: BaseModel, atual: BaseModel, novo: BaseModel) -> BaseModel:
+    """
+    Mescla de três vias de um elemento alterado por duas etapas da mesma onda: `atual` (já com a etapa anterior)
+    recebe os atributos que `novo` mudou em relação a `original`. Uma lista mudada pelas duas etapas fica com a
+    união (na ordem da anterior); outro atributo mudado pelas duas fica com o valor da etapa posterior.
+    """
+    atualizacao = {}
+    for nome in type(novo).model_fields:
+        valor_original, valor_novo = getattr(original, nome), getattr(novo, nome)
+        if valor_novo == valor_original:
+            continue
+        valor_atual = getattr(atual, nome)
+        if valor_atual != valor_original and isinstance(valor_atual, list) and isinstance(valor_novo, list):
+            valor_novo = valor_atual + [item for item in valor_novo if item not in valor_atual]
+        atualizacao[nome] = valor_novo
+    return atual.model_copy(update=atualizacao)
+
+def _tipo_temporalidade(relacao: BaseModel) -> str:
+    tipo = relacao.tipo_temporalidade
+    return getattr(tipo, 'value', tipo)
@@ -0,0 +1,45 @@
+# http_cache.py
+# Variantes pré-comprimidas e ETags das respostas de análises (downloads e páginas de visualização).
+# Uma análise não muda depois de inserida, então cada corpo é comprimido uma única vez e gravado
+# em analysis_bodies (db.py); o ETag deriva do UUID, do tipo de corpo e da sua versão.
+from typing import Dict, Iterable, Optional
+import gzip
+
+try:
+    import brotli # Opcional: sem o pacote, apenas gzip é oferecido
+except ImportError:
+    brotli = None
+
+ENCODING_IDENTITY = 'identity'
+ENCODINGS_SUPORTADOS = ('br', 'gzip') if brotli is not None else ('gzip',) # Ordem de preferência
+
+# Tipos de corpo gravados por análise
+CORPO_DOWNLOAD = 'download'
+CORPO_VIEW = 'view'
+
+# Versão do corpo de download (o próprio analysis_data). Incremente se o formato do download mudar.
+DOWNLOAD_VERSION = '1'
+
+def comprimir(corpo: bytes, encoding: str) -> bytes:
+    # Nível máximo: a compressão é feita uma vez por análise, não por requisição
+    if encoding == 'br':
+        return brotli.compress(corpo, quality=11)
+    if encoding == 'gzip':
+        return gzip.compress(corpo, compresslevel=9, mtime=0) # mtime fixo: mesma entrada, mesmos bytes
+    return corpo
+
+def comprimir_variantes(corpo: bytes, encodings: Iterable[str] = ENCODINGS_SUPORTADOS) -> Dict[str, bytes]:
+    return {encoding: comprimir(corpo, encoding) for encoding in encodings}
+
+def escolher_encoding(accept_encodings) -> str:
+    """Melhor encoding suportado segundo o Accept-Encoding (werkzeug request.accept_encodings)."""
+    melhor = accept_encodings.best_match(ENCODINGS_SUPORTADOS)
+    return melhor or ENCODING_IDENTITY
+
+def etag(analysis_uuid: str, corpo: str, versao: str, encoding: Optional[str] = ENCODING_IDENTITY) -> str:
+    """ETag forte (sem aspas); cada encoding é uma representação distinta e tem o seu próprio ETag."""
+    base = f"{analysis_uuid}-{corpo}-{versao}"
+    return base if encoding in (None, ENCODING_IDENTITY) else f"{base}-{encoding}"
+
+def etags_possiveis(analysis_uuid: str, corpo: str, versao: str):
+    return [etag(analysis_uuid, corpo, versao, e) for e in (ENCODING_IDENTITY, *ENCODINGS_SUPORTADOS)]
@@ -0,0 +1,197 @@
+# json_incremental.py
+# Parser de JSON incremental para respostas em streaming (ver _make_api_call em llm_inference.py).
+# Recebe o texto em pedaços, detecta erros de estrutura assim que aparecem (sem esperar o fim da resposta)
+# e entrega cada elemento completo das listas do objeto raiz, e.g. ("acoes_comportamentos", {...}).
+from typing import Callable, List, Optional
+import json
+import re
+
+class ErroJSONIncremental(ValueError):
+    def __init__(self, mensagem: str, posicao: int):
+        super().__init__(f"{mensagem} (posição {posicao})")
+        self.posicao = posicao
+
+_ESPACOS = ' \t\n\r'
+_INICIO_ESCALAR = frozenset('-0123456789tfn')
+_CHARS_ESCALAR = frozenset('+-.0123456789eEtrufalsn') # Números e as letras de true/false/null
+_CORPO_STRING = re.compile(r'[^"\\\x00-\x1f]*')
+
+class _Container:
+    __slots__ = ('tipo', 'estado', 'chave', 'inicio_elemento')
+
+    def __init__(self, tipo: str, estado: str, chave: Optional[str] = None):
+        self.tipo = tipo
+        self.estado = estado
+        self.chave = chave # No objeto raiz: última chave lida; numa lista do objeto raiz: a chave da lista
+        self.inicio_elemento: Optional[int] = None
+
+class ParserIncremental:
+    """
+    Uso:
+        parser = ParserIncremental(ao_elemento=lambda chave, elemento: ...)
+        for pedaco in stream: parser.alimentar(pedaco)   # ErroJSONIncremental ao primeiro erro de estrutura
+        texto_json = parser.finalizar()                  # ErroJSONIncremental se o JSON estiver incompleto
+    Cercas de markdown (```json ... ```) em volta do valor são ignoradas, como em _interpretar_resposta.
+    Exceções levantadas por `ao_elemento` interrompem o parse e são propagadas (e.g. para abortar o stream).
+    """
+    def __init__(self, ao_elemento: Optional[Callable[[str, object], None]] = None):
+        self._ao_elemento = ao_elemento
+        self._texto = ""
+        self._pos = 0
+        self._pilha: List[_Container] = []
+        self._estado_raiz = 'inicio' # 'inicio', 'cerca' (linha de abertura ```json), 'fim'
+        self._inicio_raiz: Optional[int] = None
+        self._fim_raiz: Optional[int] = None
+        self._em_string = False
+        self._inicio_string = 0
+        self._inicio_escalar: Optional[int] = None
+
+    def alimentar(self, pedaco: str) -> None:
+        self._texto += pedaco
+        texto, n = self._texto, len(self._texto)
+        while self._pos < n:
+            if self._em_string:
+                self._pos = _CORPO_STRING.match(texto, self._pos).end()
+                if self._pos >= n:
+                    break
+                c = texto[self._pos]
+                if c == '"':
+                    self._em_string = False
+                    self._fim_string(self._pos)
+                elif c == '\\':
+                    if self._pos + 1 >= n:
+                        break # O caractere escapado ainda não chegou
+                    self._pos += 1
+                else:
+                    raise ErroJSONIncremental("Caractere de controle dentro de string", self._pos)
+                self._pos += 1
+                continue
+
+            c = texto[self._pos]
+            if self._inicio_escalar is not None:
+                if c in _CHARS_ESCALAR:
+                    self._pos += 1
+                    continue
+                self._fim_escalar(self._pos)
+            self._estrutural(c)
+            self._pos += 1
+
+    def finalizar(self) -> str:
+        """Valida que o valor raiz terminou e retorna o texto JSON (sem cercas de markdown)."""
+        if self._inicio_escalar is not None:
+            self._fim_escalar(len(self._texto))
+        if self._em_string or self._pilha or self._estado_raiz != 'fim':
+            raise ErroJSONIncremental("JSON incompleto", len(self._texto))
+        return self._texto[self._inicio_raiz:self._fim_raiz + 1]
+
+    # --- Máquina de estados ---
+
+    def _estrutural(self, c: str) -> None:
+        if not self._pilha and self._estado_raiz == 'cerca':
+            if c == '\n':
+                self._estado_raiz = 'inicio'
+            return
+        if c in _ESPACOS:
+            return
+        if not self._pilha:
+            if self._estado_raiz == 'fim':
+                if c != '`': # Fechamento da cerca de markdown
+                    raise ErroJSONIncremental("Conteúdo após o fim do JSON", self._pos)
+            elif c == '`' and self._inicio_raiz is None:
+                self._estado_raiz = 'cerca'
+            else:
+                self._inicio_raiz = self._pos
+                self._iniciar_valor(c, None)
+            return
+
+        container = self._pilha[-1]
+        estado = container.estado
+        if container.tipo == '{':
+            if estado in ('chave_ou_fim', 'chave'):
+                if c == '"':
+                    container.estado = 'lendo_chave'
+                    self._iniciar_string()
+                elif c == '}' and estado == 'chave_ou_fim':
+                    self._fechar()
+                else:
+                    raise ErroJSONIncremental("Esperada uma chave entre aspas", self._pos)
+            elif estado == 'dois_pontos':
+                if c != ':':
+                    raise ErroJSONIncremental("Esperado ':' após a chave", self._pos)
+                container.estado = 'valor'
+            elif estado == 'valor':
+                self._iniciar_valor(c, container)
+            elif c == ',':
+                container.estado = 'chave'
+            elif c == '}':
+                self._fechar()
+            else:
+                raise ErroJSONIncremental("Esperado ',' ou '}'", self._pos)
+        else:
+            if estado == 'valor_ou_fim' and c == ']':
+                self._fechar()
+            elif estado in ('valor_ou_fim', 'valor'):
+                self._iniciar_valor(c, container)
+            elif c == ',':
+                container.estado = 'valor'
+            elif c == ']':
+                self._fechar()
+            else:
+                raise ErroJSONIncremental("Esperado ',' ou ']'", self._pos)
+
+    def _iniciar_valor(self, c: str, pai: Optional[_Container]) -> None:
+        if pai is not None:
+            pai.estado = 'lendo_valor'
+            if pai.tipo == '[' and pai.chave is not None:
+                pai.inicio_elemento = self._pos
+        if c == '{':
+            self._pilha.append(_Container('{', 'chave_ou_fim'))
+        elif c == '[':
+            # Listas do objeto raiz têm seus elementos entregues a ao_elemento
+            raiz = self._pilha[0] if len(self._pilha) == 1 and self._pilha[0].tipo == '{' else None
+            self._pilha.append(_Container('[', 'valor_ou_fim', raiz.chave if raiz else None))
+        elif c == '"':
+            self._iniciar_string()
+        elif c in _INICIO_ESCALAR:
+            self._inicio_escalar = self._pos
+        else:
+            raise ErroJSONIncremental(f"Valor inválido começando com {c!r}", self._pos)
+
+    def _iniciar_string(self) -> None:
+        self._em_string = True
+        self._inicio_string = self._pos
+
+    def _fim_string(self, fim: int) -> None:
+        container = self._pilha[-1] if self._pilha else None
+        if container is not None and container.estado == 'lendo_chave':
+            container.estado = 'dois_pontos'
+            if len(self._pilha) == 1:
+                container.chave = json.loads(self._texto[self._inicio_string:fim + 1])
+            return
+        self._valor_concluido(fim)
+
+    def _fim_escalar(self, fim: int) -> None:
+        token = self._texto[self._inicio_escalar:fim]
+        self._inicio_escalar = None
+        try:
+            json.loads(token)
+        except ValueError:
+            raise ErroJSONIncremental(f"Valor inválido {token!r}", fim - len(token)) from None
+        self._valor_concluido(fim - 1)
+
+    def _fechar(self) -> None:
+        self._pilha.pop()
+        self._valor_concluido(self._pos)
+
+    def _valor_concluido(self, fim: int) -> None:
+        if not self._pilha:
+            self._estado_raiz = 'fim'
+            self._fim_raiz = fim
+            return
+        container = self._pilha[-1]
+        container.estado = 'virgula_ou_fim'
+        if container.inicio_elemento is not None:
+            elemento = json.loads(self._texto[container.inicio_elemento:fim + 1])
+            container.inicio_elemento = None
+            if self._ao_elemento is not None:
+                self._ao_elemento(container.chave, elemento)
@@ -0,0 +1,233 @@
+# llm_cache.py
+# Cache persistente (SQLite) das respostas do modelo, endereçado pelo conteúdo da chamada.
+from typing import Optional, Dict, Type
+from pydantic import BaseModel
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import config
+
+logger = logging.getLogger(__name__)
+
+CACHE_USE = 'use'         # Lê e grava no cache
+CACHE_REFRESH = 'refresh' # Ignora o que está no cache, mas grava a nova resposta
+CACHE_BYPASS = 'bypass'   # Não lê nem grava
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'invalid': 0}
+_schema_versions: Dict[str, str] = {}
+_initialized = False
+
+def get_cache_connection():
+    conn = sqlite3.connect(config.LLM_CACHE_DB, timeout=10)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def init_cache():
+    conn = get_cache_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            cache_key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            schema_name TEXT NOT NULL,
+            response_text TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_llm_cache_created_at ON llm_cache (created_at)
+    ''')
+    # Tamanho total e número de entradas mantidos por triggers, para _evict não somar a tabela a cada put
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache_totals (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            entries INTEGER NOT NULL,
+            size_bytes INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO llm_cache_totals (id, entries, size_bytes)
+        SELECT 1, COUNT(*), COALESCE(SUM(size_bytes), 0) FROM llm_cache
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_llm_cache_totals_insert AFTER INSERT ON llm_cache
+        BEGIN
+            UPDATE llm_cache_totals SET entries = entries + 1, size_bytes = size_bytes + NEW.size_bytes WHERE id = 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_llm_cache_totals_update AFTER UPDATE OF size_bytes ON llm_cache
+        BEGIN
+            UPDATE llm_cache_totals SET size_bytes = size_bytes - OLD.size_bytes + NEW.size_bytes WHERE id = 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_llm_cache_totals_delete AFTER DELETE ON llm_cache
+        BEGIN
+            UPDATE llm_cache_totals SET entries = entries - 1, size_bytes = size_bytes - OLD.size_bytes WHERE id = 1;
+        END
+    ''')
+    conn.commit()
+    conn.close()
+
+def _ensure_cache() -> None:
+    global _initialized
+    if not _initialized:
+        init_cache()
+        _initialized = True
+
+def _count(stat: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[stat] += n
+
+def schema_version(output_schema: Type[BaseModel]) -> str:
+    """Hash do JSON schema: qualquer mudança no modelo Pydantic invalida as entradas antigas."""
+    name = output_schema.__name__
+    if name not in _schema_versions:
+        schema_json = json.dumps(output_schema.model_json_schema(), sort_keys=True)
+        _schema_versions[name] = hashlib.sha256(schema_json.encode('utf-8')).hexdigest()[:16]
+    return _schema_versions[name]
+
+def make_key(prompt_content: str, output_schema: Type[BaseModel], temperature: float) -> str:
+    payload = json.dumps(
+        [config.MODEL, prompt_content, output_schema.__name__, schema_version(output_schema), temperature],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def get(cache_key: str) -> Optional[str]:
+    """Retorna o texto da resposta em cache (ou None), respeitando a idade máxima."""
+    _ensure_cache()
+    conn = get_cache_connection()
+    cursor = conn.cursor()
+    now = time.time()
+    try:
+        cursor.execute(
+            "SELECT response_text FROM llm_cache WHERE cache_key = ? AND created_at >= ?",
+            (cache_key, now - config.LLM_CACHE_MAX_AGE_SECONDS)
+        )
+        row = cursor.fetchone()
+        if row is not None:
+            cursor.execute(
+                "UPDATE llm_cache SET hits = hits + 1, last_access = ? WHERE cache_key = ?",
+                (now, cache_key)
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.warning(f"Falha ao ler o cache de respostas: {e}")
+        row = None
+    finally:
+        conn.close()
+
+    _count('hits' if row is not None else 'misses')
+    return row['response_text'] if row is not None else None
+
+def put(cache_key: str, output_schema: Type[BaseModel], response_text: str) -> None:
+    _ensure_cache()
+    conn = get_cache_connection()
+    cursor = conn.cursor()
+    now = time.time()
+    try:
+        # Upsert em vez de INSERT OR REPLACE: a remoção feita pelo REPLACE não dispara os triggers de llm_cache_totals
+        cursor.execute(
+            "INSERT INTO llm_cache "
+            "(cache_key, model, schema_name, response_text, size_bytes, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (cache_key) DO UPDATE SET model = excluded.model, schema_name = excluded.schema_name, "
+            "response_text = excluded.response_text, size_bytes = excluded.size_bytes, hits = 0, "
+            "created_at = excluded.created_at, last_access = excluded.last_access",
+            (cache_key, config.MODEL, output_schema.__name__, response_text,
+             len(response_text.encode('utf-8')), now, now)
+        )
+        evicted = _evict(cursor, now)
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        logger.warning(f"Falha ao gravar no cache de respostas: {e}")
+        return
+    finally:
+        conn.close()
+
+    _count('writes')
+    if evicted:
+        _count('evictions', evicted)
+
+def invalidate(cache_key: str) -> None:
+    """Remove uma entrada cuja resposta não passou mais na validação."""
+    conn = get_cache_connection()
+    try:
+        conn.execute("DELETE FROM llm_cache WHERE cache_key = ?", (cache_key,))
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.warning(f"Falha ao invalidar entrada do cache: {e}")
+    finally:
+        conn.close()
+    _count('invalid')
+
+_EVICT_BATCH = 64 # Entradas lidas por vez, pelo índice de last_access, quando o cache passa do tamanho máximo
+
+def _evict(cursor: sqlite3.Cursor, now: float) -> int:
+    """Remove entradas expiradas e, se o cache passar do tamanho máximo, as menos usadas recentemente (LRU)."""
+    cursor.execute(
+        "DELETE FROM llm_cache WHERE created_at < ?",
+        (now - config.LLM_CACHE_MAX_AGE_SECONDS,)
+    )
+    evicted = cursor.rowcount
+
+    cursor.execute("SELECT size_bytes FROM llm_cache_totals WHERE id = 1")
+    excess = cursor.fetchone()[0] - config.LLM_CACHE_MAX_BYTES
+    while excess > 0:
+        cursor.execute(
+            "SELECT cache_key, size_bytes FROM llm_cache ORDER BY last_access LIMIT ?", (_EVICT_BATCH,)
+        )
+        to_delete = []
+        for row in cursor.fetchall():
+            if excess <= 0:
+                break
+            to_delete.append((row['cache_key'],))
+            excess -= row['size_bytes']
+        if not to_delete:
+            break
+        cursor.executemany("DELETE FROM llm_cache WHERE cache_key = ?", to_delete)
+        evicted += len(to_delete)
+    return evicted
+
+def get_stats() -> Dict[str, int]:
+    """Contadores do processo atual mais o tamanho atual do cache."""
+    with _stats_lock:
+        stats = dict(_stats)
+    _ensure_cache()
+    conn = get_cache_connection()
+    try:
+        row = conn.execute("SELECT entries, size_bytes FROM llm_cache_totals WHERE id = 1").fetchone()
+        stats['entries'], stats['size_bytes'] = row[0], row[1]
+    except sqlite3.Error:
+        pass
+    finally:
+        conn.close()
+    return stats
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Gerencia o cache de respostas do modelo.")
+    parser.add_argument("--clear", action="store_true", help="Apaga todas as entradas do cache.")
+    args = parser.parse_args()
+
+    init_cache()
+    if args.clear:
+        conn = get_cache_connection()
+        conn.execute("DELETE FROM llm_cache")
+        conn.commit()
+        conn.close()
+        print("Cache de respostas apagado.")
+    print(get_stats())
@@ -1,21 +1,27 @@
-from typing import Optional, Dict, Any, Type, cast, List
+from typing import Optional, Dict, Any, Type, Callable, cast, List, Tuple, get_args
 from pydantic import BaseModel, ValidationError
 from google import genai # NÃO MODIFICAR / DO NOT MODIFY
 import google.genai.types as genai_types
+import asyncio
+import functools
 import logging
 import json
 import time
 import config
+import llm_cache
+import metricas
+import tracing
+from json_incremental import ParserIncremental, ErroJSONIncremental
+from context_encoder import estimar_tokens
+from prompt import PROMPT_REPARO
+from rate_limiter import limiter, backoff, extrair_retry_after, is_rate_limit_error
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-def _make_api_call(
-    client: genai.Client, # Alterado para usar o objeto modelo diretamente
-    prompt_content: str,
-    output_schema: Type[BaseModel]
-) -> Optional[Dict[str, Any]]:
-    """Função auxiliar para fazer uma chamada à API e processar a resposta com retries."""
+TEMPERATURE = 0.01
+
+def _montar_requisicao(prompt_content: str, output_schema: Type[BaseModel]):
     contents = [
         genai_types.Content( # NÃO MODIFICAR / DO NOT MODIFY
             role="user",
@@ -26,83 +32,516 @@ def _make_api_call(
     generation_config = genai_types.GenerateContentConfig( # NÃO MODIFICAR / DO NOT MODIFY
         response_mime_type="application/json",
         response_schema=output_schema,
-        temperature=0.01
+        temperature=TEMPERATURE
     )
+    return contents, generation_config
 
-    retries = 0
-    max_retries = config.MAX_TRIES
-    success = False
-    parsed_json = None
+def _consultar_cache(cache_key: str, output_schema: Type[BaseModel], cache_mode: str) -> Optional[Dict[str, Any]]:
+    if cache_mode != llm_cache.CACHE_USE:
+        return None
+    cached_text = llm_cache.get(cache_key)
+    if cached_text is None:
+        return None
+    # Respostas em cache passam pela mesma validação que as respostas novas
+    try:
+        parsed_json = json.loads(cached_text)
+        output_schema(**parsed_json)
+        logger.info(f"Resposta para {output_schema.__name__} obtida do cache.")
+        metricas.registrar_acerto_cache(output_schema.__name__)
+        tracing.anotar(cache=True)
+        return parsed_json
+    except (json.JSONDecodeError, ValidationError, TypeError) as e:
+        logger.warning(f"Resposta em cache inválida para {output_schema.__name__}, chamando o modelo: {e}")
+        llm_cache.invalidate(cache_key)
+        return None
 
-    while retries < max_retries and not success:
-        logger.info(f"Tentativa {retries + 1}/{max_retries} de chamar o modelo Gemini. Schema: {output_schema.__name__}")
-        logger.debug(f"Prompt para API (primeiros 500 chars): {prompt_content[:500]}...")
+def _espera_apos_erro(erro_chamada: Exception, tentativa: int) -> float:
+    """Registra a falha da chamada e retorna quantos segundos esperar antes da próxima tentativa."""
+    logger.error(f"Falha ao chamar client.generate_content (Tentativa {tentativa}): {erro_chamada}", exc_info=erro_chamada)
+    if hasattr(erro_chamada, 'response') and hasattr(erro_chamada.response, 'text'): # type: ignore
+        logger.error(f"Detalhes da resposta da API (erro): {erro_chamada.response.text}") # type: ignore
+    espera = backoff(tentativa, extrair_retry_after(erro_chamada))
+    if is_rate_limit_error(erro_chamada):
+        limiter.pausar(espera) # Todas as chamadas do processo aguardam, não só esta
+    return espera
+
+def _interpretar_resposta(
+    full_response_text: str,
+    output_schema: Type[BaseModel],
+    tentativa: int
+) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Limpa, decodifica e valida a resposta. Retorna (json, texto limpo); json None indica resposta inválida."""
+    # Limpeza do JSON (comum em respostas de LLMs)
+    json_text = full_response_text.strip()
+    if json_text.startswith("```json"):
+        json_text = json_text[7:-3].strip()
+    elif json_text.startswith("```"):
+        json_text = json_text[3:-3].strip()
+
+    logger.debug(f"Texto JSON bruto recebido para {output_schema.__name__}: {json_text[:500]}...")
+
+    try:
+        parsed_json = json.loads(json_text)
+        # Valida com o schema Pydantic após o parse
+        output_schema(**parsed_json)
+        logger.info(f"Raciocínio da Etapa: {parsed_json.get('raciocinio', 'N/A')}")
+        return parsed_json, json_text
+    except json.JSONDecodeError as e:
+        logger.error(f"Erro ao decodificar JSON para {output_schema.__name__} (Tentativa {tentativa}): {e}. Resposta: {json_text}")
+        metricas.registrar_falha_llm(output_schema.__name__, metricas.FALHA_JSON)
+    except ValidationError as e:
+        logger.error(f"Erro de validação Pydantic para {output_schema.__name__} (Tentativa {tentativa}): {e}. JSON: {json_text}")
+        metricas.registrar_falha_llm(output_schema.__name__, metricas.FALHA_VALIDACAO)
+    except Exception as e:
+        logger.error(f"Erro inesperado ao processar resposta da API (Tentativa {tentativa}): {e}", exc_info=True)
+        metricas.registrar_falha_llm(output_schema.__name__, metricas.FALHA_VALIDACAO)
+    return None, json_text
+
+def _avaliar_tentativa(
+    output_schema: Type[BaseModel],
+    tentativa: int,
+    full_response_text: str,
+    erro_chamada: Optional[Exception],
+    stream_interrompido: Optional[Exception]
+) -> Tuple[Optional[Dict[str, Any]], str, Optional[float]]:
+    """
+    Trata o retorno de _gerar/_gerar_async em _make_api_call e _make_api_call_async. Retorna (json, texto limpo, espera):
+    com `espera`, a tentativa foi perdida e a próxima aguarda esse tempo; json None sem `espera` é uma resposta
+    que não validou e pode seguir para o reparo.
+    """
+    if erro_chamada is not None:
+        metricas.registrar_falha_llm(output_schema.__name__, metricas.FALHA_API)
+        return None, "", _espera_apos_erro(erro_chamada, tentativa)
+    if stream_interrompido is not None:
+        logger.error(f"Stream interrompido para {output_schema.__name__} (Tentativa {tentativa}): {stream_interrompido}")
+        metricas.registrar_falha_llm(output_schema.__name__, metricas.FALHA_STREAM)
+        return None, "", backoff(tentativa)
+
+    logger.info(f"Resposta recebida do modelo para {output_schema.__name__} (Tentativa {tentativa}).")
+
+    if not full_response_text:
+        logger.error("Resposta do modelo está vazia.")
+        metricas.registrar_falha_llm(output_schema.__name__, metricas.FALHA_VAZIA)
+        return None, "", backoff(tentativa)
+
+    parsed_json, json_text = _interpretar_resposta(full_response_text, output_schema, tentativa)
+    return parsed_json, json_text, None
+
+def _gravar_no_cache(
+    cache_key: str,
+    output_schema: Type[BaseModel],
+    cache_mode: str,
+    json_text: str
+) -> None:
+    if cache_mode != llm_cache.CACHE_BYPASS:
+        llm_cache.put(cache_key, output_schema, json_text)
+
+# --- Streaming (config.LLM_STREAMING) ---
 
-        full_response_text = ""
-        try:
+@functools.lru_cache(maxsize=None)
+def _modelos_de_elementos(output_schema: Type[BaseModel]) -> Dict[str, Type[BaseModel]]:
+    """Campos de lista do schema cujos elementos são modelos, e.g. 'acoes_comportamentos' -> NoAcaoComportamento."""
+    modelos = {}
+    for campo, info in output_schema.model_fields.items():
+        tipos = [info.annotation] # Desembrulha Optional[List[...]]
+        while tipos:
+            tipo = tipos.pop()
+            if isinstance(tipo, type) and issubclass(tipo, BaseModel):
+                modelos[campo] = tipo
+                break
+            tipos.extend(get_args(tipo))
+    return modelos
+
+def _novo_parser(output_schema: Type[BaseModel], ao_elemento: Optional[Callable[[str, dict], None]]) -> ParserIncremental:
+    """
+    Parser que entrega a `ao_elemento` cada elemento de lista válido assim que ele se completa. Só um erro de
+    estrutura aborta o stream: um elemento que não valida é só retido e, depois de finalizar(), a resposta inteira
+    é validada e os elementos inválidos vão para o reparo (_reparar_resposta), como sem streaming.
+    """
+    if ao_elemento is None:
+        return ParserIncremental()
+    modelos = _modelos_de_elementos(output_schema)
+
+    def entregar_elemento(campo: str, elemento: dict) -> None:
+        modelo = modelos.get(campo)
+        if modelo is not None:
+            try:
+                modelo.model_validate(elemento)
+            except ValidationError:
+                return
+        ao_elemento(campo, elemento)
+    return ParserIncremental(entregar_elemento)
+
+def _ler_stream(stream, parser: ParserIncremental) -> Optional[int]:
+    """Alimenta o parser com os pedaços da resposta. Retorna o total de tokens (informado no último pedaço)."""
+    tokens = None
+    try:
+        for pedaco in stream:
+            if pedaco.usage_metadata is not None:
+                tokens = pedaco.usage_metadata.total_token_count
+            parser.alimentar(pedaco.text or "")
+    finally:
+        fechar = getattr(stream, 'close', None) # Encerra a conexão se o stream foi abortado
+        if fechar is not None:
+            fechar()
+    return tokens
+
+async def _ler_stream_async(stream, parser: ParserIncremental) -> Optional[int]:
+    tokens = None
+    try:
+        async for pedaco in stream:
+            if pedaco.usage_metadata is not None:
+                tokens = pedaco.usage_metadata.total_token_count
+            parser.alimentar(pedaco.text or "")
+    finally:
+        fechar = getattr(stream, 'aclose', None)
+        if fechar is not None:
+            await fechar()
+    return tokens
+
+@tracing.rastrear('llm.tentativa')
+def _gerar(
+    client: genai.Client,
+    contents,
+    generation_config,
+    output_schema: Type[BaseModel],
+    prompt_content: str,
+    ao_elemento: Optional[Callable[[str, dict], None]] = None
+) -> Tuple[str, Optional[Exception], Optional[Exception]]:
+    """
+    Uma chamada ao modelo, dentro do rate limiter. Retorna (texto, erro da chamada, erro do stream);
+    o erro do stream é o ErroJSONIncremental (erro de estrutura) que interrompeu a leitura (config.LLM_STREAMING).
+    """
+    full_response_text = ""
+    tokens_reais = None
+    tokens_estimados = estimar_tokens(prompt_content)
+    inicio_espera = time.perf_counter()
+    limiter.adquirir(tokens_estimados)
+    inicio = time.perf_counter()
+    try:
+        if config.LLM_STREAMING:
+            parser = _novo_parser(output_schema, ao_elemento)
+            stream = client.models.generate_content_stream(
+                model=config.MODEL,
+                contents=cast(List[genai_types.Content], contents), # type: ignore
+                config=generation_config,
+            )
+            tokens_reais = _ler_stream(stream, parser)
+            full_response_text = parser.finalizar()
+        else:
             response = client.models.generate_content( # NÃO MODIFICAR / DO NOT MODIFY
                 model= config.MODEL,
                 contents=cast(List[genai_types.Content], contents), # type: ignore
                 config=generation_config,
             )
-            if response.text:
-                 full_response_text = response.text
+            if response.usage_metadata is not None:
+                tokens_reais = response.usage_metadata.total_token_count
+            full_response_text = response.text or ""
+    except ErroJSONIncremental as e_stream:
+        tracing.anotar(erro=f"{type(e_stream).__name__}: {e_stream}")
+        return full_response_text, None, e_stream
+    except Exception as e_gc:
+        tracing.anotar(erro=f"{type(e_gc).__name__}: {e_gc}")
+        return full_response_text, e_gc, None
+    finally:
+        # A vaga é liberada antes de qualquer espera de backoff
+        limiter.liberar(tokens_estimados, tokens_reais)
+        metricas.registrar_chamada_llm(
+            output_schema.__name__, time.perf_counter() - inicio, len(prompt_content), len(full_response_text), tokens_reais
+        )
+        tracing.anotar(schema=output_schema.__name__, espera_limite_s=round(inicio - inicio_espera, 3), tokens=tokens_reais)
+    return full_response_text, None, None
+
+@tracing.rastrear('llm.tentativa')
+async def _gerar_async(
+    client: genai.Client,
+    contents,
+    generation_config,
+    output_schema: Type[BaseModel],
+    prompt_content: str,
+    ao_elemento: Optional[Callable[[str, dict], None]] = None
+) -> Tuple[str, Optional[Exception], Optional[Exception]]:
+    """Versão asyncio de _gerar, com o cliente assíncrono do SDK (client.aio)."""
+    full_response_text = ""
+    tokens_reais = None
+    tokens_estimados = estimar_tokens(prompt_content)
+    inicio_espera = time.perf_counter()
+    await limiter.adquirir_async(tokens_estimados)
+    inicio = time.perf_counter()
+    try:
+        if config.LLM_STREAMING:
+            parser = _novo_parser(output_schema, ao_elemento)
+            stream = await client.aio.models.generate_content_stream(
+                model=config.MODEL,
+                contents=cast(List[genai_types.Content], contents), # type: ignore
+                config=generation_config,
+            )
+            tokens_reais = await _ler_stream_async(stream, parser)
+            full_response_text = parser.finalizar()
+        else:
+            response = await client.aio.models.generate_content(
+                model=config.MODEL,
+                contents=cast(List[genai_types.Content], contents), # type: ignore
+                config=generation_config,
+            )
+            if response.usage_metadata is not None:
+                tokens_reais = response.usage_metadata.total_token_count
+            full_response_text = response.text or ""
+    except ErroJSONIncremental as e_stream:
+        tracing.anotar(erro=f"{type(e_stream).__name__}: {e_stream}")
+        return full_response_text, None, e_stream
+    except Exception as e_gc:
+        tracing.anotar(erro=f"{type(e_gc).__name__}: {e_gc}")
+        return full_response_text, e_gc, None
+    finally:
+        limiter.liberar(tokens_estimados, tokens_reais)
+        metricas.registrar_chamada_llm(
+            output_schema.__name__, time.perf_counter() - inicio, len(prompt_content), len(full_response_text), tokens_reais
+        )
+        tracing.anotar(schema=output_schema.__name__, espera_limite_s=round(inicio - inicio_espera, 3), tokens=tokens_reais)
+    return full_response_text, None, None
+
+# --- Reparo de respostas parcialmente inválidas ---
+
+class _Reparo:
+    """
+    Resposta que decodificou mas tem elementos de lista inválidos. Guarda os elementos válidos e monta um
+    pedido curto (PROMPT_REPARO) só com os erros e os elementos a corrigir, em vez de regenerar a resposta toda.
+    """
+    def __init__(self, dados: Dict[str, Any], invalidos: Dict[str, Dict[int, Any]], erros: List[dict]):
+        self.dados = dados
+        self.invalidos = invalidos # campo -> posição -> elemento inválido
+        self.erros = erros
+
+    def prompt(self) -> str:
+        linhas = []
+        for erro in self.erros:
+            campo, posicao, *resto = erro['loc']
+            elemento = self.invalidos[campo][posicao]
+            # O elemento é identificado pelo id: as posições não valem na lista reduzida enviada ao modelo
+            local = f"{campo}[{elemento['id']}]"
+            local += "".join(f".{parte}" if isinstance(parte, str) else f"[{parte}]" for parte in resto)
+            linhas.append(f"- {local}: {erro['msg']} (valor recebido: {json.dumps(erro.get('input'), ensure_ascii=False)})")
+        elementos = {campo: list(por_posicao.values()) for campo, por_posicao in self.invalidos.items()}
+        return PROMPT_REPARO.format(erros="\n".join(linhas), elementos=json.dumps(elementos, ensure_ascii=False, indent=2))
+
+    def mesclar(self, corrigido: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Recoloca os elementos corrigidos nas posições dos inválidos, casando estritamente pelo id.
+        Retorna None (reparo falho: a resposta é regenerada) se faltar algum id pedido ou vier um elemento a mais.
+        """
+        mesclado = dict(self.dados)
+        for campo, por_posicao in self.invalidos.items():
+            corrigidos = list(corrigido.get(campo) or [])
+            por_id = {c.get('id'): c for c in corrigidos if isinstance(c, dict) and c.get('id') is not None}
+            pedidos = {original['id']: posicao for posicao, original in por_posicao.items()}
+            if len(por_id) != len(corrigidos) or por_id.keys() != pedidos.keys():
+                logger.error(
+                    f"Reparo de {campo} descartado: ids pedidos {sorted(pedidos, key=str)}, "
+                    f"recebidos {[c.get('id') if isinstance(c, dict) else None for c in corrigidos]}."
+                )
+                return None
+            lista = list(mesclado[campo])
+            for elemento_id, posicao in pedidos.items():
+                lista[posicao] = por_id[elemento_id]
+            mesclado[campo] = lista
+        return mesclado
+
+def _preparar_reparo(json_text: str, output_schema: Type[BaseModel]) -> Optional[_Reparo]:
+    """_Reparo para a resposta, ou None se ela não decodifica ou tem erros fora dos elementos de lista."""
+    try:
+        dados = json.loads(json_text)
+        output_schema(**dados)
+        return None
+    except ValidationError as e:
+        erros = e.errors()
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+    invalidos: Dict[str, Dict[int, Any]] = {}
+    for erro in erros:
+        loc = erro['loc']
+        campo = loc[0] if loc else None
+        if len(loc) < 2 or not isinstance(loc[1], int) or not isinstance(dados.get(campo), list):
+            return None # e.g. 'raciocinio' ausente ou um campo que não é lista: só uma nova resposta resolve
+        invalidos.setdefault(campo, {})[loc[1]] = dados[campo][loc[1]]
+    for por_posicao in invalidos.values():
+        # A correção é casada pelo id (_Reparo.mesclar): sem um id único por elemento, só uma nova resposta resolve
+        ids = [e.get('id') if isinstance(e, dict) else None for e in por_posicao.values()]
+        if None in ids or len(set(map(str, ids))) != len(ids):
+            return None
+    return _Reparo(dados, invalidos, erros)
+
+def _concluir_reparo(
+    reparo: _Reparo,
+    output_schema: Type[BaseModel],
+    tentativa: int,
+    texto_corrigido: str,
+    erro_chamada: Optional[Exception],
+    stream_interrompido: Optional[Exception]
+) -> Optional[Dict[str, Any]]:
+    """Trata o retorno de _gerar/_gerar_async para um pedido de reparo. Retorna a resposta mesclada, ou None."""
+    if erro_chamada is not None or stream_interrompido is not None:
+        logger.error(f"Falha no reparo de {output_schema.__name__}: {erro_chamada or stream_interrompido}")
+        metricas.registrar_falha_llm(output_schema.__name__, metricas.FALHA_API if erro_chamada else metricas.FALHA_STREAM)
+        metricas.registrar_reparo(output_schema.__name__, False)
+        return None
+    mesclado = _mesclar_reparo(reparo, texto_corrigido, output_schema, tentativa)
+    metricas.registrar_reparo(output_schema.__name__, mesclado is not None)
+    return mesclado
+
+def _mesclar_reparo(reparo: _Reparo, texto_corrigido: str, output_schema: Type[BaseModel], tentativa: int) -> Optional[Dict[str, Any]]:
+    corrigido, _ = _interpretar_resposta(texto_corrigido, output_schema, tentativa) if texto_corrigido else (None, "")
+    if corrigido is None:
+        return None
+    mesclado = reparo.mesclar(corrigido)
+    if mesclado is None:
+        return None
+    try:
+        output_schema(**mesclado)
+    except ValidationError as e:
+        logger.error(f"Resposta reparada ainda inválida para {output_schema.__name__}: {e}")
+        return None
+    return mesclado
+
+def _reparar_resposta(
+    client: genai.Client,
+    json_text: str,
+    output_schema: Type[BaseModel],
+    ao_elemento: Optional[Callable[[str, dict], None]] = None
+) -> Optional[Dict[str, Any]]:
+    """Tenta corrigir só os elementos inválidos (até config.LLM_REPAIR_TRIES pedidos). None: regenerar a resposta."""
+    reparo = _preparar_reparo(json_text, output_schema)
+    for tentativa in range(1, (config.LLM_REPAIR_TRIES if reparo else 0) + 1):
+        prompt_reparo = reparo.prompt()
+        logger.info(f"Pedindo correção de {sum(map(len, reparo.invalidos.values()))} elemento(s) de {output_schema.__name__} (reparo {tentativa}).")
+        contents, generation_config = _montar_requisicao(prompt_reparo, output_schema)
+        mesclado = _concluir_reparo(reparo, output_schema, tentativa, *_gerar(
+            client, contents, generation_config, output_schema, prompt_reparo, ao_elemento
+        ))
+        if mesclado is not None:
+            return mesclado
+    return None
+
+async def _reparar_resposta_async(
+    client: genai.Client,
+    json_text: str,
+    output_schema: Type[BaseModel],
+    ao_elemento: Optional[Callable[[str, dict], None]] = None
+) -> Optional[Dict[str, Any]]:
+    reparo = _preparar_reparo(json_text, output_schema)
+    for tentativa in range(1, (config.LLM_REPAIR_TRIES if reparo else 0) + 1):
+        prompt_reparo = reparo.prompt()
+        logger.info(f"Pedindo correção de {sum(map(len, reparo.invalidos.values()))} elemento(s) de {output_schema.__name__} (reparo {tentativa}).")
+        contents, generation_config = _montar_requisicao(prompt_reparo, output_schema)
+        mesclado = _concluir_reparo(reparo, output_schema, tentativa, *await _gerar_async(
+            client, contents, generation_config, output_schema, prompt_reparo, ao_elemento
+        ))
+        if mesclado is not None:
+            return mesclado
+    return None
+
+@tracing.rastrear()
+def _make_api_call(
+    client: genai.Client, # Alterado para usar o objeto modelo diretamente
+    prompt_content: str,
+    output_schema: Type[BaseModel],
+    cache_mode: Optional[str] = None,
+    ao_elemento: Optional[Callable[[str, dict], None]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Função auxiliar para fazer uma chamada à API e processar a resposta com retries.
+    cache_mode: 'use', 'refresh' ou 'bypass' (ver llm_cache.py). Padrão: config.LLM_CACHE_MODE.
+    Se a resposta decodifica mas alguns elementos de lista não validam (e.g. um funcao_antecedente fora do enum),
+    os elementos válidos são mantidos e só os inválidos são enviados de volta para correção (_Reparo);
+    a resposta inteira só é pedida de novo se o reparo falhar.
+    Com config.LLM_STREAMING, a resposta é lida com generate_content_stream e analisada à medida que chega:
+    um erro de estrutura no JSON interrompe o stream e conta como uma tentativa falha; elementos que não validam
+    contra o schema seguem para o reparo depois do fim da resposta. `ao_elemento(campo, elemento)` recebe cada
+    elemento válido assim que ele chega (só no modo streaming e não para respostas do cache); elementos de uma tentativa abortada já
+    entregues não são retirados, e a tentativa seguinte os entrega de novo desde o início.
+    """
+    tracing.anotar(schema=output_schema.__name__)
+    contents, generation_config = _montar_requisicao(prompt_content, output_schema)
+
+    cache_mode = cache_mode or config.LLM_CACHE_MODE
+    cache_key = llm_cache.make_key(prompt_content, output_schema, TEMPERATURE)
+    parsed_json = _consultar_cache(cache_key, output_schema, cache_mode)
+    if parsed_json is not None:
+        return parsed_json
+
+    retries = 0
+    max_retries = config.MAX_TRIES
+
+    while retries < max_retries:
+        logger.info(f"Tentativa {retries + 1}/{max_retries} de chamar o modelo Gemini. Schema: {output_schema.__name__}")
+        logger.debug(f"Prompt para API (primeiros 500 chars): {prompt_content[:500]}...")
+
+        retries += 1
+        parsed_json, json_text, espera = _avaliar_tentativa(output_schema, retries, *_gerar(
+            client, contents, generation_config, output_schema, prompt_content, ao_elemento
+        ))
+        if parsed_json is None and espera is None:
+            parsed_json = _reparar_resposta(client, json_text, output_schema, ao_elemento)
+            if parsed_json is None:
+                espera = backoff(retries)
             else:
-                logger.error("Resposta da API não contém o texto esperado ou estrutura de candidatos.")
-                retries += 1
-                time.sleep(2 ** retries) # Exponential backoff
-                continue # Try again
-
-        except Exception as e_gc:
-            logger.error(f"Falha ao chamar client.generate_content (Tentativa {retries + 1}): {e_gc}", exc_info=True)
-            if hasattr(e_gc, 'response') and hasattr(e_gc.response, 'text'): # type: ignore
-                logger.error(f"Detalhes da resposta da API (erro): {e_gc.response.text}") # type: ignore
-            retries += 1
-            time.sleep(2 ** retries) # Exponential backoff
+                json_text = json.dumps(parsed_json, ensure_ascii=False)
+        if espera is not None:
+            time.sleep(espera)
             continue # Try again
 
-        logger.info(f"Resposta recebida do modelo para {output_schema.__name__} (Tentativa {retries + 1}).")
+        _gravar_no_cache(cache_key, output_schema, cache_mode, json_text)
+        return parsed_json
 
-        if not full_response_text:
-            logger.error("Resposta do modelo está vazia.")
-            retries += 1
-            time.sleep(2 ** retries) # Exponential backoff
-            continue # Try again
+    logger.error(f"Falha final ao processar resposta da API para {output_schema.__name__} após {max_retries} tentativas.")
+    return None
 
-        # Limpeza do JSON (comum em respostas de LLMs)
-        json_text = full_response_text.strip()
-        if json_text.startswith("```json"):
-            json_text = json_text[7:-3].strip()
-        elif json_text.startswith("```"):
-            json_text = json_text[3:-3].strip()
-
-        logger.debug(f"Texto JSON bruto recebido para {output_schema.__name__}: {json_text[:500]}...")
-
-        try:
-            parsed_json = json.loads(json_text)
-            # Valida com o schema Pydantic após o parse
-            output_schema(**parsed_json)
-            logger.info(f"Raciocínio da Etapa: {parsed_json.get('raciocinio', 'N/A')}")
-            success = True # JSON parsed and validated successfully
-        except json.JSONDecodeError as e:
-            logger.error(f"Erro ao decodificar JSON para {output_schema.__name__} (Tentativa {retries + 1}): {e}. Resposta: {json_text}")
-            retries += 1
-            time.sleep(2 ** retries) # Exponential backoff
-            # Continue loop to retry
-        except ValidationError as e:
-            logger.error(f"Erro de validação Pydantic para {output_schema.__name__} (Tentativa {retries + 1}): {e}. JSON: {json_text}")
-            retries += 1
-            time.sleep(2 ** retries) # Exponential backoff
-            # Continue loop to retry
-        except Exception as e:
-             logger.error(f"Erro inesperado ao processar resposta da API (Tentativa {retries + 1}): {e}", exc_info=True)
-             retries += 1
-             time.sleep(2 ** retries) # Exponential backoff
-             # Continue loop to retry
-
-
-    if not success:
-        logger.error(f"Falha final ao processar resposta da API para {output_schema.__name__} após {max_retries} tentativas.")
-        return None
+@tracing.rastrear()
+async def _make_api_call_async(
+    client: genai.Client,
+    prompt_content: str,
+    output_schema: Type[BaseModel],
+    cache_mode: Optional[str] = None,
+    ao_elemento: Optional[Callable[[str, dict], None]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Versão asyncio de _make_api_call: usa o cliente assíncrono do SDK (client.aio) sem bloquear o event loop.
+    O tratamento de cada tentativa (_avaliar_tentativa, _concluir_reparo) é o mesmo do caminho síncrono.
+    """
+    tracing.anotar(schema=output_schema.__name__)
+    contents, generation_config = _montar_requisicao(prompt_content, output_schema)
+
+    cache_mode = cache_mode or config.LLM_CACHE_MODE
+    cache_key = llm_cache.make_key(prompt_content, output_schema, TEMPERATURE)
+    parsed_json = await asyncio.to_thread(_consultar_cache, cache_key, output_schema, cache_mode)
+    if parsed_json is not None:
+        return parsed_json
+
+    retries = 0
+    max_retries = config.MAX_TRIES
+
+    while retries < max_retries:
+        logger.info(f"Tentativa {retries + 1}/{max_retries} de chamar o modelo Gemini (async). Schema: {output_schema.__name__}")
+        logger.debug(f"Prompt para API (primeiros 500 chars): {prompt_content[:500]}...")
+
+        retries += 1
+        parsed_json, json_text, espera = _avaliar_tentativa(output_schema, retries, *await _gerar_async(
+            client, contents, generation_config, output_schema, prompt_content, ao_elemento
+        ))
+        if parsed_json is None and espera is None:
+            parsed_json = await _reparar_resposta_async(client, json_text, output_schema, ao_elemento)
+            if parsed_json is None:
+                espera = backoff(retries)
+            else:
+                json_text = json.dumps(parsed_json, ensure_ascii=False)
+        if espera is not None:
+            await asyncio.sleep(espera)
+            continue
+
+        # O cache é SQLite: as leituras e gravações saem do event loop
+        await asyncio.to_thread(_gravar_no_cache, cache_key, output_schema, cache_mode, json_text)
+        return parsed_json
 
-    return parsed_json
\ No newline at end of file
+    logger.error(f"Falha final ao processar resposta da API para {output_schema.__name__} após {max_retries} tentativas.")
+    return None
@@ -0,0 +1,253 @@
+# metricas.py
+# Métricas do pipeline no formato de exposição do Prometheus (/metrics em app.py; no worker, config.METRICAS_PORTA_WORKER).
+# Contadores e histogramas são do processo. As medições de cada etapa (duração, tempo no modelo, tentativas e motivos
+# de falha, tamanho do prompt e da resposta, elementos retornados) também podem ser gravadas por execução (run_metrics em db.py).
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+import bisect
+import functools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BUCKETS_CARACTERES = (1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+# Motivos de falha de uma tentativa de chamada ao modelo (rótulo `motivo` de aaf_llm_falhas_total)
+FALHA_API = 'erro_api'
+FALHA_STREAM = 'stream_interrompido'
+FALHA_VAZIA = 'resposta_vazia'
+FALHA_JSON = 'json_invalido'
+FALHA_VALIDACAO = 'validacao'
+
+_REGISTRO: List['_Metrica'] = []
+
+def _escapar(valor: Any) -> str:
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _numero(valor: float) -> str:
+    if valor == float('inf'):
+        return '+Inf'
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+class _Metrica:
+    tipo = ''
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+        self._series: Dict[tuple, Any] = {}
+        _REGISTRO.append(self)
+
+    def _chave(self, rotulos: Dict[str, Any]) -> tuple:
+        return tuple(str(rotulos.get(nome, '')) for nome in self.rotulos)
+
+    def _formatar_rotulos(self, chave: tuple, extra: Optional[tuple] = None) -> str:
+        pares = list(zip(self.rotulos, chave)) + ([extra] if extra else [])
+        if not pares:
+            return ''
+        return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + '}'
+
+    def exportar(self) -> List[str]:
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for chave, valor in series:
+            linhas.extend(self._linhas_serie(chave, valor))
+        return linhas
+
+class Contador(_Metrica):
+    tipo = 'counter'
+
+    def incrementar(self, valor: float = 1, **rotulos) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._series[chave] = self._series.get(chave, 0) + valor
+
+    def _linhas_serie(self, chave: tuple, valor: float) -> List[str]:
+        return [f"{self.nome}{self._formatar_rotulos(chave)} {_numero(valor)}"]
+
+class Histograma(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = (), buckets: Sequence[float] = BUCKETS_SEGUNDOS):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(sorted(buckets))
+
+    def observar(self, valor: float, **rotulos) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                # Contagem por bucket (não acumulada; o último é +Inf), soma e total
+                serie = self._series[chave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][bisect.bisect_left(self.buckets, valor)] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def _linhas_serie(self, chave: tuple, serie: list) -> List[str]:
+        contagens, soma, total = serie
+        linhas = []
+        acumulado = 0
+        for limite, contagem in zip(self.buckets + (float('inf'),), contagens):
+            acumulado += contagem
+            linhas.append(f"{self.nome}_bucket{self._formatar_rotulos(chave, ('le', _numero(limite)))} {acumulado}")
+        linhas.append(f"{self.nome}_sum{self._formatar_rotulos(chave)} {_numero(soma)}")
+        linhas.append(f"{self.nome}_count{self._formatar_rotulos(chave)} {total}")
+        return linhas
+
+ETAPA_SEGUNDOS = Histograma('aaf_etapa_duracao_segundos', 'Duração das etapas do pipeline (analysis.py).', ('etapa', 'status'))
+ETAPA_LLM_SEGUNDOS = Histograma('aaf_etapa_llm_segundos', 'Tempo de cada etapa gasto em chamadas ao modelo.', ('etapa',))
+ETAPA_TENTATIVAS = Contador('aaf_etapa_chamadas_llm_total', 'Chamadas ao modelo feitas pelas etapas, incluindo retentativas e reparos.', ('etapa',))
+ETAPA_ELEMENTOS = Contador('aaf_etapa_elementos_total', 'Elementos retornados pelo modelo, por etapa e campo.', ('etapa', 'campo'))
+LLM_SEGUNDOS = Histograma('aaf_llm_chamada_segundos', 'Duração de cada chamada ao modelo.', ('schema',))
+LLM_FALHAS = Contador('aaf_llm_falhas_total', 'Tentativas de chamada ao modelo que falharam, por motivo.', ('schema', 'motivo'))
+LLM_REPAROS = Contador('aaf_llm_reparos_total', 'Pedidos de correção de elementos inválidos, por resultado.', ('schema', 'resultado'))
+LLM_CACHE_ACERTOS = Contador('aaf_llm_cache_acertos_total', 'Respostas do modelo obtidas do cache (llm_cache.py).', ('schema',))
+LLM_PROMPT_CARACTERES = Histograma('aaf_llm_prompt_caracteres', 'Tamanho dos prompts enviados ao modelo.', ('schema',), BUCKETS_CARACTERES)
+LLM_CARACTERES = Contador('aaf_llm_caracteres_total', 'Caracteres enviados ao modelo (prompt) e recebidos (resposta).', ('schema', 'direcao'))
+LLM_TOKENS = Contador('aaf_llm_tokens_total', 'Tokens informados pela API (usage_metadata.total_token_count).', ('schema',))
+DB_SEGUNDOS = Histograma('aaf_db_operacao_segundos', 'Tempo com uma conexão do pool emprestada, por função de db.py.', ('operacao',))
+VIS_SEGUNDOS = Histograma('aaf_transformar_para_vis_segundos', 'Duração de utils.transformar_para_vis.')
+
+def exportar() -> str:
+    """Todas as métricas do processo no formato texto do Prometheus (versão 0.0.4)."""
+    return '\n'.join(linha for metrica in _REGISTRO for linha in metrica.exportar()) + '\n'
+
+def cronometrar(histograma: Histograma, **rotulos) -> Callable:
+    """Decorador que observa a duração de cada chamada da função em `histograma`."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histograma.observar(time.perf_counter() - inicio, **rotulos)
+        return wrapper
+    return decorator
+
+# --- Medições por etapa ---
+
+class MedicaoEtapa:
+    """Medições de uma execução de etapa, acumuladas pelas chamadas ao modelo feitas no mesmo contexto."""
+    def __init__(self, etapa: str):
+        self.etapa = etapa
+        self.inicio = time.perf_counter()
+        self.status: Optional[str] = None
+        self.duracao_s = 0.0
+        self.llm_s = 0.0
+        self.chamadas_llm = 0
+        self.falhas: Dict[str, int] = {}
+        self.prompt_caracteres = 0
+        self.resposta_caracteres = 0
+        self.tokens = 0
+        self.cache_acertos = 0
+        self.elementos: Dict[str, int] = {}
+
+    def para_dict(self) -> Dict[str, Any]:
+        return {k: v for k, v in vars(self).items() if k != 'inicio'}
+
+# ContextVar, como as respostas brutas em scheduler.py: cada etapa (thread ou tarefa asyncio) acumula só as suas chamadas
+_etapa_atual: ContextVar[Optional[MedicaoEtapa]] = ContextVar('etapa_atual', default=None)
+
+# Medições concluídas da execução atual (ver medir_execucao)
+_execucao_atual: ContextVar[Optional[List[MedicaoEtapa]]] = ContextVar('execucao_atual', default=None)
+
+@contextmanager
+def medir_execucao():
+    """Coleta as medições das etapas executadas dentro do bloco, inclusive em threads que copiam o contexto."""
+    medicoes: List[MedicaoEtapa] = []
+    token = _execucao_atual.set(medicoes)
+    try:
+        yield medicoes
+    finally:
+        _execucao_atual.reset(token)
+
+def iniciar_etapa(etapa: str) -> MedicaoEtapa:
+    medicao = MedicaoEtapa(etapa)
+    _etapa_atual.set(medicao)
+    return medicao
+
+def concluir_etapa(medicao: MedicaoEtapa, resposta: Optional[dict]) -> None:
+    """Fecha a medição (resposta None: etapa com falha) e a registra nas métricas do processo e da execução."""
+    medicao.duracao_s = time.perf_counter() - medicao.inicio
+    medicao.status = 'ok' if resposta is not None else 'falha'
+    if resposta is not None:
+        medicao.elementos = {campo: len(valor) for campo, valor in resposta.items() if isinstance(valor, list)}
+
+    ETAPA_SEGUNDOS.observar(medicao.duracao_s, etapa=medicao.etapa, status=medicao.status)
+    if medicao.chamadas_llm:
+        ETAPA_LLM_SEGUNDOS.observar(medicao.llm_s, etapa=medicao.etapa)
+        ETAPA_TENTATIVAS.incrementar(medicao.chamadas_llm, etapa=medicao.etapa)
+    for campo, total in medicao.elementos.items():
+        ETAPA_ELEMENTOS.incrementar(total, etapa=medicao.etapa, campo=campo)
+
+    medicoes = _execucao_atual.get()
+    if medicoes is not None:
+        medicoes.append(medicao)
+
+def registrar_chamada_llm(
+    schema: str,
+    duracao_s: float,
+    prompt_caracteres: int,
+    resposta_caracteres: int,
+    tokens: Optional[int]
+) -> None:
+    LLM_SEGUNDOS.observar(duracao_s, schema=schema)
+    LLM_PROMPT_CARACTERES.observar(prompt_caracteres, schema=schema)
+    LLM_CARACTERES.incrementar(prompt_caracteres, schema=schema, direcao='prompt')
+    LLM_CARACTERES.incrementar(resposta_caracteres, schema=schema, direcao='resposta')
+    if tokens:
+        LLM_TOKENS.incrementar(tokens, schema=schema)
+
+    medicao = _etapa_atual.get()
+    if medicao is not None:
+        medicao.chamadas_llm += 1
+        medicao.llm_s += duracao_s
+        medicao.prompt_caracteres += prompt_caracteres
+        medicao.resposta_caracteres += resposta_caracteres
+        medicao.tokens += tokens or 0
+
+def registrar_falha_llm(schema: str, motivo: str) -> None:
+    LLM_FALHAS.incrementar(schema=schema, motivo=motivo)
+    medicao = _etapa_atual.get()
+    if medicao is not None:
+        medicao.falhas[motivo] = medicao.falhas.get(motivo, 0) + 1
+
+def registrar_reparo(schema: str, sucesso: bool) -> None:
+    LLM_REPAROS.incrementar(schema=schema, resultado='ok' if sucesso else 'falha')
+
+def registrar_acerto_cache(schema: str) -> None:
+    LLM_CACHE_ACERTOS.incrementar(schema=schema)
+    medicao = _etapa_atual.get()
+    if medicao is not None:
+        medicao.cache_acertos += 1
+
+def servir(porta: int, host: str = '0.0.0.0') -> None:
+    """Expõe /metrics numa thread daemon, para processos sem o Flask (e.g. worker.py)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            corpo = exportar().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass # Sem uma linha de log por coleta do Prometheus
+
+    servidor = ThreadingHTTPServer((host, porta), _Handler)
+    threading.Thread(target=servidor.serve_forever, name='metricas', daemon=True).start()
+    logger.info(f"Métricas expostas em http://{host}:{porta}/metrics")
@@ -164,7 +164,7 @@ class RedeContingencialOutput(BaseModel):
     hipoteses_analiticas: List[NoHipoteseAnalitica] = Field(default_factory=list)
     evidencias_para_hipoteses: List[ArestaEvidenciaParaHipotese] = Field(default_factory=list)
 
-    timeline:List[str] = Field(default_factory=str)
+    timeline:List[str] = Field(default_factory=list)
     # analise_metadados: Optional[Dict[str, Any]] = Field(None, description="Metadados sobre a análise, e.g., ID da análise, data, nome do analista (LLM).")
 
 # --- Pydantic Schemas para Saídas de Etapas Específicas ---
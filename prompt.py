@@ -194,4 +194,14 @@ FOCO_ETAPA_TIMELINE = (
     "A saída JSON DEVE ser um objeto com a chave principal 'timeline' contendo uma lista de strings (IDs dos nós)."
     "Inclua o campo `raciocinio` no objeto JSON de nível superior, descrevendo a lógica para a extração nesta etapa. "
     "Ao identificar elementos que já podem existir no `Contexto da rede atual`, reutilize seus IDs (`id`, `id`, etc.) em vez de criar novos, a menos que seja um elemento distinto."
-)
\ No newline at end of file
+)
+
+# Pedido de correção enviado por llm_inference._make_api_call quando só alguns elementos da resposta são inválidos
+PROMPT_REPARO = (
+    "Alguns elementos da sua resposta JSON anterior não passaram na validação do schema. "
+    "Corrija APENAS os elementos abaixo e retorne-os nos mesmos campos, mantendo os mesmos IDs e o restante do conteúdo. "
+    "Não inclua nenhum outro elemento. "
+    "Inclua o campo `raciocinio` no objeto JSON de nível superior, descrevendo as correções feitas.\n\n"
+    "Erros de validação:\n{erros}\n\n"
+    "Elementos a corrigir:\n```json\n{elementos}\n```"
+)
@@ -0,0 +1,128 @@
+# rate_limiter.py
+# Limite de taxa compartilhado por todas as chamadas ao Gemini no processo:
+# requisições/minuto, tokens/minuto e número máximo de chamadas simultâneas.
+from typing import Any, Optional
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+import config
+
+logger = logging.getLogger(__name__)
+
+class _TokenBucket:
+    """Balde que se reabastece continuamente até `por_minuto` unidades."""
+    def __init__(self, por_minuto: float):
+        self.capacidade = float(por_minuto)
+        self.disponivel = float(por_minuto)
+        self.taxa = por_minuto / 60.0
+        self.atualizado = time.monotonic()
+
+    def _reabastecer(self, agora: float) -> None:
+        self.disponivel = min(self.capacidade, self.disponivel + (agora - self.atualizado) * self.taxa)
+        self.atualizado = agora
+
+    def espera(self, n: float, agora: float) -> float:
+        """Segundos até haver `n` unidades disponíveis (0 se já houver)."""
+        self._reabastecer(agora)
+        n = min(n, self.capacidade) # Uma chamada maior que o balde inteiro espera apenas o balde encher
+        return 0.0 if self.disponivel >= n else (n - self.disponivel) / self.taxa
+
+class RateLimiter:
+    def __init__(self, rpm: Optional[int], tpm: Optional[int], max_concorrentes: int):
+        self._lock = threading.Lock()
+        self._requisicoes = _TokenBucket(rpm) if rpm else None
+        self._tokens = _TokenBucket(tpm) if tpm else None
+        self._max_concorrentes = max_concorrentes
+        self._em_andamento = 0
+        self._pausado_ate = 0.0
+
+    def _tentar_adquirir(self, tokens: int) -> float:
+        """Reserva uma vaga e retorna 0, ou retorna quantos segundos esperar antes de tentar de novo."""
+        with self._lock:
+            agora = time.monotonic()
+            espera = max(0.0, self._pausado_ate - agora)
+            if self._em_andamento >= self._max_concorrentes:
+                espera = max(espera, 0.05)
+            if self._requisicoes:
+                espera = max(espera, self._requisicoes.espera(1, agora))
+            if self._tokens:
+                espera = max(espera, self._tokens.espera(tokens, agora))
+            if espera > 0:
+                return espera
+
+            if self._requisicoes:
+                self._requisicoes.disponivel -= 1
+            if self._tokens:
+                self._tokens.disponivel -= min(tokens, self._tokens.capacidade)
+            self._em_andamento += 1
+            return 0.0
+
+    def adquirir(self, tokens: int = 0) -> None:
+        while (espera := self._tentar_adquirir(tokens)) > 0:
+            time.sleep(min(espera, 1.0))
+
+    async def adquirir_async(self, tokens: int = 0) -> None:
+        """Versão para asyncio: espera com asyncio.sleep, sem bloquear a thread do event loop."""
+        while (espera := self._tentar_adquirir(tokens)) > 0:
+            await asyncio.sleep(min(espera, 1.0))
+
+    def liberar(self, tokens_estimados: int = 0, tokens_reais: Optional[int] = None) -> None:
+        """Libera a vaga; se o uso real de tokens for conhecido, corrige a estimativa feita em adquirir()."""
+        with self._lock:
+            self._em_andamento -= 1
+            if self._tokens and tokens_reais is not None:
+                self._tokens.disponivel -= tokens_reais - tokens_estimados
+
+    def pausar(self, segundos: float) -> None:
+        """Suspende novas chamadas de todo o processo (e.g. após um 429), evitando rajadas de retries."""
+        with self._lock:
+            self._pausado_ate = max(self._pausado_ate, time.monotonic() + segundos)
+        logger.warning(f"Limite de taxa atingido; novas chamadas suspensas por {segundos:.1f}s.")
+
+def backoff(tentativa: int, retry_after: Optional[float] = None) -> float:
+    """
+    Tempo de espera antes da próxima tentativa: o retry-after informado pela API, se houver,
+    ou backoff exponencial com jitter completo (evita que chamadas concorrentes re-tentem juntas).
+    """
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 1)
+    teto = min(config.BACKOFF_MAX_SECONDS, config.BACKOFF_BASE_SECONDS * 2 ** tentativa)
+    return random.uniform(0, teto)
+
+def is_rate_limit_error(erro: Exception) -> bool:
+    return getattr(erro, 'code', None) == 429 or 'RESOURCE_EXHAUSTED' in str(erro)
+
+def _buscar_retry_delay(obj: Any) -> Optional[str]:
+    if isinstance(obj, dict):
+        if 'retryDelay' in obj:
+            return obj['retryDelay']
+        obj = list(obj.values())
+    if isinstance(obj, list):
+        for item in obj:
+            encontrado = _buscar_retry_delay(item)
+            if encontrado is not None:
+                return encontrado
+    return None
+
+def extrair_retry_after(erro: Exception) -> Optional[float]:
+    """Lê a dica de espera de um erro da API: RetryInfo.retryDelay (e.g. '17s') ou o header Retry-After."""
+    retry_delay = _buscar_retry_delay(getattr(erro, 'details', None))
+    if retry_delay is not None:
+        match = re.match(r'^\s*([\d.]+)\s*s?\s*$', str(retry_delay))
+        if match:
+            return float(match.group(1))
+
+    headers = getattr(getattr(erro, 'response', None), 'headers', None)
+    if headers is not None:
+        try:
+            valor = headers.get('retry-after')
+            if valor is not None:
+                return float(valor)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+limiter = RateLimiter(config.GEMINI_RPM, config.GEMINI_TPM, config.GEMINI_MAX_CONCORRENTES)
@@ -0,0 +1,258 @@
+# scheduler.py
+# Agendador das etapas de analysis.py: cada etapa declara os campos de RedeContingencialOutput
+# que lê e escreve, e etapas independentes são executadas em paralelo.
+from typing import Any, Dict, List, Callable, Iterable, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+import asyncio
+import functools
+import logging
+import time
+import config
+import metricas
+
+logger = logging.getLogger(__name__)
+
+def declarar_campos(
+    le: Iterable[str],
+    escreve: Iterable[str],
+    atualiza: Iterable[str] = ()
+) -> Callable:
+    """
+    Decorador que anota uma função de etapa com os campos da rede que ela usa.
+    - le: campos usados para montar o contexto da etapa.
+    - escreve: campos que a etapa produz.
+    - atualiza: campos de nós existentes que a etapa pode apenas refinar (e.g. 'estimulos_eventos_atualizados').
+      Essas atualizações opcionais não criam dependência entre etapas; são mescladas por ID e, quando duas etapas
+      da mesma onda refinam o mesmo nó, por atributo (ver GrafoRede.mesclar_alteracoes).
+    """
+    def decorator(etapa_func: Callable) -> Callable:
+        etapa_func.campos_lidos = frozenset(le)
+        etapa_func.campos_escritos = frozenset(escreve)
+        etapa_func.campos_atualizados = frozenset(atualiza)
+        return etapa_func
+    return decorator
+
+def _conflita(anterior: Callable, posterior: Callable) -> bool:
+    """True se `posterior` precisa ver o resultado de `anterior` (não podem rodar na mesma onda)."""
+    escritos_anterior = anterior.campos_escritos | anterior.campos_atualizados
+    return bool(
+        anterior.campos_escritos & posterior.campos_lidos
+        or escritos_anterior & posterior.campos_escritos
+        or anterior.campos_escritos & posterior.campos_atualizados
+    )
+
+def planejar_ondas(etapas: List[Callable]) -> List[List[Callable]]:
+    """
+    Agrupa as etapas em ondas de execução preservando a ordem declarada.
+    Uma onda é sempre um trecho contíguo da lista, então o resultado é equivalente à execução sequencial.
+    """
+    ondas: List[List[Callable]] = []
+    for etapa_func in etapas:
+        if ondas and not any(_conflita(anterior, etapa_func) for anterior in ondas[-1]):
+            ondas[-1].append(etapa_func)
+        else:
+            ondas.append([etapa_func])
+    return ondas
+
+# ContextVar em vez de threading.local: isola a resposta tanto por thread quanto por tarefa asyncio
+_resposta_bruta: ContextVar[Optional[dict]] = ContextVar('resposta_bruta', default=None)
+
+_resumo_etapa: ContextVar[Optional[str]] = ContextVar('resumo_etapa', default=None)
+
+_ao_elemento: ContextVar[Optional[Callable[[str, dict], None]]] = ContextVar('ao_elemento', default=None)
+
+_etapa_atual: ContextVar[Optional[Callable]] = ContextVar('etapa_atual', default=None)
+
+def registrar_resposta_bruta(json_data: Optional[dict]) -> None:
+    """Chamada por _processar_etapa com a resposta do modelo, para que o agendador possa gravá-la no checkpoint."""
+    _resposta_bruta.set(json_data)
+
+def registrar_resumo_etapa(resumo: Optional[str]) -> None:
+    """Resumo da etapa (e.g. 'Sujeitos atuais: 3', retornado por update_rede_func), repassado a ao_concluir_etapa."""
+    _resumo_etapa.set(resumo)
+
+def receptor_de_elementos() -> Optional[Callable[[str, dict], None]]:
+    """
+    Callback `(campo, elemento)` da etapa em execução, repassado por _processar_etapa ao modelo (ao_elemento de
+    _make_api_call), ou None se a execução não acompanha os elementos (ver ao_receber_elemento em executar_etapas).
+    """
+    return _ao_elemento.get()
+
+def etapa_em_execucao() -> Optional[Callable]:
+    """Função de etapa (com os campos de declarar_campos) executada no contexto atual, ou None fora do agendador."""
+    return _etapa_atual.get()
+
+def _iniciar_contexto_etapa(etapa_func: Callable, ao_receber_elemento: Optional[Callable]) -> None:
+    _etapa_atual.set(etapa_func)
+    _resposta_bruta.set(None)
+    _resumo_etapa.set(None)
+    _ao_elemento.set(functools.partial(ao_receber_elemento, etapa_func) if ao_receber_elemento else None)
+
+def _detalhes_etapa(inicio: float) -> Dict[str, Any]:
+    return {'duracao_s': time.perf_counter() - inicio, 'resumo': _resumo_etapa.get()}
+
+def _executar_etapa(
+    etapa_func: Callable,
+    texto_narrativo: str,
+    rede,
+    client_model,
+    kwargs_etapa: Dict[str, Any],
+    ao_receber_elemento: Optional[Callable] = None
+):
+    """
+    Executa uma etapa na thread atual. Retorna (rede, resposta bruta, detalhes {'duracao_s', 'resumo'});
+    resposta None indica falha.
+    """
+    logger.info(f"--- Iniciando processamento da Etapa: {etapa_func.__name__} ---")
+    _iniciar_contexto_etapa(etapa_func, ao_receber_elemento)
+    medicao = metricas.iniciar_etapa(etapa_func.__name__) # Acumula as chamadas ao modelo feitas nesta thread
+    inicio = time.perf_counter()
+    try:
+        rede = etapa_func(texto_narrativo, rede, client_model, **kwargs_etapa)
+    except Exception as e:
+        logger.error(f"Erro durante a execução da etapa {etapa_func.__name__}: {e}", exc_info=True)
+        metricas.concluir_etapa(medicao, None)
+        return None, None, _detalhes_etapa(inicio)
+    resposta = _resposta_bruta.get()
+    metricas.concluir_etapa(medicao, resposta)
+    return rede, resposta, _detalhes_etapa(inicio)
+
+async def _executar_etapa_async(
+    etapa_func: Callable,
+    texto_narrativo: str,
+    rede,
+    client_model,
+    kwargs_etapa: Dict[str, Any],
+    ao_receber_elemento: Optional[Callable] = None
+):
+    """Como _executar_etapa, aguardando a corrotina retornada pela etapa (cada tarefa tem seu próprio contexto)."""
+    logger.info(f"--- Iniciando processamento da Etapa: {etapa_func.__name__} ---")
+    _iniciar_contexto_etapa(etapa_func, ao_receber_elemento)
+    medicao = metricas.iniciar_etapa(etapa_func.__name__)
+    inicio = time.perf_counter()
+    try:
+        rede = await etapa_func(texto_narrativo, rede, client_model, **kwargs_etapa)
+    except Exception as e:
+        logger.error(f"Erro durante a execução da etapa {etapa_func.__name__}: {e}", exc_info=True)
+        metricas.concluir_etapa(medicao, None)
+        return None, None, _detalhes_etapa(inicio)
+    resposta = _resposta_bruta.get()
+    metricas.concluir_etapa(medicao, resposta)
+    return rede, resposta, _detalhes_etapa(inicio)
+
+def _mesclar_onda(rede, snapshot, resultados, falhas: List[str], ao_concluir_etapa: Optional[Callable]):
+    """Mescla na rede (grafo.GrafoRede), na ordem declarada, os resultados de uma onda executada sobre cópias de `snapshot`."""
+    for etapa_func, resultado, resposta, detalhes in resultados:
+        if resposta is None:
+            falhas.append(etapa_func.__name__)
+            continue
+        for campo in sorted(etapa_func.campos_escritos | etapa_func.campos_atualizados):
+            if campo == 'timeline':
+                rede.timeline = list(resultado.timeline) # Lista de IDs, sem mescla por ID
+                continue
+            rede.mesclar_alteracoes(campo, resultado, snapshot)
+        if ao_concluir_etapa:
+            ao_concluir_etapa(etapa_func, rede, resposta, detalhes)
+    return rede
+
+def executar_etapas(
+    etapas: List[Callable],
+    texto_narrativo: str,
+    rede,
+    client_model,
+    max_workers: int = config.MAX_ETAPAS_PARALELAS,
+    ao_concluir_etapa: Optional[Callable] = None,
+    kwargs_etapa: Optional[Dict[str, Any]] = None,
+    ao_receber_elemento: Optional[Callable] = None
+):
+    """
+    Executa as etapas onda a onda e mescla os resultados de forma determinística (na ordem declarada).
+    `ao_concluir_etapa(etapa_func, rede, resposta, detalhes)` é chamada após cada etapa bem-sucedida
+    (checkpoints e progresso; `detalhes` traz 'duracao_s' e 'resumo').
+    `ao_receber_elemento(etapa_func, campo, elemento)` recebe cada elemento validado de uma resposta em streaming
+    (config.LLM_STREAMING) antes de a etapa terminar; etapas de uma mesma onda a chamam de threads diferentes.
+    Se alguma etapa de uma onda falhar, as ondas seguintes não são executadas.
+    Retorna (rede, nomes das etapas que falharam).
+    """
+    kwargs_etapa = kwargs_etapa or {}
+    falhas: List[str] = []
+    for i, onda in enumerate(planejar_ondas(etapas)):
+        if falhas:
+            logger.warning(f"Etapas com falha ({', '.join(falhas)}); etapas seguintes não serão executadas.")
+            break
+        logger.info(f"Onda {i+1}: {', '.join(e.__name__ for e in onda)}")
+
+        if len(onda) == 1 or max_workers <= 1:
+            for etapa_func in onda:
+                resultado, resposta, detalhes = _executar_etapa(
+                    etapa_func, texto_narrativo, rede, client_model, kwargs_etapa, ao_receber_elemento
+                )
+                if resposta is None:
+                    falhas.append(etapa_func.__name__)
+                    continue
+                rede = resultado
+                if ao_concluir_etapa:
+                    ao_concluir_etapa(etapa_func, rede, resposta, detalhes)
+            continue
+
+        snapshot = rede.copiar()
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(onda))) as executor:
+            # Cada etapa roda numa cópia do contexto atual (e.g. a coleta de metricas.medir_execucao)
+            futures = [
+                executor.submit(
+                    copy_context().run, _executar_etapa,
+                    etapa_func, texto_narrativo, snapshot.copiar(), client_model, kwargs_etapa, ao_receber_elemento
+                )
+                for etapa_func in onda
+            ]
+            resultados: List[Tuple[Callable, object, Optional[dict], Dict[str, Any]]] = [
+                (etapa_func, *f.result()) for etapa_func, f in zip(onda, futures)
+            ]
+        rede = _mesclar_onda(rede, snapshot, resultados, falhas, ao_concluir_etapa)
+    return rede, falhas
+
+async def executar_etapas_async(
+    etapas: List[Callable],
+    texto_narrativo: str,
+    rede,
+    client_model,
+    ao_concluir_etapa: Optional[Callable] = None,
+    kwargs_etapa: Optional[Dict[str, Any]] = None,
+    ao_receber_elemento: Optional[Callable] = None
+):
+    """
+    Versão asyncio de executar_etapas: as etapas de uma onda rodam como tarefas no event loop atual.
+    As etapas devem retornar corrotinas (e.g. recebendo processar_etapa=_processar_etapa_async via `kwargs_etapa`).
+    A concorrência entre análises é limitada pelo rate_limiter, não por um pool de threads; só `ao_concluir_etapa`
+    (que grava o checkpoint) roda numa thread, para não bloquear o event loop.
+    """
+    kwargs_etapa = kwargs_etapa or {}
+    falhas: List[str] = []
+    for i, onda in enumerate(planejar_ondas(etapas)):
+        if falhas:
+            logger.warning(f"Etapas com falha ({', '.join(falhas)}); etapas seguintes não serão executadas.")
+            break
+        logger.info(f"Onda {i+1}: {', '.join(e.__name__ for e in onda)}")
+
+        if len(onda) == 1:
+            etapa_func = onda[0]
+            resultado, resposta, detalhes = await _executar_etapa_async(
+                etapa_func, texto_narrativo, rede, client_model, kwargs_etapa, ao_receber_elemento
+            )
+            if resposta is None:
+                falhas.append(etapa_func.__name__)
+                continue
+            rede = resultado
+            if ao_concluir_etapa:
+                await asyncio.to_thread(ao_concluir_etapa, etapa_func, rede, resposta, detalhes)
+            continue
+
+        snapshot = rede.copiar()
+        retornos = await asyncio.gather(*(
+            _executar_etapa_async(etapa_func, texto_narrativo, snapshot.copiar(), client_model, kwargs_etapa, ao_receber_elemento)
+            for etapa_func in onda
+        ))
+        resultados = [(etapa_func, *retorno) for etapa_func, retorno in zip(onda, retornos)]
+        rede = await asyncio.to_thread(_mesclar_onda, rede, snapshot, resultados, falhas, ao_concluir_etapa)
+    return rede, falhas
@@ -0,0 +1,83 @@
+// Progresso de uma análise em andamento (templates/job.html).
+// Recebe os eventos de /analise/eventos/<job_uuid> e desenha o grafo conforme as etapas terminam.
+// Variáveis definidas em job.html: eventsUrl, statusMessage, failedActions, pollJobStatus.
+document.addEventListener('DOMContentLoaded', function() {
+    if (typeof EventSource === 'undefined' || typeof vis === 'undefined') {
+        pollJobStatus();
+        return;
+    }
+
+    const progressBox = document.getElementById('jobProgress');
+    const progressStatus = document.getElementById('jobProgressStatus');
+    const progressSpinner = document.getElementById('jobProgressSpinner');
+    const stageList = document.getElementById('jobProgressStages');
+    const overlay = document.getElementById('loadingOverlay');
+
+    const nodes = new vis.DataSet([]);
+    const edges = new vis.DataSet([]);
+    const network = new vis.Network(document.getElementById('mynetwork'), { nodes: nodes, edges: edges }, {
+        nodes: { borderWidth: 2, size: 20, font: { size: 12, face: 'Inter, sans-serif', color: '#333333' }, widthConstraint: { maximum: 150 } },
+        edges: {
+            width: 1.5,
+            smooth: { enabled: true, type: "horizontal", roundness: 1 },
+            arrows: { to: { enabled: true, scaleFactor: 0.8, type: 'arrow' } },
+            font: { size: 10, face: 'Inter, sans-serif', align: 'horizontal', strokeWidth: 3, strokeColor: '#ffffff' },
+            color: { inherit: 'from' },
+            widthConstraint: { maximum: 150 }
+        },
+        physics: {
+            solver: 'barnesHut',
+            barnesHut: { gravitationalConstant: -5000, centralGravity: 0.20, springLength: 150, springConstant: 0.01, damping: 0.9, avoidOverlap: 0.5 },
+            stabilization: { iterations: 200, fit: true }
+        }
+    });
+
+    const source = new EventSource(eventsUrl);
+
+    // Elementos já recebidos das etapas em andamento (só com respostas em streaming)
+    const parciais = {};
+    function mostrarParciais() {
+        const texto = Object.entries(parciais).map(([etapa, elementos]) => `${etapa}: ${elementos}`).join(' | ');
+        progressStatus.innerText = 'Gerando Análise...' + (texto ? ' ' + texto : '');
+        statusMessage.innerText = 'Gerando Análise...' + (texto ? ' ' + texto : '');
+    }
+
+    source.addEventListener('parcial', function(event) {
+        const parcial = JSON.parse(event.data);
+        parciais[parcial.etapa] = Object.entries(parcial.elementos).map(([campo, total]) => `${total} ${campo}`).join(', ');
+        mostrarParciais();
+    });
+
+    source.addEventListener('etapa', function(event) {
+        const etapa = JSON.parse(event.data);
+        delete parciais[etapa.etapa];
+        mostrarParciais();
+        // Na primeira etapa concluída, troca o overlay pelo grafo parcial
+        overlay.classList.remove('visible');
+        progressBox.classList.remove('d-none');
+
+        nodes.update(etapa.nodes);
+        edges.update(etapa.edges);
+        network.fit();
+
+        const item = document.createElement('li');
+        const duracao = etapa.duracao_s != null ? ` (${etapa.duracao_s.toFixed(1)}s)` : '';
+        item.textContent = `${etapa.etapa}${duracao}${etapa.resumo ? ': ' + etapa.resumo : ''}`;
+        stageList.appendChild(item);
+    });
+
+    source.addEventListener('concluido', function(event) {
+        source.close();
+        progressStatus.innerText = 'Análise concluída. Abrindo...';
+        window.location.href = JSON.parse(event.data).view_url;
+    });
+
+    source.addEventListener('falha', function(event) {
+        source.close();
+        const erro = JSON.parse(event.data).error;
+        progressSpinner.classList.add('d-none');
+        overlay.classList.add('visible');
+        statusMessage.innerText = 'A análise falhou: ' + (erro || 'erro desconhecido');
+        failedActions.classList.remove('d-none');
+    });
+});
@@ -0,0 +1,107 @@
+# Testes da divisão em fragmentos e da reconciliação das redes parciais (fragmentos.py)
+import pytest
+from fragmentos import dividir_texto, ReconciliadorFragmentos
+from grafo import GrafoRede, MODELOS_POR_CAMPO
+
+def _paragrafos(n):
+    return "\n\n".join(
+        f"Parágrafo {i}. Na cena {i}, Ana pede o brinquedo. O irmão recusa! Ela grita? Sim, e a mãe intervém."
+        for i in range(n)
+    )
+
+def test_texto_curto_fica_inteiro():
+    assert dividir_texto("Um texto curto.", tamanho=100, sobreposicao=10) == ["Um texto curto."]
+
+@pytest.mark.parametrize("texto, tamanho, sobreposicao", [
+    (_paragrafos(40), 600, 120),
+    (_paragrafos(40), 250, 60),
+    (" ".join(f"palavra{i}" for i in range(400)), 300, 50), # Só espaços como fronteira
+    ("".join(chr(0x4E00 + i) for i in range(1000)), 128, 16), # Sem nenhuma fronteira
+], ids=["paragrafos", "frases", "espacos", "sem_fronteira"])
+def test_fragmentos_cobrem_o_texto_com_sobreposicao(texto, tamanho, sobreposicao):
+    fragmentos = dividir_texto(texto, tamanho=tamanho, sobreposicao=sobreposicao)
+
+    assert len(fragmentos) > 1
+    assert all(0 < len(f) <= tamanho for f in fragmentos)
+    inicio_anterior, fim_anterior = -1, 0
+    for fragmento in fragmentos: # Os textos não repetem trechos, então find() localiza cada fragmento
+        inicio = texto.find(fragmento, inicio_anterior + 1)
+        assert inicio_anterior < inicio <= fim_anterior # Avança sem deixar buracos
+        inicio_anterior, fim_anterior = inicio, inicio + len(fragmento)
+    assert texto.startswith(fragmentos[0]) and fim_anterior == len(texto)
+
+def test_fragmentos_terminam_em_paragrafos():
+    fragmentos = dividir_texto(_paragrafos(40), tamanho=600, sobreposicao=120)
+    assert all(f.endswith("\n\n") for f in fragmentos[:-1])
+
+def _rede(**campos):
+    rede = GrafoRede()
+    for campo, elementos in campos.items():
+        rede.inserir(campo, [MODELOS_POR_CAMPO[campo](raciocinio="r", **e) for e in elementos])
+    return rede
+
+def test_ids_repetidos_entre_fragmentos_sao_renumerados_e_duplicados_unidos():
+    # Os dois fragmentos numeram do zero (S1, AC1, E1, AR1...); AC2 do primeiro e AC1 do segundo são a mesma ação,
+    # vista na sobreposição, e S1 é a mesma pessoa nos dois
+    primeiro = _rede(
+        sujeitos=[{"id": "S1", "descricao": "Ana"}],
+        acoes_comportamentos=[{"id": "AC1", "descricao": "Ana pede o brinquedo"},
+                              {"id": "AC2", "descricao": "Ana grita com o irmão"}],
+        emissoes_comportamentais=[{"id": "AR1", "id_origem_no": "S1", "id_destino_no": "AC1"},
+                                  {"id": "AR2", "id_origem_no": "S1", "id_destino_no": "AC2"}],
+    )
+    segundo = _rede(
+        sujeitos=[{"id": "S1", "descricao": "ana"}, {"id": "S2", "descricao": "Mãe"}],
+        acoes_comportamentos=[{"id": "AC1", "descricao": "Ana grita com o irmão"},
+                              {"id": "AC2", "descricao": "Mãe tira o brinquedo"}],
+        emissoes_comportamentais=[{"id": "AR1", "id_origem_no": "S1", "id_destino_no": "AC1"},
+                                  {"id": "AR2", "id_origem_no": "S2", "id_destino_no": "AC2"}],
+    )
+
+    destino = GrafoRede()
+    reconciliador = ReconciliadorFragmentos(destino, similaridade_minima=0.6)
+    reconciliador.incorporar(primeiro)
+    reconciliador.incorporar(segundo)
+
+    assert [(s.id, s.descricao) for s in destino.lista('sujeitos')] == [("S1", "Ana"), ("S2", "Mãe")]
+    assert [(a.id, a.descricao) for a in destino.lista('acoes_comportamentos')] == [
+        ("AC1", "Ana pede o brinquedo"), ("AC2", "Ana grita com o irmão"), ("AC3", "Mãe tira o brinquedo"),
+    ]
+    # S1 -> AC2 aparece nos dois fragmentos e é mantida uma vez
+    assert [(e.id, e.id_origem_no, e.id_destino_no) for e in destino.lista('emissoes_comportamentais')] == [
+        ("AR1", "S1", "AC1"), ("AR2", "S1", "AC2"), ("AR3", "S2", "AC3"),
+    ]
+    assert reconciliador.duplicados == 3 # S1, AC1 do segundo fragmento e a aresta repetida
+
+def test_acoes_so_sao_unidas_com_o_fragmento_anterior():
+    fragmentos = [
+        _rede(acoes_comportamentos=[{"id": "AC1", "descricao": "Ana grita com o irmão"}]),
+        _rede(acoes_comportamentos=[{"id": "AC1", "descricao": "Mãe tira o brinquedo"}]),
+        _rede(acoes_comportamentos=[{"id": "AC1", "descricao": "Ana grita com o irmão"}]), # Novo episódio
+    ]
+    destino = GrafoRede()
+    reconciliador = ReconciliadorFragmentos(destino, similaridade_minima=0.6)
+    for fragmento in fragmentos:
+        reconciliador.incorporar(fragmento)
+
+    assert destino.ids('acoes_comportamentos') == ["AC1", "AC2", "AC3"]
+    assert reconciliador.duplicados == 0
+
+def test_numeracao_continua_a_da_rede_de_destino():
+    destino = _rede(sujeitos=[{"id": "S1", "descricao": "Ana"}, {"id": "S7", "descricao": "Avó"}])
+    reconciliador = ReconciliadorFragmentos(destino)
+    reconciliador.incorporar(_rede(sujeitos=[{"id": "S1", "descricao": "Pai"}, {"id": "S2", "descricao": "Avó"}]))
+
+    assert [(s.id, s.descricao) for s in destino.lista('sujeitos')] == [("S1", "Ana"), ("S7", "Avó"), ("S8", "Pai")]
+
+def test_aresta_para_no_inexistente_e_descartada():
+    fragmento = _rede(
+        sujeitos=[{"id": "S1", "descricao": "Ana"}],
+        emissoes_comportamentais=[{"id": "AR1", "id_origem_no": "S1", "id_destino_no": "AC9"}],
+    )
+    destino = GrafoRede()
+    reconciliador = ReconciliadorFragmentos(destino)
+    reconciliador.incorporar(fragmento)
+
+    assert destino.total('emissoes_comportamentais') == 0
+    assert reconciliador.arestas_descartadas == 1
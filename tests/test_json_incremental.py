@@ -0,0 +1,89 @@
+# Testes do parser incremental usado nas respostas em streaming (json_incremental.py)
+import json
+import random
+import pytest
+from json_incremental import ParserIncremental, ErroJSONIncremental
+
+DOCUMENTO = json.dumps({
+    "raciocinio": "Linha 1\nLinha \"2\" com acentuação, \\ barra e ção",
+    "acoes_comportamentos": [
+        {"id": "AC1", "descricao": "Grita", "classe_funcional_hipotetica": ["Busca de atenção"], "tipo_observabilidade": None},
+        {"id": "AC2", "descricao": "Chora {não é chave}", "classe_funcional_hipotetica": [], "tipo_observabilidade": "OBSERVAVEL"},
+    ],
+    "relacoes_funcionais_antecedentes": [
+        {"id": "RFA1", "prob_resposta_na_presenca": 0.75, "prob_resposta_na_ausencia": -1.5e-3, "ativo": True},
+        {"id": "RFA2", "prob_resposta_na_presenca": 1, "prob_resposta_na_ausencia": None, "ativo": False},
+    ],
+    "timeline": ["AC1", "AC2"],
+    "vazia": [],
+}, ensure_ascii=False, indent=2)
+
+def _em_pedacos(texto, rng):
+    pos = 0
+    while pos < len(texto):
+        tamanho = rng.randint(1, 12)
+        yield texto[pos:pos + tamanho]
+        pos += tamanho
+
+def _alimentar(texto, pedacos_rng=None, ao_elemento=None):
+    parser = ParserIncremental(ao_elemento=ao_elemento)
+    for pedaco in (_em_pedacos(texto, pedacos_rng) if pedacos_rng else [texto]):
+        parser.alimentar(pedaco)
+    return parser.finalizar()
+
+@pytest.mark.parametrize("semente", range(50))
+def test_divisoes_aleatorias_equivalem_a_json_loads(semente):
+    recebidos = []
+    texto = _alimentar(DOCUMENTO, random.Random(semente), lambda campo, elemento: recebidos.append((campo, elemento)))
+
+    esperado = json.loads(DOCUMENTO)
+    assert json.loads(texto) == esperado
+    assert recebidos == [
+        (campo, elemento) for campo, valor in esperado.items() if isinstance(valor, list) for elemento in valor
+    ]
+
+def test_um_caractere_por_vez():
+    parser = ParserIncremental()
+    for c in DOCUMENTO:
+        parser.alimentar(c)
+    assert json.loads(parser.finalizar()) == json.loads(DOCUMENTO)
+
+@pytest.mark.parametrize("antes, depois", [("```json\n", "\n```"), ("```\n", "\n```"), ("  ", "\n")])
+def test_cercas_de_markdown_e_espacos_sao_ignorados(antes, depois):
+    texto = _alimentar(antes + DOCUMENTO + depois, random.Random(0))
+    assert json.loads(texto) == json.loads(DOCUMENTO)
+
+@pytest.mark.parametrize("invalido", [
+    '{"a" 1}',
+    '{a: 1}',
+    '{"a": [1 2]}',
+    '{"a": 1,, "b": 2}',
+    '{"a": 1}}',
+    '{"a": 1} x',
+    '{"a": tru}',
+    '{"a": 01x}',
+    '{"a": "quebra\nde linha"}',
+    '{"a": @}',
+])
+def test_erros_de_estrutura_sao_detectados_ao_alimentar(invalido):
+    parser = ParserIncremental()
+    with pytest.raises(ErroJSONIncremental):
+        for c in invalido: # O erro aparece no pedaço que o contém, antes de finalizar()
+            parser.alimentar(c)
+    with pytest.raises(json.JSONDecodeError):
+        json.loads(invalido)
+
+@pytest.mark.parametrize("incompleto", ['', '{"a": [1, 2', '{"a": "sem fim', '```json\n{"a": 1'])
+def test_json_incompleto_falha_em_finalizar(incompleto):
+    parser = ParserIncremental()
+    parser.alimentar(incompleto)
+    with pytest.raises(ErroJSONIncremental):
+        parser.finalizar()
+
+def test_excecao_de_ao_elemento_interrompe_o_parse():
+    def recusar(campo, elemento):
+        raise RuntimeError(campo)
+
+    parser = ParserIncremental(ao_elemento=recusar)
+    with pytest.raises(RuntimeError, match="acoes_comportamentos"):
+        parser.alimentar(DOCUMENTO)
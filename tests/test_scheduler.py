@@ -0,0 +1,139 @@
+# Testes do agendador de etapas (scheduler.py): planejamento das ondas e mescla de etapas paralelas
+import asyncio
+import pytest
+from grafo import GrafoRede, MODELOS_POR_CAMPO
+from output_schemas import FuncaoAntecedente, FuncaoConsequente
+from scheduler import declarar_campos, planejar_ondas, executar_etapas, executar_etapas_async, registrar_resposta_bruta
+
+def _etapa(nome, alterar=None, le=(), escreve=(), atualiza=()):
+    """Etapa falsa: aplica `alterar(rede)` e registra uma resposta, como _processar_etapa faria."""
+    @declarar_campos(le=le, escreve=escreve, atualiza=atualiza)
+    def etapa(texto_narrativo, rede, client_model):
+        if alterar:
+            alterar(rede)
+        registrar_resposta_bruta({"etapa": nome})
+        return rede
+    etapa.__name__ = nome
+    return etapa
+
+def _substituir(rede, campo, elemento_id, **atributos):
+    rede.inserir(campo, [rede.obter(campo, elemento_id).model_copy(update=atributos)])
+
+def _inserir(rede, campo, **atributos):
+    rede.inserir(campo, [MODELOS_POR_CAMPO[campo](raciocinio="r", **atributos)])
+
+def _rede_inicial():
+    rede = GrafoRede()
+    _inserir(rede, 'acoes_comportamentos', id="AC1", descricao="Grita", classe_funcional_hipotetica=["Atenção"])
+    _inserir(rede, 'estimulos_eventos', id="E1", descricao="Mãe sai da sala")
+    return rede
+
+def _refinar_antecedentes(rede):
+    # Refina a descrição de E1 e acrescenta uma classe a AC1
+    _substituir(rede, 'estimulos_eventos', 'E1', descricao="Mãe sai da sala sem avisar")
+    acao = rede.obter('acoes_comportamentos', 'AC1')
+    _substituir(rede, 'acoes_comportamentos', 'AC1', classe_funcional_hipotetica=acao.classe_funcional_hipotetica + ["Fuga"])
+    _inserir(rede, 'relacoes_funcionais_antecedentes', id="RFA1", id_origem_no="E1", id_destino_no="AC1",
+             funcao_antecedente=list(FuncaoAntecedente)[0])
+
+def _refinar_consequentes(rede):
+    # Refina outro atributo de E1 e acrescenta outra classe a AC1
+    _substituir(rede, 'estimulos_eventos', 'E1', raciocinio="Consequência da ação")
+    acao = rede.obter('acoes_comportamentos', 'AC1')
+    _substituir(rede, 'acoes_comportamentos', 'AC1', classe_funcional_hipotetica=acao.classe_funcional_hipotetica + ["Tangível"])
+    _inserir(rede, 'relacoes_funcionais_consequentes', id="RFC1", id_origem_no="AC1", id_destino_no="E1",
+             funcao_consequente=list(FuncaoConsequente)[0])
+
+LE = ('estimulos_eventos', 'acoes_comportamentos')
+ATUALIZA = ('estimulos_eventos', 'acoes_comportamentos')
+
+def _etapas_que_refinam_os_mesmos_nos():
+    return [
+        _etapa('antecedentes', _refinar_antecedentes, le=LE, escreve=('relacoes_funcionais_antecedentes',), atualiza=ATUALIZA),
+        _etapa('consequentes', _refinar_consequentes, le=LE, escreve=('relacoes_funcionais_consequentes',), atualiza=ATUALIZA),
+    ]
+
+def test_planejar_ondas_agrupa_etapas_independentes_em_ordem():
+    sujeitos = _etapa('sujeitos', le=('sujeitos',), escreve=('sujeitos',))
+    acoes = _etapa('acoes', le=('sujeitos',), escreve=('acoes_comportamentos',))
+    eventos = _etapa('eventos', le=('acoes_comportamentos',), escreve=('estimulos_eventos',))
+    antecedentes, consequentes = _etapas_que_refinam_os_mesmos_nos()
+    hipoteses = _etapa('hipoteses', le=tuple(MODELOS_POR_CAMPO), escreve=('hipoteses_analiticas',))
+    condicoes = _etapa('condicoes', le=('sujeitos',), escreve=('condicoes_estados',))
+
+    ondas = planejar_ondas([sujeitos, acoes, eventos, antecedentes, consequentes, hipoteses, condicoes])
+
+    assert [[e.__name__ for e in onda] for onda in ondas] == [
+        ['sujeitos'], ['acoes'], ['eventos'], ['antecedentes', 'consequentes'], ['hipoteses', 'condicoes'],
+    ]
+
+def test_etapa_que_le_um_campo_atualizado_espera_a_onda_seguinte():
+    antecedentes, _ = _etapas_que_refinam_os_mesmos_nos()
+    leitora = _etapa('leitora', le=('estimulos_eventos',), escreve=('condicoes_estados',))
+    escritora = _etapa('escritora', escreve=('estimulos_eventos',))
+
+    assert len(planejar_ondas([antecedentes, leitora])) == 1 # Atualizações opcionais não criam dependência
+    assert len(planejar_ondas([antecedentes, escritora])) == 2
+
+def test_atualiza_sobreposto_na_mesma_onda_mantem_as_alteracoes_das_duas_etapas():
+    etapas = _etapas_que_refinam_os_mesmos_nos()
+    assert len(planejar_ondas(etapas)) == 1
+
+    concluidas = []
+    rede, falhas = executar_etapas(
+        etapas, "texto", _rede_inicial(), None, max_workers=2,
+        ao_concluir_etapa=lambda etapa_func, rede, resposta, detalhes: concluidas.append(etapa_func.__name__)
+    )
+
+    assert falhas == []
+    assert concluidas == ['antecedentes', 'consequentes']
+    estimulo = rede.obter('estimulos_eventos', 'E1')
+    assert (estimulo.descricao, estimulo.raciocinio) == ("Mãe sai da sala sem avisar", "Consequência da ação")
+    assert rede.obter('acoes_comportamentos', 'AC1').classe_funcional_hipotetica == ["Atenção", "Fuga", "Tangível"]
+    assert rede.ids('relacoes_funcionais_antecedentes') == ["RFA1"]
+    assert rede.ids('relacoes_funcionais_consequentes') == ["RFC1"]
+
+    # Mesmo resultado da execução sequencial, em que a segunda etapa vê as alterações da primeira
+    sequencial, _ = executar_etapas(_etapas_que_refinam_os_mesmos_nos(), "texto", _rede_inicial(), None, max_workers=1)
+    assert rede.para_dict() == sequencial.para_dict()
+
+def test_mesmo_atributo_alterado_nas_duas_etapas_fica_com_a_posterior():
+    etapas = [
+        _etapa(nome, lambda rede, nome=nome: _substituir(rede, 'estimulos_eventos', 'E1', descricao=nome),
+               le=LE, escreve=(f'relacoes_funcionais_{nome}',), atualiza=ATUALIZA)
+        for nome in ('antecedentes', 'consequentes')
+    ]
+    rede, falhas = executar_etapas(etapas, "texto", _rede_inicial(), None, max_workers=2)
+
+    assert falhas == []
+    assert rede.obter('estimulos_eventos', 'E1').descricao == "consequentes"
+
+def test_etapa_com_falha_nao_descarta_as_alteracoes_das_outras():
+    def falhar(rede):
+        raise RuntimeError("modelo indisponível")
+
+    antecedentes, _ = _etapas_que_refinam_os_mesmos_nos()
+    quebrada = _etapa('quebrada', falhar, le=LE, escreve=('relacoes_funcionais_consequentes',), atualiza=ATUALIZA)
+    depois = _etapa('depois', le=('relacoes_funcionais_consequentes',), escreve=('hipoteses_analiticas',))
+
+    rede, falhas = executar_etapas([antecedentes, quebrada, depois], "texto", _rede_inicial(), None, max_workers=2)
+
+    assert falhas == ['quebrada'] # 'depois' não roda
+    assert rede.obter('estimulos_eventos', 'E1').descricao == "Mãe sai da sala sem avisar"
+    assert rede.total('relacoes_funcionais_consequentes') == 0
+
+def test_versao_async_mescla_como_a_sincrona():
+    def assincrona(etapa_func):
+        @declarar_campos(etapa_func.campos_lidos, etapa_func.campos_escritos, etapa_func.campos_atualizados)
+        async def etapa(texto_narrativo, rede, client_model):
+            await asyncio.sleep(0)
+            return etapa_func(texto_narrativo, rede, client_model)
+        etapa.__name__ = etapa_func.__name__
+        return etapa
+
+    etapas = [assincrona(e) for e in _etapas_que_refinam_os_mesmos_nos()]
+    rede, falhas = asyncio.run(executar_etapas_async(etapas, "texto", _rede_inicial(), None))
+    sincrona, _ = executar_etapas(_etapas_que_refinam_os_mesmos_nos(), "texto", _rede_inicial(), None, max_workers=2)
+
+    assert falhas == []
+    assert rede.para_dict() == sincrona.para_dict()
@@ -0,0 +1,186 @@
+# tracing.py
+# Rastreamento opcional (config.TRACING_ENABLED) do caminho das requisições e das análises: spans aninhados para
+# as rotas do Flask, analisar, cada etapa, cada tentativa de chamada ao modelo, as mesclas da rede, as funções de
+# db.py e transformar_para_vis. Os spans são gravados localmente em JSON Lines ou no formato de trace do Chrome
+# (abra o arquivo em chrome://tracing ou https://ui.perfetto.dev). Também gera o relatório de ?profile=1 (app.py).
+from typing import Callable, Optional, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import atexit
+import cProfile
+import functools
+import inspect
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import config
+
+logger = logging.getLogger(__name__)
+
+FORMATO_JSONL = 'jsonl'
+FORMATO_CHROME = 'chrome'
+
+class Span:
+    """Um trecho cronometrado. Spans iniciados enquanto este é o atual (mesma thread ou tarefa) são seus filhos."""
+    __slots__ = ('nome', 'trace_id', 'span_id', 'parent_id', 'atributos', 'inicio', '_inicio_perf', '_token')
+
+    def __init__(self, nome: str, pai: Optional['Span'], atributos: dict):
+        self.nome = nome
+        self.trace_id = pai.trace_id if pai else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = pai.span_id if pai else None
+        self.atributos = atributos
+        self.inicio = time.time()
+        self._inicio_perf = time.perf_counter()
+        self._token = None
+
+    def definir(self, **atributos) -> None:
+        self.atributos.update(atributos)
+
+    def encerrar(self, erro: Optional[BaseException] = None) -> None:
+        duracao = time.perf_counter() - self._inicio_perf
+        if erro is not None:
+            self.atributos['erro'] = f"{type(erro).__name__}: {erro}"
+        if self._token is not None:
+            try:
+                _span_atual.reset(self._token)
+            except ValueError:
+                pass # Encerrado em outro contexto (e.g. depois de uma resposta em streaming)
+            self._token = None
+        _exportador.gravar(self, duracao)
+
+# ContextVar: o span atual é isolado por thread e por tarefa asyncio (as threads do scheduler copiam o contexto)
+_span_atual: ContextVar[Optional[Span]] = ContextVar('span_atual', default=None)
+
+def iniciar_span(nome: str, atual: bool = True, **atributos) -> Optional[Span]:
+    """
+    Inicia um span filho do span atual (None com o rastreamento desativado); encerre com span.encerrar().
+    atual=False cria um span folha, que não vira o pai dos seguintes e pode ser encerrado em outro contexto
+    (e.g. o empréstimo de uma conexão em db.py).
+    """
+    if not config.TRACING_ENABLED:
+        return None
+    span_novo = Span(nome, _span_atual.get(), atributos)
+    if atual:
+        span_novo._token = _span_atual.set(span_novo)
+    return span_novo
+
+def anotar(**atributos) -> None:
+    """Acrescenta atributos ao span atual, se houver (e.g. o schema de uma chamada ao modelo)."""
+    span_atual = _span_atual.get()
+    if span_atual is not None:
+        span_atual.definir(**atributos)
+
+@contextmanager
+def span(nome: str, **atributos):
+    span_novo = iniciar_span(nome, **atributos)
+    if span_novo is None:
+        yield None
+        return
+    try:
+        yield span_novo
+    except BaseException as e:
+        span_novo.encerrar(e)
+        raise
+    span_novo.encerrar()
+
+def rastrear(nome: Optional[str] = None, argumentos: Sequence[str] = ()) -> Callable:
+    """
+    Decorador que envolve cada chamada da função (ou corrotina) num span.
+    `argumentos`: parâmetros da função gravados como atributos do span (e.g. ('campo',)).
+    """
+    def decorator(func: Callable) -> Callable:
+        nome_span = nome or func.__qualname__
+        assinatura = inspect.signature(func) if argumentos else None
+
+        def atributos(args, kwargs) -> dict:
+            if assinatura is None:
+                return {}
+            valores = assinatura.bind_partial(*args, **kwargs).arguments
+            return {arg: valores[arg] for arg in argumentos if arg in valores}
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper_async(*args, **kwargs):
+                if not config.TRACING_ENABLED:
+                    return await func(*args, **kwargs)
+                with span(nome_span, **atributos(args, kwargs)):
+                    return await func(*args, **kwargs)
+            return wrapper_async
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not config.TRACING_ENABLED:
+                return func(*args, **kwargs)
+            with span(nome_span, **atributos(args, kwargs)):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class _Exportador:
+    """Grava cada span encerrado em config.TRACING_ARQUIVO, no formato config.TRACING_FORMATO."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._arquivo = None
+        self._chave = None
+
+    def _abrir(self):
+        chave = (config.TRACING_ARQUIVO, config.TRACING_FORMATO, os.getpid())
+        if self._arquivo is None or self._chave != chave:
+            self.fechar()
+            caminho, formato, _ = chave
+            novo = not os.path.exists(caminho) or os.path.getsize(caminho) == 0
+            self._arquivo = open(caminho, 'a', encoding='utf-8')
+            self._chave = chave
+            if novo and formato == FORMATO_CHROME:
+                # O formato do Chrome aceita o array sem o ']' final, então vários processos podem só acrescentar eventos
+                self._arquivo.write('[\n')
+        return self._arquivo
+
+    def gravar(self, span_encerrado: Span, duracao: float) -> None:
+        if config.TRACING_FORMATO == FORMATO_CHROME:
+            registro = {
+                'name': span_encerrado.nome, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                'ts': int(span_encerrado.inicio * 1e6), 'dur': int(duracao * 1e6),
+                'args': {
+                    **span_encerrado.atributos, 'trace_id': span_encerrado.trace_id,
+                    'span_id': span_encerrado.span_id, 'parent_id': span_encerrado.parent_id
+                }
+            }
+            linha = json.dumps(registro, ensure_ascii=False, default=str) + ',\n'
+        else:
+            registro = {
+                'trace_id': span_encerrado.trace_id, 'span_id': span_encerrado.span_id,
+                'parent_id': span_encerrado.parent_id, 'nome': span_encerrado.nome,
+                'inicio': span_encerrado.inicio, 'duracao_ms': round(duracao * 1000, 3),
+                'pid': os.getpid(), 'thread': threading.current_thread().name,
+                'atributos': span_encerrado.atributos
+            }
+            linha = json.dumps(registro, ensure_ascii=False, default=str) + '\n'
+        try:
+            with self._lock:
+                arquivo = self._abrir()
+                arquivo.write(linha)
+                arquivo.flush()
+        except OSError as e:
+            logger.error(f"Falha ao gravar o span {span_encerrado.nome} em {config.TRACING_ARQUIVO}: {e}")
+
+    def fechar(self) -> None:
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+_exportador = _Exportador()
+atexit.register(_exportador.fechar)
+
+def relatorio_profile(profiler: cProfile.Profile, limite: int = config.PROFILE_LINHAS) -> str:
+    """Relatório em texto do cProfile (funções ordenadas por tempo acumulado), como o retornado por ?profile=1."""
+    saida = io.StringIO()
+    estatisticas = pstats.Stats(profiler, stream=saida)
+    estatisticas.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limite)
+    return saida.getvalue()
@@ -1,58 +1,28 @@
-from typing import List, Optional, Dict, Any, Type
-from pydantic import BaseModel, ValidationError # Added ValidationError
+from typing import Dict, Any
+import json
 import logging
+import metricas
+import tracing
 
 logger = logging.getLogger(__name__)
 
-def _get_id(element: BaseModel) -> Optional[str]:
-    """Retorna o valor do campo ID do elemento Pydantic, se existir."""
-    for field_name in ["id_sujeito", "id_acao", "id_estimulo_evento", "id_condicao_estado", "id_hipotese", "id"]:
-        if hasattr(element, field_name):
-            return getattr(element, field_name)
-    return None
-
-def _merge_element_list(
-    existing_elements: List[BaseModel],
-    new_elements_data: Optional[List[Dict[str, Any]]],
-    element_model: Type[BaseModel]
-) -> List[BaseModel]:
-    """
-    Mescla uma lista de novos elementos (como dicts da API) em uma lista existente de elementos Pydantic.
-    Atualiza elementos existentes pelo ID ou adiciona novos.
-    """
-    if new_elements_data is None:
-        return existing_elements
-
-    updated_elements = list(existing_elements) # Trabalha com uma cópia
-    existing_ids_map = { _get_id(el): i for i, el in enumerate(updated_elements) if _get_id(el) is not None}
-
-    for data in new_elements_data:
-        try:
-            new_element = element_model(**data)
-            element_id = _get_id(new_element)
-
-            if element_id is not None and element_id in existing_ids_map:
-                # Atualiza o elemento existente
-                index = existing_ids_map[element_id]
-                updated_elements[index] = new_element
-                logger.debug(f"Elemento '{element_id}' ({element_model.__name__}) atualizado.")
-            elif element_id is not None:
-                # Adiciona novo elemento se o ID não existir (ou se não tiver ID, apenas adiciona)
-                updated_elements.append(new_element)
-                existing_ids_map[element_id] = len(updated_elements) -1 # Atualiza o mapa
-                logger.debug(f"Elemento '{element_id}' ({element_model.__name__}) adicionado.")
-            else: # Elemento sem ID, apenas adiciona (menos comum para nós principais)
-                updated_elements.append(new_element)
-                logger.debug(f"Elemento sem ID ({element_model.__name__}) adicionado.")
-        except ValidationError as e:
-            logger.warning(f"Erro de validação ao processar {element_model.__name__} com dados {data}: {e}")
-        except Exception as e:
-            logger.error(f"Erro inesperado ao mesclar {element_model.__name__} com dados {data}: {e}")
-
-
-    return updated_elements
+# Versão do formato gerado por transformar_para_vis. Incremente ao alterar a transformação:
+# os payloads gravados em analysis_vis (db.py) com versão diferente são recalculados na próxima leitura.
+VIS_VERSION = 1
 
+def montar_payload_vis(json_data: dict) -> Dict[str, Any]:
+    """Payload da visualização com nodes, edges e timeline já serializados, pronto para os templates."""
+    nodes, edges = transformar_para_vis(json_data)
+    return {
+        "vis_version": VIS_VERSION,
+        "nodes_data": json.dumps(nodes),
+        "edges_data": json.dumps(edges),
+        "timeline_data": json.dumps(json_data.get('timeline', [])),
+        "texto_original": json_data.get('texto_original', ''),
+    }
 
+@tracing.rastrear()
+@metricas.cronometrar(metricas.VIS_SEGUNDOS)
 def transformar_para_vis(json_data: dict):
     """
     Transforma o JSON da análise em um formato compatível com Vis.js (nodes e edges).
@@ -311,3 +281,15 @@ def transformar_para_vis(json_data: dict):
     filtered_nodes = [node for node in nodes if node["id"] in connected_node_ids]
         
     return filtered_nodes, edges
+
+def diferenca_vis(json_data: dict, anteriores: tuple) -> tuple:
+    """
+    Nodes e edges de transformar_para_vis(json_data) novos ou alterados em relação a `anteriores`
+    (o retorno da chamada anterior, ou ({}, {})). Retorna (nodes, edges, atuais indexados por id).
+    """
+    nodes, edges = transformar_para_vis(json_data)
+    nodes_atuais, edges_atuais = {n['id']: n for n in nodes}, {e['id']: e for e in edges}
+    nodes_anteriores, edges_anteriores = anteriores
+    novos_nodes = [n for i, n in nodes_atuais.items() if nodes_anteriores.get(i) != n]
+    novas_edges = [e for i, e in edges_atuais.items() if edges_anteriores.get(i) != e]
+    return novos_nodes, novas_edges, (nodes_atuais, edges_atuais)
@@ -0,0 +1,121 @@
+# worker.py
+# Processo separado que consome a fila de análises (tabela `jobs` em db.py).
+# Uso: python -m worker [--once] [--debug] [--metrics-port PORTA]
+import json
+import time
+import sqlite3
+import datetime
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Optional
+import config
+import metricas
+from analysis import analisar
+from db import init_db, insert_analysis, claim_next_job, complete_job, fail_job, heartbeat_job, requeue_stale_jobs
+
+logger = logging.getLogger(__name__)
+
+@contextmanager
+def _batimentos(job):
+    """
+    Renova jobs.updated_at a cada config.WORKER_HEARTBEAT_SECONDS enquanto o bloco executa,
+    para que requeue_stale_jobs só devolva à fila jobs cujo worker realmente parou.
+    """
+    job_uuid = job['job_uuid']
+    tentativa = job['attempts'] + 1 # claim_next_job já incrementou attempts no banco
+    parar = threading.Event()
+
+    def _bater():
+        while not parar.wait(config.WORKER_HEARTBEAT_SECONDS):
+            try:
+                if not heartbeat_job(job_uuid, tentativa):
+                    logger.warning(f"Job {job_uuid} não está mais na tentativa {tentativa}; o heartbeat foi interrompido.")
+                    return
+            except sqlite3.Error as e:
+                logger.warning(f"Falha no heartbeat do job {job_uuid}: {e}")
+
+    thread = threading.Thread(target=_bater, name=f"heartbeat-{job_uuid}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        parar.set()
+        thread.join()
+
+def processar_job(job, debug: bool = False) -> None:
+    """Executa o pipeline de analysis.py para um job e grava o resultado via insert_analysis."""
+    job_uuid = job['job_uuid']
+    texto_entrada = job['texto_entrada']
+    logger.info(f"Processando job {job_uuid} (tentativa {job['attempts'] + 1})")
+
+    try:
+        # O job_uuid é usado como ID da execução: um job devolvido à fila retoma do último checkpoint
+        with _batimentos(job):
+            json_analisado_dict = analisar(texto_entrada, debug=debug, run_uuid=job_uuid)
+    except Exception as e:
+        logger.error(f"Erro inesperado na análise do job {job_uuid}: {e}", exc_info=True)
+        fail_job(job_uuid, str(e))
+        return
+
+    if not json_analisado_dict:
+        fail_job(job_uuid, "A análise falhou ou não retornou dados válidos. As etapas concluídas foram salvas; tente novamente para retomar.")
+        return
+
+    # Add original text to the analysis dictionary before saving
+    json_analisado_dict['texto_original'] = texto_entrada
+    analysis_name = f"Análise de {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+
+    try:
+        analysis_uuid = insert_analysis(
+            name=analysis_name,
+            analysis_data=json.dumps(json_analisado_dict)
+        )
+    except Exception as e:
+        logger.error(f"Erro ao salvar a análise do job {job_uuid}: {e}", exc_info=True)
+        fail_job(job_uuid, f"Erro ao salvar a análise: {e}")
+        return
+
+    complete_job(job_uuid, analysis_uuid)
+    logger.info(f"Job {job_uuid} concluído. Análise: {analysis_uuid}")
+
+def _devolver_jobs_abandonados() -> None:
+    requeued = requeue_stale_jobs(config.WORKER_STALE_JOB_SECONDS)
+    if requeued:
+        logger.info(f"{requeued} job(s) abandonado(s) devolvido(s) à fila.")
+
+def run(once: bool = False, debug: bool = False, metrics_port: Optional[int] = None) -> None:
+    init_db()
+    if metrics_port:
+        metricas.servir(metrics_port) # As etapas rodam neste processo, não no web
+
+    logger.info("Worker iniciado. Aguardando jobs...")
+    ultima_busca_abandonados = None
+    while True:
+        # Periódico, não só na partida: um worker que morre é recuperado pelos que continuam rodando
+        agora = time.monotonic()
+        if ultima_busca_abandonados is None or agora - ultima_busca_abandonados >= config.WORKER_REQUEUE_INTERVAL:
+            _devolver_jobs_abandonados()
+            ultima_busca_abandonados = agora
+
+        job = claim_next_job()
+        if job is None:
+            if once:
+                return
+            time.sleep(config.WORKER_POLL_INTERVAL)
+            continue
+        processar_job(job, debug=debug)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Consome a fila de análises e executa o pipeline de analysis.py.")
+    parser.add_argument("--once", action="store_true", help="Processa os jobs pendentes e sai quando a fila esvaziar.")
+    parser.add_argument("--debug", action="store_true", help="Ativa o logging de debug.")
+    parser.add_argument("--metrics-port", type=int, default=config.METRICAS_PORTA_WORKER,
+                        help="Expõe as métricas do worker em http://0.0.0.0:PORTA/metrics.")
+    args = parser.parse_args()
+
+    try:
+        run(once=args.once, debug=args.debug, metrics_port=args.metrics_port)
+    except KeyboardInterrupt:
+        logger.info("Worker encerrado.")